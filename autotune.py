@@ -0,0 +1,210 @@
+# autotune.py
+import json
+import os
+import resource
+import sys
+import time
+from collections import Counter
+import numpy as np
+import torch
+from torch.utils.data import BatchSampler, DataLoader, RandomSampler
+from dataset import CostBalancedBatchSampler, batch_to_tensor, collate_puzzle_batch
+
+# Batch layouts; cost balancing pays off once some types cost this many times more than others
+COST_SPREAD_FOR_BALANCING = 4
+# A probe with more workers must beat the best so far by this fraction to keep going
+MIN_WORKER_GAIN = 0.05
+
+def mixture(dataset):
+    """The number of samples of each puzzle type in the dataset."""
+    return dict(Counter(puzzle_type for puzzle_type, _ in dataset.puzzle_manifest))
+
+def measure_type_costs(dataset, batch_size, repeats=2):
+    """
+    Times each puzzle type of the mixture in this process, as dataset.__getitems__ renders it.
+    Returns ({puzzle_type: ms per sample}, ms per sample to convert a batch to tensors).
+    """
+    type_indices = {}
+    for idx, (puzzle_type, _) in enumerate(dataset.puzzle_manifest):
+        type_indices.setdefault(puzzle_type, []).append(idx)
+    shape = (batch_size, dataset.img_size, dataset.img_size, 3)
+    inputs, targets = np.empty(shape, dtype=np.uint8), np.empty(shape, dtype=np.uint8)
+
+    costs = {}
+    for puzzle_type, indices in type_indices.items():
+        indices = indices[:batch_size]
+        n = len(indices)
+        dataset.render_batch(indices, inputs[:n], targets[:n]) # Warm up caches
+        start = time.perf_counter()
+        for _ in range(repeats):
+            dataset.render_batch(indices, inputs[:n], targets[:n])
+        costs[puzzle_type] = (time.perf_counter() - start) * 1000 / (repeats * n)
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        batch_to_tensor(inputs)
+        batch_to_tensor(targets)
+    convert_ms = (time.perf_counter() - start) * 1000 / (repeats * batch_size)
+    return costs, convert_ms
+
+def _batch_sampler(dataset, batch_size, layout, type_costs):
+    if layout == 'cost_balanced':
+        return CostBalancedBatchSampler(dataset, batch_size, costs=type_costs)
+    return BatchSampler(RandomSampler(dataset), batch_size, drop_last=False)
+
+def build_loader(dataset, config):
+    """A DataLoader over dataset with the settings chosen by autotune()."""
+    sampler = _batch_sampler(dataset, config['batch_size'], config['batch_sampler'], config['measured']['type_ms'])
+    kwargs = {'num_workers': config['num_workers'], 'pin_memory': config['pin_memory']}
+    if config['num_workers'] > 0:
+        kwargs['prefetch_factor'] = config['prefetch_factor']
+    return DataLoader(dataset, batch_sampler=sampler, collate_fn=collate_puzzle_batch, **kwargs)
+
+def probe(dataset, batch_size, num_workers, prefetch_factor, layout, type_costs, num_batches):
+    """Samples per second of a short DataLoader run, not counting each worker's first batch (startup)."""
+    warmup = max(1, num_workers)
+    batches = []
+    for batch in _batch_sampler(dataset, batch_size, layout, type_costs):
+        batches.append(batch)
+        if len(batches) == warmup + num_batches:
+            break
+    kwargs = {'prefetch_factor': prefetch_factor} if num_workers > 0 else {}
+    loader = DataLoader(dataset, batch_sampler=batches, num_workers=num_workers, collate_fn=collate_puzzle_batch, **kwargs)
+    samples = 0
+    start = None
+    for i, (_, _, descriptions) in enumerate(loader):
+        if i == warmup - 1:
+            start = time.perf_counter()
+        elif i >= warmup:
+            samples += len(descriptions)
+    if start is None or not samples: # The loader yielded no batches past the warmup
+        return 0.0
+    return samples / (time.perf_counter() - start)
+
+def _worker_rss_mb():
+    """The peak RSS of any finished child process so far (Linux reports KB, macOS bytes)."""
+    maxrss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return maxrss / (1024 * 1024) if sys.platform == 'darwin' else maxrss / 1024
+
+def autotune(dataset, batch_size, target_rate=None, max_workers=None, memory_budget_mb=None,
+             probe_batches=8, config_path=None, log=print):
+    """
+    Picks DataLoader settings for the dataset's mixture from short probes.
+
+    Measures each type's render cost and the conversion cost in-process,
+    then probes loading in-process and with 1, 2, 4, ... workers (up to
+    max_workers, default the CPU count, and as many as fit in
+    memory_budget_mb) until target_rate samples per second is reached or more
+    workers stop helping. One worker only pays IPC on top of rendering, so it
+    is not expected to beat in-process loading; from 2 workers up, each count
+    must beat the best worker count so far, and in-process loading is only
+    chosen if no worker count beats it. The IPC overhead is what one worker
+    costs per sample beyond rendering in-process. Mixtures
+    whose types differ a lot in cost get a CostBalancedBatchSampler and a
+    deeper prefetch queue.
+
+    Returns the configuration as a dict for build_loader(). With config_path,
+    a saved configuration for the same mixture, image size and batch size is
+    reused, and a newly tuned one is saved there.
+    """
+    if config_path and os.path.exists(config_path):
+        config = load_config(config_path, dataset, batch_size)
+        if config is not None:
+            log(f"Using the saved loader configuration in {config_path}")
+            return config
+
+    # --- 1. Per-type and conversion costs, in this process ---
+    counts = mixture(dataset)
+    type_ms, convert_ms = measure_type_costs(dataset, batch_size)
+    total = sum(counts.values())
+    serial_ms = sum(type_ms[t] * n for t, n in counts.items()) / total + convert_ms
+    for puzzle_type, ms in sorted(type_ms.items(), key=lambda item: -item[1]):
+        log(f"{puzzle_type:<28}{ms:8.2f} ms/sample")
+    log(f"{'(to tensor)':<28}{convert_ms:8.2f} ms/sample")
+
+    # --- 2. Batch layout and prefetch depth ---
+    spread = max(type_ms.values()) / max(min(type_ms.values()), 1e-6)
+    layout = 'cost_balanced' if spread >= COST_SPREAD_FOR_BALANCING else 'random'
+    prefetch_factor = 4 if layout == 'cost_balanced' else 2
+    batch_mb = 2 * batch_size * 3 * dataset.img_size ** 2 * 4 / 2**20 # float32 inputs and targets
+
+    # --- 3. Probe worker counts ---
+    max_workers = max_workers or os.cpu_count() or 1
+    candidates = sorted({w for w in [2 ** i for i in range(max_workers.bit_length())] + [max_workers] if w <= max_workers})
+    rates = {0: probe(dataset, batch_size, 0, prefetch_factor, layout, type_ms, probe_batches)}
+    log(f"{0:>3} workers: {rates[0]:8.1f} samples/s")
+    ipc_ms = None
+    worker_rss = 0.0
+    best_workers = None # The best worker count probed so far
+    for num_workers in candidates:
+        if target_rate and max(rates.values()) >= target_rate:
+            break
+        if memory_budget_mb and num_workers * (worker_rss + prefetch_factor * batch_mb) > memory_budget_mb:
+            log(f"{num_workers} workers would exceed the {memory_budget_mb} MB budget")
+            break
+        rates[num_workers] = probe(dataset, batch_size, num_workers, prefetch_factor, layout, type_ms, probe_batches)
+        worker_rss = max(worker_rss, _worker_rss_mb())
+        log(f"{num_workers:>3} workers: {rates[num_workers]:8.1f} samples/s")
+        if num_workers == 1 and rates[1]:
+            ipc_ms = max(0.0, 1000 / rates[1] - serial_ms)
+        if best_workers is not None and rates[num_workers] < rates[best_workers] * (1 + MIN_WORKER_GAIN):
+            break
+        best_workers = num_workers
+    # In-process loading is the floor
+    best = best_workers if best_workers is not None and rates[best_workers] > rates[0] else 0
+    # With a target, the fewest workers that reach it
+    if target_rate:
+        reaching = [w for w, rate in rates.items() if rate >= target_rate]
+        if reaching:
+            best = min(reaching)
+
+    config = {
+        'batch_size': batch_size,
+        'num_workers': best,
+        'prefetch_factor': prefetch_factor,
+        'pin_memory': torch.cuda.is_available(),
+        'batch_sampler': layout,
+        'expected_rate': rates[best],
+        'target_rate': target_rate,
+        'img_size': dataset.img_size,
+        'mixture': counts,
+        'measured': {
+            'type_ms': type_ms,
+            'convert_ms': convert_ms,
+            'ipc_ms': ipc_ms,
+            'worker_rss_mb': worker_rss,
+            'rates': {str(w): rate for w, rate in rates.items()},
+        },
+    }
+    if target_rate and rates[best] < target_rate:
+        log(f"Target of {target_rate} samples/s not reached; best is {rates[best]:.1f} with {best} workers")
+    if config_path:
+        save_config(config, config_path)
+    return config
+
+def save_config(config, path):
+    with open(path, 'w') as f:
+        json.dump(config, f, indent=2)
+
+def load_config(path, dataset, batch_size):
+    """The configuration saved at path, or None if it was tuned for another mixture, image size or batch size."""
+    with open(path) as f:
+        config = json.load(f)
+    if (config['mixture'], config['img_size'], config['batch_size']) != (mixture(dataset), dataset.img_size, batch_size):
+        return None
+    return config
+
+def main(args):
+    """Runs the `autotune` command."""
+    from benchmark_loaders import PUZZLE_COUNTS
+    from dataset import InterleavedPuzzleDataset
+    counts = dict((item.split('=')[0], int(item.split('=')[1])) for item in args.counts) if args.counts else PUZZLE_COUNTS
+    dataset = InterleavedPuzzleDataset(counts, img_size=args.img_size)
+    config = autotune(dataset, args.batch_size, args.target, args.max_workers, args.memory_mb,
+                      args.probe_batches, args.config)
+    print(f"\nnum_workers={config['num_workers']} prefetch_factor={config['prefetch_factor']} "
+          f"pin_memory={config['pin_memory']} batch_sampler={config['batch_sampler']} "
+          f"(~{config['expected_rate']:.1f} samples/s)")
+    if args.config:
+        print(f"Configuration in {args.config}; load it with autotune.load_config() and build_loader().")
+    return 0
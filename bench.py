@@ -0,0 +1,190 @@
+# bench.py
+import json
+import os
+import platform
+import resource
+import sys
+import time
+import tracemalloc
+import numpy as np
+import PIL
+import torch
+from benchmark_loaders import run as run_loader
+from dataset import InterleavedPuzzleDataset
+
+# Generators that need external data; they are only benchmarked when asked for by name
+NEEDS_DATA = {'sudoku'}
+
+def _reset_peak_rss():
+    """Resets the peak RSS counter (Linux only). Returns False when peak RSS cannot be reset."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+def _peak_rss_mb():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss is in KB on Linux and bytes on macOS, and never resets
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / (1024 * 1024) if sys.platform == 'darwin' else maxrss / 1024
+
+def bench_generator(generator, num_samples, warmup, batch_size):
+    """
+    Times generate() one sample at a time, then generate_batch().
+
+    Memory is measured in a separate, shorter pass because tracing slows
+    rendering down. tracemalloc cannot count the allocations a call makes,
+    only the bytes alive at its peak, so peak_traced_kb_per_sample (the
+    peak of Python and NumPy memory during one generate()) stands in for
+    an allocation count.
+    """
+    for _ in range(warmup):
+        try:
+            generator.generate()
+        except Exception:
+            pass
+
+    # --- 1. Latency and throughput of single samples ---
+    peak_reset = _reset_peak_rss()
+    latencies = []
+    errors = 0
+    for _ in range(num_samples):
+        start = time.perf_counter()
+        try:
+            generator.generate()
+        except Exception:
+            errors += 1
+            continue
+        latencies.append(time.perf_counter() - start)
+    peak_rss = _peak_rss_mb()
+    if not latencies:
+        return {'errors': errors}
+    latencies_ms = np.array(latencies) * 1000
+
+    # --- 2. Throughput of generate_batch() ---
+    batch_rate = None
+    try:
+        generator.generate_batch(batch_size) # Warm up caches only the batch path uses
+        start = time.perf_counter()
+        batches = max(1, num_samples // batch_size)
+        for _ in range(batches):
+            generator.generate_batch(batch_size)
+        batch_rate = batches * batch_size / (time.perf_counter() - start)
+    except Exception:
+        pass
+
+    # --- 3. Peak traced memory per sample (Python and NumPy allocations) ---
+    peaks = []
+    for _ in range(min(num_samples, 20)):
+        # Restarting resets the peak; tracemalloc.reset_peak() needs Python 3.9
+        tracemalloc.start()
+        try:
+            generator.generate()
+            peaks.append(tracemalloc.get_traced_memory()[1])
+        except Exception:
+            pass
+        finally:
+            tracemalloc.stop()
+
+    return {
+        'samples_per_sec': len(latencies) / (latencies_ms.sum() / 1000),
+        'batch_samples_per_sec': batch_rate,
+        'p50_ms': float(np.percentile(latencies_ms, 50)),
+        'p95_ms': float(np.percentile(latencies_ms, 95)),
+        'p99_ms': float(np.percentile(latencies_ms, 99)),
+        'peak_rss_mb': peak_rss if peak_reset else None,
+        'peak_traced_kb_per_sample': float(np.mean(peaks)) / 1024 if peaks else None,
+        'errors': errors,
+    }
+
+def run_bench(puzzle_types, img_sizes, num_samples, warmup, batch_size, workers, loader_samples, log=print):
+    results = {'meta': _metadata(), 'generators': {}, 'dataloader': {}}
+    for img_size in img_sizes:
+        generators = InterleavedPuzzleDataset({}, img_size=img_size).puzzle_generators
+        types = puzzle_types or [t for t in generators if t not in NEEDS_DATA]
+        for puzzle_type in types:
+            key = f"{puzzle_type}@{img_size}"
+            result = bench_generator(generators[puzzle_type], num_samples, warmup, batch_size)
+            results['generators'][key] = result
+            log(_format_row(key, result))
+
+        # End-to-end throughput over a uniform mix of the benchmarked (error-free) types
+        clean = [t for t in types if results['generators'][f"{t}@{img_size}"].get('errors') == 0]
+        if clean and workers:
+            per_type = max(1, loader_samples // len(clean))
+            dataset = InterleavedPuzzleDataset({t: per_type for t in clean}, img_size=img_size)
+            results['dataloader'][str(img_size)] = {}
+            for num_workers in workers:
+                backend = 'serial' if num_workers == 0 else 'process'
+                rate = run_loader(backend, dataset, batch_size, num_workers, epochs=1)
+                results['dataloader'][str(img_size)][str(num_workers)] = rate
+                log(f"DataLoader img_size={img_size} num_workers={num_workers}: {rate:.1f} samples/s")
+    return results
+
+def compare(results, baseline, tolerance):
+    """Lists the metrics that got worse than the baseline by more than `tolerance` (a fraction)."""
+    regressions = []
+    for key, result in results['generators'].items():
+        base = baseline.get('generators', {}).get(key)
+        if not base:
+            continue
+        for metric, higher_is_better in [('samples_per_sec', True), ('batch_samples_per_sec', True), ('p95_ms', False), ('p99_ms', False)]:
+            new, old = result.get(metric), base.get(metric)
+            if new is None or old is None or old == 0:
+                continue
+            change = (new - old) / old
+            if (change < -tolerance) if higher_is_better else (change > tolerance):
+                regressions.append(f"{key} {metric}: {old:.2f} -> {new:.2f} ({change:+.0%})")
+    for img_size, rates in results['dataloader'].items():
+        for num_workers, new in rates.items():
+            old = baseline.get('dataloader', {}).get(img_size, {}).get(num_workers)
+            if old and (new - old) / old < -tolerance:
+                regressions.append(f"DataLoader img_size={img_size} num_workers={num_workers}: {old:.1f} -> {new:.1f} ({(new - old) / old:+.0%})")
+    return regressions
+
+def _format_row(key, result):
+    if 'samples_per_sec' not in result:
+        return f"{key:<36} failed on every sample"
+    row = f"{key:<36}{result['samples_per_sec']:>9.1f}/s  p50 {result['p50_ms']:6.2f}  p95 {result['p95_ms']:6.2f}  p99 {result['p99_ms']:6.2f} ms"
+    if result['batch_samples_per_sec']:
+        row += f"  batch {result['batch_samples_per_sec']:8.1f}/s"
+    if result['errors']:
+        row += f"  ({result['errors']} errors)"
+    return row
+
+def _metadata():
+    return {
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'numpy': np.__version__,
+        'pillow': PIL.__version__,
+        'torch': torch.__version__,
+    }
+
+def main(args):
+    """Runs the `bench` command; returns the process exit code (1 on regressions)."""
+    results = run_bench(args.types, args.img_sizes, args.samples, args.warmup, args.batch_size, args.workers, args.loader_samples)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) against {args.baseline}:")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+        print(f"\nNo regressions against {args.baseline} (tolerance {args.tolerance:.0%}).")
+    return 0
@@ -0,0 +1,66 @@
+# benchmark_loaders.py
+import argparse
+import sys
+import time
+from torch.utils.data import DataLoader
+from dataset import InterleavedPuzzleDataset, collate_puzzle_batch
+from shared_loader import SharedMemoryLoader
+from thread_loader import ThreadPoolLoader
+
+# A mix of cheap and expensive generators, weighted roughly like a training run
+PUZZLE_COUNTS = {
+    'arithmetic': 64, 'algebra': 64, 'color_grid': 64, 'line_drawing': 64,
+    'tictactoe': 64, 'maze': 32, 'graph': 32, 'shape_augmentation': 64,
+    'rotation_matrix': 32, 'latin_square_matrix': 32, 'object_counting': 32,
+    'vector_logic': 32, 'inscribed_circle': 32, 'move_to_target': 32,
+}
+
+def make_loader(backend, dataset, batch_size, num_workers):
+    if backend == 'serial':
+        return DataLoader(dataset, batch_size=batch_size, shuffle=True, collate_fn=collate_puzzle_batch)
+    if backend == 'process':
+        return DataLoader(dataset, batch_size=batch_size, shuffle=True, num_workers=num_workers, collate_fn=collate_puzzle_batch)
+    if backend == 'thread':
+        return ThreadPoolLoader(dataset, batch_size, num_workers=num_workers)
+    return SharedMemoryLoader(dataset, batch_size, num_workers=num_workers)
+
+def run(backend, dataset, batch_size, num_workers, epochs):
+    """Returns samples per second, not counting the first batch (worker startup and cache warm-up)."""
+    loader = make_loader(backend, dataset, batch_size, num_workers)
+    samples = 0
+    start = None
+    for _ in range(epochs):
+        for inputs, targets, descriptions in loader:
+            if start is None:
+                start = time.perf_counter()
+                continue
+            samples += len(descriptions)
+    elapsed = time.perf_counter() - start
+    if backend == 'shared_memory':
+        loader.close()
+    return samples / elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the dataset's loading backends.")
+    parser.add_argument('--backends', nargs='+', default=['serial', 'process', 'thread', 'shared_memory'],
+                        choices=['serial', 'process', 'thread', 'shared_memory'])
+    parser.add_argument('--workers', type=int, nargs='+', default=[2, 4])
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--epochs', type=int, default=1)
+    parser.add_argument('--img-size', type=int, default=384)
+    args = parser.parse_args()
+
+    # Free-threaded builds (python3.13t) report whether the GIL was re-enabled at runtime
+    gil = getattr(sys, '_is_gil_enabled', lambda: True)()
+    print(f"Python {sys.version.split()[0]}, GIL {'enabled' if gil else 'disabled'}")
+
+    dataset = InterleavedPuzzleDataset(PUZZLE_COUNTS, img_size=args.img_size)
+    print(f"{len(dataset)} samples per epoch, batch size {args.batch_size}\n")
+    print(f"{'backend':<15}{'workers':>8}{'samples/s':>12}")
+    for backend in args.backends:
+        for num_workers in ([0] if backend == 'serial' else args.workers):
+            rate = run(backend, dataset, args.batch_size, num_workers, args.epochs)
+            print(f"{backend:<15}{num_workers:>8}{rate:>12.1f}")
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,11 @@
 # dataset.py
 import torch
-from torch.utils.data import Dataset
+from torch.utils.data import Dataset, IterableDataset, Sampler, default_collate, get_worker_info
 import numpy as np
+import heapq
 import random
+from contextlib import nullcontext
+from functools import cached_property
 from PIL import Image
 import torchvision
 
@@ -33,12 +36,98 @@ from puzzles.vector_logic import VectorLogicPuzzle
 from puzzles.matrix_multiplication import MatrixMultiplicationPuzzle
 from puzzles.one_d_measuring import OneDMeasuringPuzzle
 from puzzles.two_d_measuring import TwoDMeasuringPuzzle
+from puzzles.prerendered import PrerenderedPuzzle
+from puzzles.holdout import HoldoutPuzzle, has_params
+from utils.rng import random as thread_random, seeded
+from utils.profiling import StageStats, LOADER
+from utils.descriptions import DESCRIPTION_VOCAB
+from utils.change_mask import change_mask, mask_bboxes
+from utils.palette import PALETTE_SIZE, encode_indexed, is_recolorable, recolor
+from utils.holdout import HoldoutFilter
+from utils.answers import collect_answers, pad_answers, required_answer_length
 
 class InterleavedPuzzleDataset(Dataset):
     """
     Generates a dataset of interleaved puzzles by delegating to modular puzzle generator classes.
+
+    Puzzle types listed in `prerender` (e.g. 'arithmetic', 'algebra', 'latin_square_matrix')
+    must have a finite parameter space; every distinct sample is rendered once at
+    construction and then drawn from memory, as often as the generator would
+    draw it (see PrerenderedPuzzle).
+
+    A DataLoader with batch_size set fetches whole batches through __getitems__,
+    which renders each puzzle type with one generate_batch() call. Pass
+    collate_fn=collate_puzzle_batch to use those batch tensors as they are, and
+    batch_sampler=PuzzleTypeBatchSampler(...) to make the batches (mostly) one type.
+
+    Pass `seed` to make the manifest (the shuffled list of puzzle types and
+    the sampled sudoku rows) the same in every process, as PuzzleStream needs.
+
+    With collect_stats=True, the time spent in each stage (generation, the
+    stages generators time with utils.profiling.stage(), tensor conversion)
+    is recorded per puzzle type in shared memory by every worker; read the
+    totals with stats() in the main process. Build the dataset before
+    starting the workers.
+
+    With description_length set, descriptions are returned as int64 tensors
+    of that many token ids from utils.descriptions.DESCRIPTION_VOCAB (padded
+    with 0), so the training loop needs no tokenizer; dataset.vocab.decode()
+    gives back the text.
+
+    With return_masks=True, every sample also carries the pixels the target
+    changes, as an (H, W) bool mask, and their tight (x0, y0, x1, y1) box
+    (x1 and y1 exclusive): (input, target, description, mask, bbox).
+
+    With palette_indexed=True, inputs and targets are (H, W) uint8 indices
+    into a per-sample (256, 3) uint8 palette that follows them as the last
+    field; utils.palette.indexed_to_tensor() turns a batch into RGB floats,
+    on the GPU if you like. recolor_prob is then the chance that a sample's
+    MASTER_PALETTE colors are randomly permuted, color names in the
+    description included (see utils.palette.recolor). Generators still
+    render RGB and the indices come from encoding those images afterwards,
+    so recoloring is limited to samples whose colors are all exact palette
+    colors: anti-aliased colored edges blend with their neighbors, and
+    types drawn that way (graph, object_counting, rotation_matrix and
+    latin_square_matrix among them) are almost never recolored. Not available
+    with lazy=True.
+
+    `augment` is a utils.augment.BatchAugment (or anything with its
+    geometric() and photometric() methods) applied to each batch of uint8
+    images before conversion; change masks are taken between the two stages.
+
+    `holdout` is a utils.holdout.HoldoutFilter (or the path of one, e.g.
+    from recipes.build_holdout()) of eval samples that are never generated:
+    the generators of its puzzle types redraw any sample it contains, and
+    pre-rendered stores leave those samples out.
+
+    With answer_length set, every sample also carries the exact answer its
+    generator computed (the sudoku solution, the maze path, the winning move;
+    see utils.answers.ANSWER_FORMATS) as answer_length int64 values padded
+    with 0, and the number of them, 0 for samples without one (types that
+    record no answer): (..., answer, answer_length) after any other field.
+    answer_length must fit the longest answer of every type in the mixture
+    (see utils.answers.required_answer_length), and lazy=True cannot
+    return answers.
+
+    With lazy=True, __getitem__ and __getitems__ return PuzzleSample handles
+    that render and convert only the fields that are read; use
+    collate_fn=SampleCollator('input', ...) to read them in the workers.
+    Batch augmentation does not apply to single handles, so lazy=True
+    cannot be combined with augment.
     """
-    def __init__(self, puzzle_counts, sudoku_df=None, img_size=384):
+    def __init__(self, puzzle_counts, sudoku_df=None, img_size=384, prerender=(), seed=None, collect_stats=False,
+                 description_length=None, return_masks=False, lazy=False, palette_indexed=False, recolor_prob=0.0,
+                 augment=None, holdout=None, answer_length=None):
+        if lazy and augment is not None:
+            raise ValueError("augment works on whole batches and cannot be combined with lazy=True")
+        if lazy and palette_indexed:
+            raise ValueError("palette_indexed cannot be combined with lazy=True")
+        if answer_length is not None:
+            if lazy:
+                raise ValueError("answer_length cannot be combined with lazy=True")
+            needed = required_answer_length(t for t, count in puzzle_counts.items() if count > 0)
+            if answer_length < needed:
+                raise ValueError(f"answer_length={answer_length} is too short for this mixture's answers, which need {needed}")
         self.img_size = img_size
         self.puzzle_manifest = []
 
@@ -58,6 +147,9 @@ class InterleavedPuzzleDataset(Dataset):
             'shape_augmentation': ShapeAugmentationPuzzle(img_size),
             'line_drawing': LineDrawingPuzzle(img_size),
             'tictactoe': TicTacToePuzzle(img_size),
+            'tictactoe_4x4': TicTacToePuzzle(img_size, board_size=4, win_length=4),
+            'tictactoe_5x5': TicTacToePuzzle(img_size, board_size=5, win_length=4),
+            'gomoku_lite': TicTacToePuzzle(img_size, board_size=9, win_length=5),
             'rotation_matrix': RotationMatrixPuzzle(img_size),
             'fill_progression_matrix': FillProgressionMatrixPuzzle(img_size),
             'monochrome_logic_matrix': MonochromeLogicMatrixPuzzle(img_size),
@@ -76,6 +168,21 @@ class InterleavedPuzzleDataset(Dataset):
             'two_d_measuring': TwoDMeasuringPuzzle(img_size),
         }
         
+        if isinstance(holdout, str):
+            holdout = HoldoutFilter.load(holdout)
+        held_out_types = set(holdout.types) if holdout is not None else set()
+
+        for puzzle_type in prerender:
+            if puzzle_counts.get(puzzle_type, 0) > 0:
+                print(f"Pre-rendering all {puzzle_type} puzzles...")
+                exclude = (lambda params, t=puzzle_type: holdout.contains_params(t, params)) if puzzle_type in held_out_types else None
+                self.puzzle_generators[puzzle_type] = PrerenderedPuzzle(self.puzzle_generators[puzzle_type], exclude=exclude)
+                held_out_types.discard(puzzle_type)
+                print(f"{len(self.puzzle_generators[puzzle_type])} unique {puzzle_type} puzzles cached.")
+
+        for puzzle_type in held_out_types & set(self.puzzle_generators):
+            self.puzzle_generators[puzzle_type] = HoldoutPuzzle(self.puzzle_generators[puzzle_type], puzzle_type, holdout)
+        
         # Sudoku has special data requirements
         if 'sudoku' in puzzle_counts and sudoku_df is not None:
              self.puzzle_generators['sudoku'] = SudokuPuzzle(img_size)
@@ -83,31 +190,595 @@ class InterleavedPuzzleDataset(Dataset):
         for puzzle_type, count in puzzle_counts.items():
             if puzzle_type == 'sudoku':
                 if sudoku_df is not None and count > 0:
-                    for _, row in sudoku_df.sample(n=count, replace=True).iterrows():
+                    for _, row in sudoku_df.sample(n=count, replace=True, random_state=seed).iterrows():
                         # Pass the specific sudoku data to the manifest
                         self.puzzle_manifest.append(('sudoku', (row['quizzes'], row['solutions'])))
             elif puzzle_type in self.puzzle_generators:
                 self.puzzle_manifest.extend([(puzzle_type, None)] * count)
 
-        random.shuffle(self.puzzle_manifest)
+        (random.Random(seed) if seed is not None else random).shuffle(self.puzzle_manifest)
+
+        self.stage_stats = StageStats(self.puzzle_generators) if collect_stats else None
+        self.description_length = description_length
+        self.vocab = DESCRIPTION_VOCAB
+        self.return_masks = return_masks
+        self.lazy = lazy
+        self.palette_indexed = palette_indexed
+        self.recolor_prob = recolor_prob
+        self.augment = augment
+        self.answer_length = answer_length
 
     def __len__(self):
         return len(self.puzzle_manifest)
 
     def __getitem__(self, idx):
+        if self.lazy:
+            return PuzzleSample(self, idx, thread_random.getrandbits(64))
         puzzle_type, data = self.puzzle_manifest[idx]
 
         generator = self.puzzle_generators[puzzle_type]
         
-        if puzzle_type == 'sudoku':
-            # Sudoku generator needs the specific puzzle strings
-            input_image, target_image, text_description = generator.generate(data)
+        with self._timer(puzzle_type, 'generate'), self._answers() as answers:
+            if puzzle_type == 'sudoku':
+                # Sudoku generator needs the specific puzzle strings
+                input_image, target_image, text_description = generator.generate(data)
+            else:
+                # All other generators are called without arguments
+                input_image, target_image, text_description = generator.generate()
+
+        with self._timer(puzzle_type, 'to_tensor'):
+            if not self.batch_options():
+                return self._to_tensor(input_image), self._to_tensor(target_image), text_description
+            # The optional outputs are built as a batch of one
+            inputs = np.asarray(input_image.convert('RGB'))[None]
+            targets = np.asarray(target_image.convert('RGB'))[None]
+            answers = answers[-1:] if answers else [None]
+            return self._finish_batch(inputs, targets, [text_description], np.zeros(1, dtype=np.int64), [puzzle_type], answers)[0]
+
+    def __getitems__(self, indices):
+        """
+        Fetches several samples at once, rendering each puzzle type in a single generate_batch() call.
+        Returns a PuzzleBatch: a list of (input, target, description) samples that also carries the stacked batch.
+        """
+        if self.lazy:
+            return [self[idx] for idx in indices]
+        shape = (len(indices), self.img_size, self.img_size, 3)
+        inputs, targets = np.empty(shape, dtype=np.uint8), np.empty(shape, dtype=np.uint8)
+        answers = [] if self.answer_length is not None else None
+        descriptions, order = self.render_batch(indices, inputs, targets, answers)
+
+        with self._timer(LOADER, 'to_tensor', len(indices)):
+            puzzle_types = [self.puzzle_manifest[idx][0] for idx in indices]
+            return self._finish_batch(inputs, targets, descriptions, order, puzzle_types, answers)
+
+    def batch_options(self):
+        """The names of the options set on this dataset that _finish_batch() applies; loaders that skip it must honor or reject them."""
+        options = {
+            'description_length': self.description_length is not None, 'return_masks': self.return_masks,
+            'palette_indexed': self.palette_indexed, 'augment': self.augment is not None, 'answer_length': self.answer_length is not None,
+        }
+        return [name for name, enabled in options.items() if enabled]
+
+    def _finish_batch(self, inputs, targets, descriptions, order, puzzle_types=None, answers=None):
+        """
+        Converts rendered uint8 rows to a PuzzleBatch in the requested order, adding the optional outputs.
+        puzzle_types (in the requested order) select the per-type augmentation settings, and answers
+        (in the requested order) are padded to answer_length.
+        """
+        extras = {}
+        if self.augment is not None:
+            inputs, targets = self.augment.geometric(_chw_tensor(inputs, order), _chw_tensor(targets, order), puzzle_types)
+            inputs, targets = inputs.permute(0, 2, 3, 1).numpy(), targets.permute(0, 2, 3, 1).numpy()
+            order = np.arange(len(order))
+        if self.return_masks:
+            masks = change_mask(inputs, targets)[order]
+            extras['masks'] = torch.from_numpy(masks)
+            extras['bboxes'] = torch.from_numpy(mask_bboxes(masks))
+        if self.augment is not None:
+            inputs = self.augment.photometric(_chw_tensor(inputs, order), puzzle_types).permute(0, 2, 3, 1).numpy()
+        if self.palette_indexed:
+            inputs, targets, extras['palettes'], descriptions = self._encode_indexed(inputs, targets, descriptions, order)
         else:
-            # All other generators are called without arguments
-            input_image, target_image, text_description = generator.generate()
+            inputs, targets = batch_to_tensor(inputs, order), batch_to_tensor(targets, order)
+        if self.description_length is not None:
+            descriptions = torch.from_numpy(self.vocab.encode_batch(descriptions, self.description_length))
+        if self.answer_length is not None:
+            extras['answers'], extras['answer_lengths'] = pad_answers(answers, self.answer_length)
+        return PuzzleBatch(inputs, targets, descriptions, **extras)
+
+    def _encode_indexed(self, inputs, targets, descriptions, order):
+        """Palette-encodes every input/target pair, recoloring some. Returns (inputs, targets, palettes, descriptions)."""
+        n = len(order)
+        index_inputs = np.empty((n, self.img_size, self.img_size), dtype=np.uint8)
+        index_targets = np.empty((n, self.img_size, self.img_size), dtype=np.uint8)
+        palettes = np.empty((n, PALETTE_SIZE, 3), dtype=np.uint8)
+        descriptions = list(descriptions)
+        for pos, row in enumerate(order.tolist()):
+            (index_inputs[pos], index_targets[pos]), palettes[pos], slot_ids = encode_indexed(np.stack([inputs[row], targets[row]]))
+            if self.recolor_prob and thread_random.random() < self.recolor_prob and is_recolorable(palettes[pos], slot_ids):
+                palettes[pos], descriptions[pos] = recolor(palettes[pos], slot_ids, descriptions[pos], thread_random)
+        return torch.from_numpy(index_inputs), torch.from_numpy(index_targets), torch.from_numpy(palettes), descriptions
+
+    def render_batch(self, indices, inputs, targets, answers=None):
+        """
+        Renders the samples at `indices` into the (N, H, W, 3) uint8 arrays inputs and targets.
+
+        Samples are grouped by puzzle type and each group is rendered with one
+        generate_batch() call into a contiguous run of rows, so the rows are not
+        in the order of `indices`. Returns (descriptions, order): the
+        descriptions in the order of `indices`, and the row holding each one.
+        Pass a list as `answers` to have it filled with the samples' answers
+        (int64 arrays, or None), also in the order of `indices`.
+        """
+        # --- 1. Group the requested positions by puzzle type ---
+        groups = {}
+        for pos, idx in enumerate(indices):
+            groups.setdefault(self.puzzle_manifest[idx][0], []).append(pos)
 
-        return self._to_tensor(input_image), self._to_tensor(target_image), text_description
+        # --- 2. Render every group into its own contiguous slice of the buffers ---
+        descriptions = [None] * len(indices)
+        order = np.empty(len(indices), dtype=np.int64)
+        if answers is not None:
+            answers[:] = [None] * len(indices)
+        start = 0
+        for puzzle_type, positions in groups.items():
+            end = start + len(positions)
+            generator = self.puzzle_generators[puzzle_type]
+            with self._answers(answers is not None) as group_answers:
+                if puzzle_type == 'sudoku':
+                    for row, pos in enumerate(positions, start):
+                        with self._timer(puzzle_type, 'generate'):
+                            input_image, target_image, descriptions[pos] = generator.generate(self.puzzle_manifest[indices[pos]][1])
+                        inputs[row] = np.asarray(input_image.convert('RGB'))
+                        targets[row] = np.asarray(target_image.convert('RGB'))
+                else:
+                    # Counted per sample, so the mean is the time per sample
+                    with self._timer(puzzle_type, 'generate_batch', len(positions)):
+                        _, _, group_descriptions = generator.generate_batch(len(positions), out=(inputs[start:end], targets[start:end]))
+                    for pos, description in zip(positions, group_descriptions):
+                        descriptions[pos] = description
+            # A group records one answer per sample, or none
+            if group_answers:
+                if len(group_answers) != len(positions):
+                    raise RuntimeError(f"{puzzle_type} recorded {len(group_answers)} answers for {len(positions)} samples")
+                for pos, answer in zip(positions, group_answers):
+                    answers[pos] = answer
+            order[positions] = np.arange(start, end)
+            start = end
 
-    def _to_tensor(self, img):
+        return descriptions, order
+
+    def stats(self):
+        """
+        Per-stage totals of all processes so far, as {puzzle_type: {stage: {'count', 'total_s', 'mean_ms'}}}.
+        Batch conversion and loader waits (see StageStats.timed_iter) are listed under utils.profiling.LOADER.
+        """
+        if self.stage_stats is None:
+            raise RuntimeError("Stats are only collected by a dataset built with collect_stats=True")
+        return self.stage_stats.summary()
+
+    def _timer(self, puzzle_type, stage, count=1):
+        if self.stage_stats is None:
+            return _NO_TIMER
+        return self.stage_stats.timer(puzzle_type, stage, count)
+
+    def _answers(self, enabled=None):
+        """Collects the answers generated inside the block (see utils.answers), by default only when the dataset returns them."""
+        if enabled is None:
+            enabled = self.answer_length is not None
+        return collect_answers() if enabled else nullcontext()
+
+    @staticmethod
+    def _to_tensor(img):
         """Converts a PIL image to a PyTorch tensor."""
         return (torch.from_numpy(np.array(img)).permute(2, 0, 1).float() / 127.5) - 1
+
+_NO_TIMER = nullcontext()
+
+class PuzzleSample:
+    """
+    A handle on one sample of an InterleavedPuzzleDataset(lazy=True) that renders it on first access.
+
+    The handle carries the sample's recipe: its dataset index and the seed
+    that `random` and `np.random` (utils.rng) are seeded with while generating,
+    so the sample comes out the same whenever and on whichever thread it is
+    rendered; their previous state is restored afterwards. Generating produces
+    the images and description together; each field (input, target, mask, bbox,
+    description) is then converted on first access and memoized, so a consumer
+    that reads only `input` never converts the target or computes a mask.
+    Generators with sample_params() and describe() give `text` and
+    `description` without rendering at all, so filtering on them is cheap.
+
+    Pickling keeps the recipe and the fields computed so far but not the
+    dataset, so read what you need before a handle leaves its process
+    (SampleCollator does this in DataLoader workers).
+    """
+    FIELDS = ('input', 'target', 'description', 'text', 'mask', 'bbox', 'input_image', 'target_image')
+
+    def __init__(self, dataset, index, seed):
+        self.dataset = dataset
+        self.index = index
+        self.puzzle_type = dataset.puzzle_manifest[index][0]
+        self.seed = seed
+        self.description_length = dataset.description_length
+        self._rendered = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['dataset'] = None
+        state['_rendered'] = None
+        return state
+
+    def __repr__(self):
+        return f"PuzzleSample(index={self.index}, puzzle_type={self.puzzle_type!r}, seed={self.seed})"
+
+    def _render(self):
+        if self._rendered is None:
+            if self.dataset is None:
+                raise RuntimeError("This PuzzleSample was pickled before it was rendered; read its fields in the worker")
+            generator = self.dataset.puzzle_generators[self.puzzle_type]
+            data = self.dataset.puzzle_manifest[self.index][1]
+            with seeded(self.seed), self.dataset._timer(self.puzzle_type, 'generate'):
+                self._rendered = generator.generate(data) if self.puzzle_type == 'sudoku' else generator.generate()
+        return self._rendered
+
+    @cached_property
+    def input_image(self):
+        return self._render()[0]
+
+    @cached_property
+    def target_image(self):
+        return self._render()[1]
+
+    @cached_property
+    def text(self):
+        """The description as a string, from the sample's parameters alone when its generator can describe them."""
+        if self._rendered is None and self.dataset is not None:
+            generator = self.dataset.puzzle_generators[self.puzzle_type]
+            if has_params(generator):
+                try:
+                    with seeded(self.seed):
+                        return generator.describe(generator.sample_params())
+                except NotImplementedError:
+                    pass
+        return self._render()[2]
+
+    @cached_property
+    def description(self):
+        """The description as the dataset returns it: token ids with description_length set, else the string."""
+        if self.description_length is None:
+            return self.text
+        return torch.from_numpy(DESCRIPTION_VOCAB.encode(self.text, self.description_length).copy())
+
+    @cached_property
+    def input(self):
+        return InterleavedPuzzleDataset._to_tensor(self.input_image)
+
+    @cached_property
+    def target(self):
+        return InterleavedPuzzleDataset._to_tensor(self.target_image)
+
+    @cached_property
+    def mask(self):
+        return torch.from_numpy(change_mask(np.asarray(self.input_image.convert('RGB')), np.asarray(self.target_image.convert('RGB'))))
+
+    @cached_property
+    def bbox(self):
+        return torch.from_numpy(mask_bboxes(self.mask.numpy()[None])[0])
+
+class SampleCollator:
+    """
+    A DataLoader collate_fn for lazy datasets that reads only the given PuzzleSample fields.
+
+    Runs in the workers, so nothing else is ever rendered or converted.
+    Returns a dict of field -> stacked tensor (or list, for strings and images).
+    """
+    def __init__(self, *fields):
+        unknown = set(fields) - set(PuzzleSample.FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown PuzzleSample fields: {sorted(unknown)}")
+        self.fields = fields
+
+    def __call__(self, samples):
+        batch = {}
+        for field in self.fields:
+            values = [getattr(sample, field) for sample in samples]
+            batch[field] = torch.stack(values) if isinstance(values[0], torch.Tensor) else values
+        return batch
+
+def batch_to_tensor(arr, order=None):
+    """
+    Converts an (N, H, W, 3) uint8 array to an (N, 3, H, W) float tensor in [-1, 1],
+    the same values as InterleavedPuzzleDataset returns. `order` picks and orders the rows.
+    """
+    order = range(len(arr)) if order is None else order.tolist()
+    # Reordering and transposing while still uint8 is much cheaper than doing it on floats
+    chw = np.empty((len(order), 3, arr.shape[1], arr.shape[2]), dtype=np.uint8)
+    for pos, row in enumerate(order):
+        chw[pos] = arr[row].transpose(2, 0, 1)
+    return torch.from_numpy(chw).float().div_(127.5).sub_(1)
+
+def _chw_tensor(arr, order):
+    """The rows of an (N, H, W, 3) uint8 array in `order`, as an (N, 3, H, W) uint8 tensor."""
+    return torch.from_numpy(np.ascontiguousarray(arr[order].transpose(0, 3, 1, 2)))
+
+class PuzzleBatch(list):
+    """
+    The samples returned by InterleavedPuzzleDataset.__getitems__.
+
+    It is a list of (input, target, description) tuples, so the default collate
+    function works unchanged, and it also keeps the stacked `inputs` and
+    `targets` tensors that collate_puzzle_batch() hands out without copying.
+    With change masks, the tuples and the batch also have `masks` and
+    `bboxes`; with palette-indexed images, `palettes` follows them; with
+    answers, `answers` and `answer_lengths` come last.
+    """
+    def __init__(self, inputs, targets, descriptions, masks=None, bboxes=None, palettes=None, answers=None, answer_lengths=None):
+        self.inputs = inputs
+        self.targets = targets
+        self.descriptions = descriptions
+        self.masks = masks
+        self.bboxes = bboxes
+        self.palettes = palettes
+        self.answers = answers
+        self.answer_lengths = answer_lengths
+        super().__init__(zip(*self.fields()))
+
+    def fields(self):
+        """The batch as collate_puzzle_batch() returns it."""
+        fields = [self.inputs, self.targets, self.descriptions]
+        if self.masks is not None:
+            fields += [self.masks, self.bboxes]
+        if self.palettes is not None:
+            fields.append(self.palettes)
+        if self.answers is not None:
+            fields += [self.answers, self.answer_lengths]
+        return fields
+
+def collate_puzzle_batch(samples):
+    """A DataLoader collate_fn that returns a PuzzleBatch's tensors as they are and falls back to default_collate otherwise."""
+    if isinstance(samples, PuzzleBatch):
+        return samples.fields()
+    return default_collate(samples)
+
+class PuzzleTypeBatchSampler(Sampler):
+    """
+    A batch sampler that keeps puzzle types together, so __getitems__ renders few, large groups.
+
+    Each type's indices are shuffled and cut into micro-batches of
+    micro_batch_size; the micro-batches of all types are then shuffled and
+    packed into batches of batch_size. With micro_batch_size equal to
+    batch_size (the default) almost every batch is a single type.
+    """
+    def __init__(self, dataset, batch_size, micro_batch_size=None, shuffle=True, drop_last=False):
+        if batch_size < 1:
+            raise ValueError("batch_size must be at least 1")
+        self.batch_size = batch_size
+        self.micro_batch_size = micro_batch_size or batch_size
+        if self.micro_batch_size < 1:
+            raise ValueError("micro_batch_size must be at least 1")
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+
+        self.type_indices = {}
+        for idx, (puzzle_type, _) in enumerate(dataset.puzzle_manifest):
+            self.type_indices.setdefault(puzzle_type, []).append(idx)
+        self.num_samples = len(dataset.puzzle_manifest)
+
+    def __len__(self):
+        if self.drop_last:
+            return self.num_samples // self.batch_size
+        return (self.num_samples + self.batch_size - 1) // self.batch_size
+
+    def __iter__(self):
+        micro_batches = []
+        for indices in self.type_indices.values():
+            indices = list(indices)
+            if self.shuffle:
+                random.shuffle(indices)
+            micro_batches.extend(indices[i:i + self.micro_batch_size] for i in range(0, len(indices), self.micro_batch_size))
+        if self.shuffle:
+            random.shuffle(micro_batches)
+
+        batch = []
+        for micro_batch in micro_batches:
+            for idx in micro_batch:
+                batch.append(idx)
+                if len(batch) == self.batch_size:
+                    yield batch
+                    batch = []
+        if batch and not self.drop_last:
+            yield batch
+
+class CostBalancedBatchSampler(Sampler):
+    """
+    A batch sampler that gives every batch about the same expected render time.
+
+    Indices are drawn a window of `window` batches at a time. Each window
+    takes from every puzzle type its share of the samples still left in the
+    epoch (largest remainder), so the mixture's proportions hold within every
+    window and the epoch still covers the dataset exactly once. The window's
+    samples are then dealt, most expensive first, to whichever of its batches
+    has the least expected cost so far. Because DataLoader hands batches to
+    workers in turn, balanced batches also mean balanced workers.
+
+    Costs (milliseconds per sample) are read from dataset.stats() at the start
+    of every window when the dataset was built with collect_stats=True, so the
+    sampler adapts as it learns; `costs` gives starting values. Types without
+    a cost yet get the mean of the known ones.
+    """
+    def __init__(self, dataset, batch_size, window=8, costs=None, drop_last=False):
+        if batch_size < 1:
+            raise ValueError("batch_size must be at least 1")
+        if window < 1:
+            raise ValueError("window must be at least 1")
+        self.dataset = dataset
+        self.batch_size = batch_size
+        self.window = window
+        self.costs = dict(costs or {})
+        self.drop_last = drop_last
+
+        self.type_indices = {}
+        for idx, (puzzle_type, _) in enumerate(dataset.puzzle_manifest):
+            self.type_indices.setdefault(puzzle_type, []).append(idx)
+        self.num_samples = len(dataset.puzzle_manifest)
+
+    def __len__(self):
+        if self.drop_last:
+            return self.num_samples // self.batch_size
+        return (self.num_samples + self.batch_size - 1) // self.batch_size
+
+    def type_costs(self):
+        """The expected milliseconds per sample of every puzzle type in the dataset."""
+        costs = dict(self.costs)
+        if self.dataset.stage_stats is not None:
+            for puzzle_type, stages in self.dataset.stats().items():
+                # Batches are rendered with generate_batch(), so prefer its cost
+                measured = stages.get('generate_batch') or stages.get('generate')
+                if measured:
+                    costs[puzzle_type] = measured['mean_ms']
+        known = [costs[t] for t in self.type_indices if t in costs]
+        default = sum(known) / len(known) if known else 1.0
+        return {puzzle_type: costs.get(puzzle_type, default) for puzzle_type in self.type_indices}
+
+    def __iter__(self):
+        queues = {puzzle_type: random.sample(indices, len(indices)) for puzzle_type, indices in self.type_indices.items()}
+        remaining = self.num_samples
+        while remaining:
+            # --- 1. Take every type's share of the window ---
+            size = min(self.window * self.batch_size, remaining)
+            costs = self.type_costs()
+            samples = []
+            for puzzle_type, quota in _proportional_quotas({t: len(q) for t, q in queues.items()}, size).items():
+                samples.extend((costs[puzzle_type], queues[puzzle_type].pop()) for _ in range(quota))
+            remaining -= size
+
+            # --- 2. Deal the samples, most expensive first, to the cheapest batch with room ---
+            capacities = [self.batch_size] * (size // self.batch_size)
+            if size % self.batch_size:
+                capacities.append(size % self.batch_size)
+            batches = [[] for _ in capacities]
+            heap = [(0.0, b) for b in range(len(batches))]
+            random.shuffle(samples) # Random tie-breaking among samples of equal cost
+            samples.sort(key=lambda sample: sample[0], reverse=True)
+            for cost, idx in samples:
+                load, b = heapq.heappop(heap)
+                batches[b].append(idx)
+                if len(batches[b]) < capacities[b]:
+                    heapq.heappush(heap, (load + cost, b))
+
+            for batch in batches:
+                if len(batch) == self.batch_size or not self.drop_last:
+                    random.shuffle(batch)
+                    yield batch
+
+def _proportional_quotas(counts, size):
+    """Splits `size` between the keys of `counts` in proportion to their counts (largest remainder method)."""
+    total = sum(counts.values())
+    exact = {key: count * size / total for key, count in counts.items()}
+    quotas = {key: int(share) for key, share in exact.items()}
+    leftover = size - sum(quotas.values())
+    for key in sorted(exact, key=lambda key: exact[key] - quotas[key], reverse=True)[:leftover]:
+        quotas[key] += 1
+    return quotas
+
+class PuzzleStream(IterableDataset):
+    """
+    Streams a dataset in a reproducible order that can be saved and resumed.
+
+    The order of each epoch is a permutation drawn from (seed, epoch) and is
+    split by rank (every world_size-th sample, padded like DistributedSampler
+    unless drop_last) and then by DataLoader worker. Each unit (one sample, or
+    one batch of batch_size samples) is rendered with `random` and `np.random`
+    seeded from (seed, epoch, rank, unit), so a unit's content does not depend
+    on which worker renders it or on what came before it. Their previous state
+    is restored after each unit, so iterating in-process leaves the caller's
+    random state alone.
+
+    A unit is identified by its position in the rank's epoch, which makes the
+    stream state a handful of ints: state_dict() and load_state_dict() resume
+    exactly where training stopped without replaying or skipping samples. When
+    iterated in-process the position is tracked automatically; with DataLoader
+    workers pass the number of units consumed to state_dict(). Call
+    set_epoch() at the start of every epoch, as with DistributedSampler.
+
+    The dataset must be built with the same `seed` on every rank. With
+    batch_size set, each unit is a [inputs, targets, descriptions] batch from
+    __getitems__; use DataLoader(stream, batch_size=None).
+    """
+    def __init__(self, dataset, seed=0, rank=None, world_size=None, batch_size=None, drop_last=False):
+        if rank is None or world_size is None:
+            distributed = torch.distributed.is_available() and torch.distributed.is_initialized()
+            rank = torch.distributed.get_rank() if distributed else 0
+            world_size = torch.distributed.get_world_size() if distributed else 1
+        if not 0 <= rank < world_size:
+            raise ValueError(f"rank must be in [0, {world_size}), got {rank}")
+        self.dataset = dataset
+        self.seed = seed
+        self.rank = rank
+        self.world_size = world_size
+        self.batch_size = batch_size
+        self.drop_last = drop_last
+        self.epoch = 0
+        self.position = 0 # Units of this rank's epoch already yielded
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+        self.position = 0
+
+    def state_dict(self, consumed=None):
+        """The stream position; `consumed` overrides it with the number of units the training loop has used this epoch."""
+        return {
+            'seed': self.seed,
+            'epoch': self.epoch,
+            'position': self.position if consumed is None else consumed,
+            'rank': self.rank,
+            'world_size': self.world_size,
+        }
+
+    def load_state_dict(self, state):
+        if (state['seed'], state['world_size']) != (self.seed, self.world_size):
+            raise ValueError(
+                f"Cannot resume a stream with seed {state['seed']} and world_size {state['world_size']} "
+                f"as seed {self.seed} and world_size {self.world_size}"
+            )
+        self.epoch = state['epoch']
+        self.position = state['position']
+
+    def __len__(self):
+        return len(self._units())
+
+    def _units(self):
+        """This rank's units for the current epoch, as lists of dataset indices."""
+        order = np.random.default_rng([self.seed, self.epoch]).permutation(len(self.dataset))
+        if self.drop_last:
+            order = order[:len(order) - len(order) % self.world_size]
+        elif len(order) % self.world_size:
+            padding = self.world_size - len(order) % self.world_size
+            order = np.concatenate([order, np.resize(order, padding)])
+        indices = order[self.rank::self.world_size].tolist()
+        if self.batch_size is None:
+            return [[idx] for idx in indices]
+        units = [indices[i:i + self.batch_size] for i in range(0, len(indices), self.batch_size)]
+        if self.drop_last and units and len(units[-1]) < self.batch_size:
+            units.pop()
+        return units
+
+    def __iter__(self):
+        units = self._units()
+        worker = get_worker_info()
+        worker_id, num_workers = (worker.id, worker.num_workers) if worker is not None else (0, 1)
+
+        # Each worker takes every num_workers-th unit counted from the saved position, so DataLoader's
+        # round-robin over the workers (starting at worker 0) yields position, position + 1, ...
+        start = self.position
+        for unit in range(start + worker_id, len(units), num_workers):
+            unit_seed = int(np.random.SeedSequence([self.seed, self.epoch, self.rank, unit]).generate_state(1)[0])
+            with seeded(unit_seed):
+                if self.batch_size is None:
+                    item = self.dataset[units[unit][0]]
+                else:
+                    item = collate_puzzle_batch(self.dataset.__getitems__(units[unit]))
+            if worker is None:
+                self.position = unit + 1
+            yield item
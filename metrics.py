@@ -0,0 +1,158 @@
+# metrics.py
+import math
+import numpy as np
+import torch
+
+MATRIX_TYPES = (
+    'rotation_matrix', 'fill_progression_matrix', 'monochrome_logic_matrix',
+    'tricolor_rotation_matrix', 'latin_square_matrix', 'shape_superposition_matrix',
+)
+# ColorGridPuzzle draws grids of 2 to this many rows and columns
+MAX_GRID_CELLS = 5
+
+def _to_255(images):
+    """(N, 3, H, W) images as floats in [0, 255], from uint8 or the dataset's floats in [-1, 1]."""
+    if images.is_floating_point():
+        return (images.float() + 1) * 127.5
+    return images.float()
+
+def _common_units(preds, targets, inputs):
+    """
+    The three batches as floats in one unit, and the size of one 0-255 step in it. Batches that are all
+    in [-1, 1] are compared as they are, which saves a pass over each; mixed ones are converted to [0, 255].
+    """
+    if preds.is_floating_point() and targets.is_floating_point() and inputs.is_floating_point():
+        return preds.float(), targets.float(), inputs.float(), 1 / 127.5
+    return _to_255(preds), _to_255(targets), _to_255(inputs), 1.0
+
+def _max_channel_diff(a, b):
+    return (a - b).abs_().amax(dim=1)
+
+def _type_names(puzzle_types, type_names):
+    if type_names is None:
+        return list(puzzle_types)
+    return [type_names[i] for i in torch.as_tensor(puzzle_types).tolist()]
+
+def score_batch(preds, targets, inputs, puzzle_types, type_names=None, tolerance=32, panel_threshold=0.95):
+    """
+    Scores a batch of predicted target images, one value per sample and metric.
+
+    preds, targets and inputs are (N, 3, H, W) tensors, either uint8 or
+    floats in [-1, 1] like the dataset returns. puzzle_types are the
+    samples' type names, or integer ids into type_names. A pixel is correct
+    when no channel is off by more than `tolerance` (in 0-255 units).
+    Returns {metric: (N,) float tensor}, NaN where a metric does not apply:
+      pixel_acc    correct pixels over the whole image
+      changed_acc  correct pixels where the target differs from the input
+      change_iou   IoU of the pixels the prediction changes and the target
+                   changes (e.g. the path of a maze)
+      cell_acc     color_grid: cells whose center has the right color
+      panel_acc    matrix puzzles: 1 if the answer panel is at least
+                   panel_threshold correct
+    """
+    names = _type_names(puzzle_types, type_names)
+    pred, target, inp, step = _common_units(preds, targets, inputs)
+    tolerance = tolerance * step
+    correct = _max_channel_diff(pred, target) <= tolerance # (N, H, W)
+    target_diff = _max_channel_diff(target, inp)
+    changed = target_diff > 0.5 * step
+    # The IoU compares changes beyond the tolerance on both sides, so a perfect prediction scores 1
+    target_changed = target_diff > tolerance
+    pred_changed = _max_channel_diff(pred, inp) > tolerance
+
+    # --- 1. Metrics of every type ---
+    scores = {'pixel_acc': correct.flatten(1).float().mean(dim=1)}
+    scores['changed_acc'] = (correct & changed).flatten(1).sum(dim=1) / changed.flatten(1).sum(dim=1).float()
+    intersection = (pred_changed & target_changed).flatten(1).sum(dim=1).float()
+    union = (pred_changed | target_changed).flatten(1).sum(dim=1).float()
+    scores['change_iou'] = torch.where(union > 0, intersection / union.clamp(min=1), torch.ones_like(union))
+
+    # --- 2. Metrics of specific types, on just their rows ---
+    device = pred.device
+    scores['cell_acc'] = torch.full((len(names),), math.nan, device=device)
+    rows = torch.tensor([i for i, name in enumerate(names) if name == 'color_grid'], dtype=torch.long, device=device)
+    if len(rows):
+        scores['cell_acc'][rows] = _cell_accuracy(pred[rows], target[rows], inp[rows], tolerance, step)
+    scores['panel_acc'] = torch.full((len(names),), math.nan, device=device)
+    rows = torch.tensor([i for i, name in enumerate(names) if name in MATRIX_TYPES], dtype=torch.long, device=device)
+    if len(rows):
+        scores['panel_acc'][rows] = _panel_accuracy(correct[rows], panel_threshold)
+    return scores
+
+def _grid_lines(dark_fraction):
+    """The number of grid cells along an axis, from the (N, L) fraction of dark pixels in each line across it."""
+    interior = dark_fraction[:, 3:-3] > 0.9 # The outer border may be clipped by the canvas edge
+    starts = interior[:, 1:] & ~interior[:, :-1]
+    return starts.sum(dim=1) + interior[:, 0] + 1
+
+def _cell_accuracy(pred, target, inp, tolerance, step, window=5):
+    """The fraction of color_grid cells whose center window has the target's mean color, per sample."""
+    n, _, h, w = inp.shape
+    black = 0.0 if step == 1 else -1.0
+    dark = inp.amax(dim=1) < black + 128 * step # The grid lines of the empty input grid
+    rows = _grid_lines(dark.float().mean(dim=2))
+    cols = _grid_lines(dark.float().mean(dim=1))
+    cells = torch.arange(MAX_GRID_CELLS, device=inp.device)
+    valid = (cells[None] < rows[:, None])[:, :, None] & (cells[None] < cols[:, None])[:, None, :] # (N, R, C)
+
+    # Gather a window around every cell center, for up to MAX_GRID_CELLS x MAX_GRID_CELLS cells
+    offsets = torch.arange(window, device=inp.device) - window // 2
+    ys = (((cells[None] + 0.5) * h / rows[:, None]).long()[:, :, None] + offsets).clamp(0, h - 1) # (N, R, k)
+    xs = (((cells[None] + 0.5) * w / cols[:, None]).long()[:, :, None] + offsets).clamp(0, w - 1) # (N, C, k)
+    batch = torch.arange(n, device=inp.device)[:, None, None, None, None]
+    ys, xs = ys[:, :, None, :, None], xs[:, None, :, None, :]
+    pred_colors = pred.permute(0, 2, 3, 1)[batch, ys, xs].mean(dim=(3, 4)) # (N, R, C, 3)
+    target_colors = target.permute(0, 2, 3, 1)[batch, ys, xs].mean(dim=(3, 4))
+    cell_correct = (pred_colors - target_colors).abs().amax(dim=-1) <= tolerance
+    return (cell_correct & valid).flatten(1).sum(dim=1) / valid.flatten(1).sum(dim=1).float()
+
+def _panel_accuracy(correct, threshold, grid=3, margin=3):
+    """1.0 where the bottom-right (answer) panel of a 3x3 matrix puzzle is at least `threshold` correct."""
+    h, w = correct.shape[1:]
+    panel_h, panel_w = h // grid, w // grid
+    # Panels sit on a grid of img_size // 3; the margin skips the grid lines around them
+    panel = correct[:, (grid - 1) * panel_h + margin:grid * panel_h - margin, (grid - 1) * panel_w + margin:grid * panel_w - margin]
+    return (panel.flatten(1).float().mean(dim=1) >= threshold).float()
+
+class PuzzleMetrics:
+    """
+    Accumulates score_batch() results per puzzle type over an eval run.
+
+    update() takes the same arguments as score_batch(); summary() returns
+    {puzzle_type: {metric: mean, 'count': samples}}, skipping metrics that
+    do not apply to a type.
+    """
+    def __init__(self, tolerance=32, panel_threshold=0.95):
+        self.tolerance = tolerance
+        self.panel_threshold = panel_threshold
+        self.reset()
+
+    def reset(self):
+        self.totals = {} # puzzle_type -> {metric: [sum, count]}
+        self.counts = {}
+
+    def update(self, preds, targets, inputs, puzzle_types, type_names=None):
+        names = _type_names(puzzle_types, type_names)
+        with torch.no_grad():
+            scores = score_batch(preds.detach(), targets, inputs, names, tolerance=self.tolerance, panel_threshold=self.panel_threshold)
+        types, type_ids = np.unique(np.array(names), return_inverse=True)
+        type_ids = torch.from_numpy(type_ids.reshape(-1)).long()
+        for puzzle_type, count in zip(types.tolist(), np.bincount(type_ids.numpy()).tolist()):
+            self.counts[puzzle_type] = self.counts.get(puzzle_type, 0) + count
+        # Per-type sums and counts of every metric with one scatter-add each
+        for metric, values in scores.items():
+            values = values.cpu() # Only N values per metric leave the device
+            applies = ~torch.isnan(values)
+            sums = torch.zeros(len(types), dtype=torch.float64).index_add_(0, type_ids[applies], values[applies].double())
+            counts = torch.bincount(type_ids[applies], minlength=len(types))
+            for puzzle_type, total, count in zip(types.tolist(), sums.tolist(), counts.tolist()):
+                if count:
+                    entry = self.totals.setdefault(puzzle_type, {}).setdefault(metric, [0.0, 0])
+                    entry[0] += total
+                    entry[1] += count
+
+    def summary(self):
+        return {
+            puzzle_type: {**{metric: total / count for metric, (total, count) in metrics.items()}, 'count': self.counts[puzzle_type]}
+            for puzzle_type, metrics in sorted(self.totals.items())
+        }
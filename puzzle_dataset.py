@@ -0,0 +1,43 @@
+# puzzle_dataset.py
+import argparse
+import sys
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='puzzle_dataset', description="Tools for the visual puzzle dataset.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    bench = commands.add_parser(
+        'bench', help="Benchmark every generator and the DataLoader; compare against a baseline.",
+        description="Per generator and image size: samples/s, p50/p95/p99 latency, peak RSS and, in place of an "
+                    "allocation count, the peak traced (Python and NumPy) memory of one sample in KB.")
+    bench.add_argument('--types', nargs='+', help="Puzzle types to benchmark (default: all that need no external data)")
+    bench.add_argument('--img-sizes', type=int, nargs='+', default=[384])
+    bench.add_argument('--samples', type=int, default=200, help="Timed samples per generator")
+    bench.add_argument('--warmup', type=int, default=10, help="Untimed samples per generator, to fill caches")
+    bench.add_argument('--batch-size', type=int, default=32)
+    bench.add_argument('--workers', type=int, nargs='*', default=[0, 2, 4], help="DataLoader num_workers to measure")
+    bench.add_argument('--loader-samples', type=int, default=512, help="Samples per DataLoader measurement")
+    bench.add_argument('--output', help="Write the results to this JSON file")
+    bench.add_argument('--baseline', help="Compare against results from an earlier run; exit with status 1 on regressions")
+    bench.add_argument('--tolerance', type=float, default=0.1, help="Allowed relative slowdown before a metric counts as a regression")
+
+    autotune = commands.add_parser('autotune', help="Probe a mixture and pick DataLoader settings for it.")
+    autotune.add_argument('--counts', nargs='+', metavar='TYPE=COUNT', help="The mixture (default: the one in benchmark_loaders.py)")
+    autotune.add_argument('--img-size', type=int, default=384)
+    autotune.add_argument('--batch-size', type=int, default=32)
+    autotune.add_argument('--target', type=float, help="Samples/s to reach with as few workers as possible")
+    autotune.add_argument('--max-workers', type=int, help="CPU budget (default: the CPU count)")
+    autotune.add_argument('--memory-mb', type=float, help="Memory budget for workers and their prefetched batches")
+    autotune.add_argument('--probe-batches', type=int, default=8, help="Timed batches per probe")
+    autotune.add_argument('--config', help="Reuse the configuration saved here if it matches, else save the new one")
+
+    args = parser.parse_args(argv)
+    if args.command == 'bench':
+        import bench as bench_command
+        return bench_command.main(args)
+    if args.command == 'autotune':
+        import autotune as autotune_command
+        return autotune_command.main(args)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,336 @@
+# puzzle_service.py
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import signal
+import socket
+import struct
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from torch.utils.data import Dataset
+from dataset import InterleavedPuzzleDataset, PuzzleBatch, batch_to_tensor
+from puzzles.prerendered import PrerenderedPuzzle
+from utils.rng import seed_thread
+
+# --- Wire format ---
+# Every message is a header followed by `length` bytes of payload. All integers are big-endian.
+#   header:          magic (4s) | kind (B) | flag (B) | reserved (H) | length (Q)
+#   sample request:  kind=REQUEST_SAMPLES, flag=priority; seed (Q) | entry count (H) | entries
+#                    each entry: name length (B) | name (utf-8) | count (I)
+#   info request:    kind=REQUEST_INFO, no payload
+#   sample reply:    kind=REQUEST_SAMPLES, flag=0; n (I) | img_size (H) | n x (length (I) | description)
+#                    | inputs (n*H*W*3 uint8) | targets (n*H*W*3 uint8), rows grouped in entry order
+#   info reply:      kind=REQUEST_INFO, flag=0; JSON {"img_size": ..., "puzzle_types": [...]}
+#   error reply:     the request's kind, flag=1; utf-8 message
+MAGIC = b'PZL1'
+HEADER = struct.Struct('!4sBBHQ')
+REQUEST_SAMPLES = 1
+REQUEST_INFO = 2
+STATUS_ERROR = 1
+
+# Lower values are served first
+PRIORITY_EVAL = 0
+PRIORITY_TRAIN = 1
+
+def encode_sample_request(entries, seed, priority=PRIORITY_TRAIN):
+    """Builds a request for the (puzzle_type, count) pairs in entries."""
+    parts = [struct.pack('!QH', seed, len(entries))]
+    for puzzle_type, count in entries:
+        name = puzzle_type.encode()
+        parts.append(struct.pack('!B', len(name)) + name + struct.pack('!I', count))
+    payload = b''.join(parts)
+    return HEADER.pack(MAGIC, REQUEST_SAMPLES, priority, 0, len(payload)) + payload
+
+def decode_sample_request(payload):
+    """Returns (seed, [(puzzle_type, count), ...])."""
+    seed, num_entries = struct.unpack_from('!QH', payload)
+    offset = 10
+    entries = []
+    for _ in range(num_entries):
+        name_length = payload[offset]
+        puzzle_type = payload[offset + 1:offset + 1 + name_length].decode()
+        count, = struct.unpack_from('!I', payload, offset + 1 + name_length)
+        entries.append((puzzle_type, count))
+        offset += 5 + name_length
+    return seed, entries
+
+class PuzzleService:
+    """
+    Serves rendered puzzles to every process on the host over a Unix socket.
+
+    One service owns one set of generators, their caches and a pool of
+    num_workers render processes, so training and eval processes share a
+    single warm pool instead of each building their own. Rendering is mostly
+    GIL-bound Python and PIL, so the pool uses processes, not threads; they
+    start after pre-rendering and, when forked, share the stores copy-on-write.
+    Requests name puzzle types and counts; a worker renders each type with
+    one generate_batch() call and sends the images back through the pool's
+    pipe, which costs one copy of each image. Queued requests are served by
+    priority, so PRIORITY_EVAL requests overtake training traffic.
+    """
+    def __init__(self, socket_path, img_size=384, num_workers=4, prerender=(), generators=None):
+        self.socket_path = socket_path
+        self.img_size = img_size
+        self.num_workers = num_workers
+        if generators is None:
+            generators = InterleavedPuzzleDataset({}, img_size=img_size).puzzle_generators
+        self.generators = dict(generators)
+        for puzzle_type in prerender:
+            print(f"Pre-rendering all {puzzle_type} puzzles...")
+            self.generators[puzzle_type] = PrerenderedPuzzle(self.generators[puzzle_type])
+        self._pool = ProcessPoolExecutor(num_workers, initializer=_init_worker, initargs=(self.generators, img_size))
+        self._order = itertools.count() # Keeps requests of equal priority first come, first served
+
+    def run(self):
+        """Serves until SIGINT or SIGTERM."""
+        try:
+            asyncio.run(self.serve())
+        finally:
+            self._pool.shutdown() # At most one render per worker is still running
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+    async def serve(self):
+        self._jobs = asyncio.PriorityQueue()
+        dispatchers = [asyncio.create_task(self._dispatch()) for _ in range(self.num_workers)]
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        server = await asyncio.start_unix_server(self._handle_connection, path=self.socket_path)
+        print(f"Serving {len(self.generators)} puzzle types at {self.socket_path}")
+
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop.set)
+            except (NotImplementedError, RuntimeError):
+                pass # Not the main thread; the caller stops the loop
+        try:
+            async with server:
+                await stop.wait()
+        finally:
+            for dispatcher in dispatchers:
+                dispatcher.cancel()
+
+    async def _dispatch(self):
+        """Runs queued renders on the process pool, most urgent first."""
+        loop = asyncio.get_running_loop()
+        while True:
+            _, _, (seed, entries, future) = await self._jobs.get()
+            try:
+                reply = await loop.run_in_executor(self._pool, _render, seed, entries)
+            except Exception as e:
+                reply = e
+            if not future.cancelled():
+                future.set_result(reply)
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    header = await reader.readexactly(HEADER.size)
+                except asyncio.IncompleteReadError:
+                    break
+                magic, kind, flag, _, length = HEADER.unpack(header)
+                if magic != MAGIC:
+                    break
+                payload = await reader.readexactly(length)
+                if kind == REQUEST_INFO:
+                    info = json.dumps({'img_size': self.img_size, 'puzzle_types': sorted(self.generators)}).encode()
+                    writer.write(HEADER.pack(MAGIC, REQUEST_INFO, 0, 0, len(info)) + info)
+                elif kind == REQUEST_SAMPLES:
+                    future = asyncio.get_running_loop().create_future()
+                    seed, entries = decode_sample_request(payload)
+                    await self._jobs.put((flag, next(self._order), (seed, entries, future)))
+                    reply = await future
+                    if isinstance(reply, Exception):
+                        message = f"{type(reply).__name__}: {reply}".encode()
+                        writer.write(HEADER.pack(MAGIC, kind, STATUS_ERROR, 0, len(message)) + message)
+                    else:
+                        head, images = reply
+                        writer.write(HEADER.pack(MAGIC, kind, 0, 0, len(head) + images.nbytes))
+                        writer.write(head)
+                        writer.write(memoryview(images).cast('B'))
+                else:
+                    message = f"Unknown request kind {kind}".encode()
+                    writer.write(HEADER.pack(MAGIC, kind, STATUS_ERROR, 0, len(message)) + message)
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass # Client went away, or the service is shutting down
+        finally:
+            writer.close()
+
+_worker_generators = None # This render process's generators and image size, set by _init_worker()
+_worker_img_size = None
+
+def _init_worker(generators, img_size):
+    global _worker_generators, _worker_img_size
+    _worker_generators, _worker_img_size = generators, img_size
+
+def _render(seed, entries):
+    """Renders one request in a pool process. Returns (head, images) of the reply, images being (2, n, H, W, 3) uint8."""
+    for puzzle_type, _ in entries:
+        if puzzle_type not in _worker_generators:
+            raise KeyError(f"Unknown puzzle type {puzzle_type!r}")
+        if puzzle_type == 'sudoku':
+            raise ValueError("Sudoku needs puzzle data and cannot be served")
+    seed_thread(seed)
+
+    n = sum(count for _, count in entries)
+    images = np.empty((2, n, _worker_img_size, _worker_img_size, 3), dtype=np.uint8) # Inputs, then targets
+    descriptions = []
+    start = 0
+    for puzzle_type, count in entries:
+        end = start + count
+        _, _, group_descriptions = _worker_generators[puzzle_type].generate_batch(count, out=(images[0, start:end], images[1, start:end]))
+        descriptions.extend(group_descriptions)
+        start = end
+
+    head = [struct.pack('!IH', n, _worker_img_size)]
+    for description in descriptions:
+        encoded = description.encode()
+        head.append(struct.pack('!I', len(encoded)) + encoded)
+    return b''.join(head), images
+
+class PuzzleServiceClient:
+    """A blocking connection to a PuzzleService. Reconnects after a fork, so each DataLoader worker gets its own socket."""
+    def __init__(self, socket_path):
+        self.socket_path = socket_path
+        self._sock = None
+        self._pid = None
+
+    def _connection(self):
+        if self._sock is None or self._pid != os.getpid():
+            self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._sock.connect(self.socket_path)
+            self._pid = os.getpid()
+        return self._sock
+
+    def __getstate__(self):
+        return {'socket_path': self.socket_path, '_sock': None, '_pid': None}
+
+    def close(self):
+        if self._sock is not None and self._pid == os.getpid():
+            self._sock.close()
+        self._sock = None
+
+    def info(self):
+        """Returns the service's img_size and puzzle types."""
+        sock = self._connection()
+        sock.sendall(HEADER.pack(MAGIC, REQUEST_INFO, 0, 0, 0))
+        return json.loads(self._read_reply(sock, REQUEST_INFO))
+
+    def request(self, entries, seed, priority=PRIORITY_TRAIN):
+        """
+        Requests the (puzzle_type, count) pairs in entries.
+        Returns (inputs, targets, descriptions) with rows grouped in entry order.
+        """
+        sock = self._connection()
+        sock.sendall(encode_sample_request(entries, seed, priority))
+        magic, kind, flag, _, length = HEADER.unpack(self._recv_exactly(sock, HEADER.size))
+        if magic != MAGIC or kind != REQUEST_SAMPLES:
+            raise ConnectionError("Malformed reply from puzzle service")
+        if flag == STATUS_ERROR:
+            raise RuntimeError(f"Puzzle service error: {self._recv_exactly(sock, length).decode()}")
+
+        n, img_size = struct.unpack('!IH', self._recv_exactly(sock, 6))
+        descriptions = []
+        received = 6
+        for _ in range(n):
+            size, = struct.unpack('!I', self._recv_exactly(sock, 4))
+            descriptions.append(self._recv_exactly(sock, size).decode())
+            received += 4 + size
+
+        # Images are received straight into their arrays
+        images = np.empty((2, n, img_size, img_size, 3), dtype=np.uint8)
+        if received + images.nbytes != length:
+            raise ConnectionError("Malformed reply from puzzle service")
+        self._recv_into(sock, memoryview(images).cast('B'))
+        return images[0], images[1], descriptions
+
+    def _read_reply(self, sock, expected_kind):
+        magic, kind, flag, _, length = HEADER.unpack(self._recv_exactly(sock, HEADER.size))
+        if magic != MAGIC or kind != expected_kind:
+            raise ConnectionError("Malformed reply from puzzle service")
+        payload = self._recv_exactly(sock, length)
+        if flag == STATUS_ERROR:
+            raise RuntimeError(f"Puzzle service error: {payload.decode()}")
+        return payload
+
+    def _recv_exactly(self, sock, size):
+        buffer = bytearray(size)
+        self._recv_into(sock, memoryview(buffer))
+        return bytes(buffer)
+
+    def _recv_into(self, sock, view):
+        while len(view):
+            received = sock.recv_into(view)
+            if received == 0:
+                raise ConnectionError("Puzzle service closed the connection")
+            view = view[received:]
+
+class PuzzleServiceDataset(Dataset):
+    """
+    An InterleavedPuzzleDataset whose samples are rendered by a PuzzleService.
+
+    It holds only the manifest of puzzle types; every fetch is a request to
+    the service. __getitems__ sends a whole DataLoader batch as one request, so
+    use collate_fn=collate_puzzle_batch as with the local dataset. Set
+    priority=PRIORITY_EVAL for evaluation sets. Sudoku is not supported.
+    """
+    def __init__(self, socket_path, puzzle_counts, priority=PRIORITY_TRAIN):
+        if puzzle_counts.get('sudoku', 0) > 0:
+            raise ValueError("Sudoku needs puzzle data and cannot be served by the puzzle service")
+        self.client = PuzzleServiceClient(socket_path)
+        self.priority = priority
+        info = self.client.info()
+        self.img_size = info['img_size']
+        unknown = {t for t, count in puzzle_counts.items() if count > 0} - set(info['puzzle_types'])
+        if unknown:
+            raise ValueError(f"The puzzle service does not serve: {sorted(unknown)}")
+
+        self.puzzle_manifest = []
+        for puzzle_type, count in puzzle_counts.items():
+            self.puzzle_manifest.extend([(puzzle_type, None)] * count)
+        random.shuffle(self.puzzle_manifest)
+
+    def __len__(self):
+        return len(self.puzzle_manifest)
+
+    def __getitem__(self, idx):
+        inputs, targets, descriptions = self.client.request([(self.puzzle_manifest[idx][0], 1)], random.getrandbits(64), self.priority)
+        return batch_to_tensor(inputs)[0], batch_to_tensor(targets)[0], descriptions[0]
+
+    def __getitems__(self, indices):
+        # --- 1. Ask for each puzzle type once, in order of first appearance ---
+        groups = {}
+        for pos, idx in enumerate(indices):
+            groups.setdefault(self.puzzle_manifest[idx][0], []).append(pos)
+        entries = [(puzzle_type, len(positions)) for puzzle_type, positions in groups.items()]
+        inputs, targets, row_descriptions = self.client.request(entries, random.getrandbits(64), self.priority)
+
+        # --- 2. Restore the requested order ---
+        order = np.empty(len(indices), dtype=np.int64)
+        descriptions = [None] * len(indices)
+        start = 0
+        for positions in groups.values():
+            for row, pos in enumerate(positions, start):
+                order[pos] = row
+                descriptions[pos] = row_descriptions[row]
+            start += len(positions)
+        return PuzzleBatch(batch_to_tensor(inputs, order), batch_to_tensor(targets, order), descriptions)
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve rendered puzzles over a Unix socket.")
+    parser.add_argument('--socket', default='/tmp/puzzle_service.sock')
+    parser.add_argument('--img-size', type=int, default=384)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--prerender', nargs='*', default=[], help="Finite puzzle types to serve from memory")
+    args = parser.parse_args()
+    PuzzleService(args.socket, img_size=args.img_size, num_workers=args.workers, prerender=args.prerender).run()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1 @@
+# puzzles/__init__.py
@@ -1,15 +1,34 @@
 # puzzles/algebra.py
-import random
 from PIL import ImageDraw, ImageFont
 from .base_puzzle import BasePuzzle
+from utils.rng import random
 
 class AlgebraPuzzle(BasePuzzle):
+    VARIABLES = ['x', 'y', 'z']
+
     def generate(self):
-        variable = random.choice(['x', 'y', 'z'])
+        return self.render(self.sample_params())
+
+    def sample_params(self):
+        variable = random.choice(self.VARIABLES)
         solution = random.randint(-5, 6)
         
         a = random.randint(1, 6)
         b = random.randint(-10, 11)
+        return (variable, a, b, solution)
+
+    def enumerate_params(self):
+        for variable in self.VARIABLES:
+            for a in range(1, 7):
+                for b in range(-10, 12):
+                    for solution in range(-5, 7):
+                        yield (variable, a, b, solution)
+
+    def param_probability(self, params):
+        return 1 / (len(self.VARIABLES) * 6 * 22 * 12)
+
+    def render(self, params):
+        variable, a, b, solution = params
         c = a * solution + b
         
         problem_str = f"{a}{variable} {'+' if b >= 0 else '-'} {abs(b)} = {c}\n\n{variable} = ?"
@@ -30,6 +49,7 @@ class AlgebraPuzzle(BasePuzzle):
         draw_out = ImageDraw.Draw(target_image)
         draw_out.text((self.img_size/2, self.img_size/2), answer_str, fill=self.line_color, font=font, anchor='mm', align='center')
         
-        description = "Please solve for the variable."
-        
-        return input_image, target_image, description
\ No newline at end of file
+        return input_image, target_image, self.describe(params)
+
+    def describe(self, params):
+        return "Please solve for the variable."
\ No newline at end of file
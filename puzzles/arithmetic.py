@@ -1,42 +1,106 @@
 # puzzles/arithmetic.py
-import random
-from PIL import ImageDraw, ImageFont
+import numpy as np
 from .base_puzzle import BasePuzzle
+from utils.sprite_atlas import TEXT_ATLAS, paste_text
+from utils.rng import random
 
 class ArithmeticPuzzle(BasePuzzle):
+    """
+    Shows a one-line arithmetic problem and asks for the question mark to be replaced by the answer.
+
+    Text is stamped from the shared text atlas, so each distinct problem string
+    is rasterized once. generate_batch() samples all problems with NumPy.
+    """
+    FONT_SIZE = 50
+
     def generate(self):
-        try:
-            font = ImageFont.load_default(size=50)
-        except AttributeError:
-            font = ImageFont.load_default()
-            
+        return self.render(self.sample_params())
+
+    def sample_params(self):
         if random.random() > 0.4:
             # Simple arithmetic
-            a, b = random.randint(1, 10), random.randint(1, 10)
-            op = random.choice(['+', 'x'])
-            problem_str = f"{a} {op} {b} = ?"
-            answer = a + b if op == '+' else a * b
-        else:
-            # With parentheses
-            a, b, c = random.randint(1, 9), random.randint(1, 9), random.randint(2, 5)
-            if random.random() > 0.5:
-                problem_str = f"({a} + {b}) x {c} = ?"
-                answer = (a + b) * c
+            return ('simple', random.randint(1, 10), random.choice(['+', 'x']), random.randint(1, 10))
+        # With parentheses
+        a, b, c = random.randint(1, 9), random.randint(1, 9), random.randint(2, 5)
+        form = 'sum_first' if random.random() > 0.5 else 'product_first'
+        return (form, a, b, c)
+
+    def enumerate_params(self):
+        for a in range(1, 11):
+            for op in ['+', 'x']:
+                for b in range(1, 11):
+                    yield ('simple', a, op, b)
+        for form in ['sum_first', 'product_first']:
+            for a in range(1, 10):
+                for b in range(1, 10):
+                    for c in range(2, 6):
+                        yield (form, a, b, c)
+
+    def param_probability(self, params):
+        if params[0] == 'simple':
+            return 0.6 * 1 / 10 * 1 / 2 * 1 / 10
+        return 0.4 * 0.5 * 1 / 9 * 1 / 9 * 1 / 4
+
+    def generate_batch(self, n, rng=None, out=None):
+        rng = self._batch_rng(rng)
+        inputs, targets = self._new_batch_arrays(n, out)
+
+        # --- 1. Sample every problem with the same distribution as generate() ---
+        simple = rng.random(n) > 0.4
+        sum_first = rng.random(n) > 0.5
+        simple_ab = rng.integers(1, 11, size=(n, 2))
+        ops = np.where(rng.random(n) < 0.5, '+', 'x')
+        nested_ab = rng.integers(1, 10, size=(n, 2))
+        nested_c = rng.integers(2, 6, size=n)
+
+        # --- 2. Stamp the problem and answer onto blank canvases ---
+        blank = np.asarray(self._create_new_image())
+        center = (self.img_size / 2, self.img_size / 2)
+        descriptions = []
+        for i in range(n):
+            if simple[i]:
+                params = ('simple', int(simple_ab[i, 0]), str(ops[i]), int(simple_ab[i, 1]))
             else:
-                problem_str = f"{a} + ({b} x {c}) = ?"
-                answer = a + (b * c)
-        
-        answer_str = problem_str.replace('?', str(answer))
-        
+                params = ('sum_first' if sum_first[i] else 'product_first', int(nested_ab[i, 0]), int(nested_ab[i, 1]), int(nested_c[i]))
+            problem_str, answer_str = self._problem_strings(params)
+            inputs[i] = blank
+            targets[i] = blank
+            TEXT_ATLAS.stamp(inputs[i], center, problem_str, self.FONT_SIZE, self.line_color)
+            TEXT_ATLAS.stamp(targets[i], center, answer_str, self.FONT_SIZE, self.line_color)
+            descriptions.append(self.describe(params))
+
+        return inputs, targets, descriptions
+
+    def render(self, params):
+        problem_str, answer_str = self._problem_strings(params)
+        center = (self.img_size / 2, self.img_size / 2)
+
         # Create images
         input_image = self._create_new_image()
-        draw_in = ImageDraw.Draw(input_image)
-        draw_in.text((self.img_size/2, self.img_size/2), problem_str, fill=self.line_color, font=font, anchor='mm')
-        
+        paste_text(input_image, center, problem_str, self.FONT_SIZE, self.line_color)
+
         target_image = self._create_new_image()
-        draw_out = ImageDraw.Draw(target_image)
-        draw_out.text((self.img_size/2, self.img_size/2), answer_str, fill=self.line_color, font=font, anchor='mm')
-        
-        description = "Please replace the question mark with the correct number."
-        
-        return input_image, target_image, description
\ No newline at end of file
+        paste_text(target_image, center, answer_str, self.FONT_SIZE, self.line_color)
+
+        return input_image, target_image, self.describe(params)
+
+    def describe(self, params):
+        return "Please replace the question mark with the correct number."
+
+    def _problem_strings(self, params):
+        """Returns the problem text and the same text with the answer filled in."""
+        form = params[0]
+        if form == 'simple':
+            _, a, op, b = params
+            problem_str = f"{a} {op} {b} = ?"
+            answer = a + b if op == '+' else a * b
+        elif form == 'sum_first':
+            _, a, b, c = params
+            problem_str = f"({a} + {b}) x {c} = ?"
+            answer = (a + b) * c
+        else:
+            _, a, b, c = params
+            problem_str = f"{a} + ({b} x {c}) = ?"
+            answer = a + (b * c)
+
+        return problem_str, problem_str.replace('?', str(answer))
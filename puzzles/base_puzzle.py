@@ -1,10 +1,20 @@
 # puzzles/base_puzzle.py
 from abc import ABC, abstractmethod
+import numpy as np
 from PIL import Image, ImageDraw, ImageFont
 from utils.color_palette import MASTER_PALETTE, COLOR_NAME_MAP
+from utils.rng import random
+from utils.answers import record_answer, generate_with_answer
 
 class BasePuzzle(ABC):
-    """Abstract base class for all puzzle generators."""
+    """
+    Abstract base class for all puzzle generators.
+
+    Generators must be safe to call from several threads at once: draw random
+    numbers only through utils.rng (`random` and `np_random`), never mutate
+    instance state after __init__ except to fill a cache idempotently, and keep
+    shared caches in a utils.cache.LRUCache.
+    """
     def __init__(self, img_size):
         self.img_size = img_size
         self.bg_color = 'white'
@@ -20,6 +30,85 @@ class BasePuzzle(ABC):
         """
         pass
 
+    def generate_batch(self, n, rng=None, out=None):
+        """
+        Generates n puzzles at once.
+        Returns (inputs, targets, descriptions) where inputs and targets are
+        (n, img_size, img_size, 3) uint8 arrays. Pass `out` as an (inputs,
+        targets) pair of such arrays to render into them instead of allocating.
+
+        `rng` is a numpy Generator used by generators that vectorize their
+        sampling; it defaults to one seeded from `random` (see utils.rng). This
+        fallback simply loops over generate(), which draws from `random` itself.
+
+        Generators that record answers (utils.answers) must record one per
+        sample, or none at all, in the order of the rows.
+        """
+        inputs, targets = self._new_batch_arrays(n, out)
+        descriptions = []
+        for i in range(n):
+            (input_image, target_image, description), answer = generate_with_answer(self.generate)
+            inputs[i] = np.asarray(input_image.convert('RGB'))
+            targets[i] = np.asarray(target_image.convert('RGB'))
+            descriptions.append(description)
+            record_answer(answer)
+        return inputs, targets, descriptions
+
+    def sample_params(self):
+        """
+        Optional hook that splits generate() into sampling and rendering.
+        Should draw one parameter set (through utils.rng) that render()
+        accepts, so that generate() is render(sample_params()). Parameter sets
+        are tuples of JSON-serializable values; recipes.py stores them.
+        """
+        raise NotImplementedError(f"{type(self).__name__} does not separate sampling from rendering.")
+
+    def enumerate_params(self):
+        """
+        Optional hook for generators with a small, finite parameter space.
+        Should yield every parameter set the generator can produce; each one
+        must be accepted by render().
+        """
+        raise NotImplementedError(f"{type(self).__name__} does not declare a finite parameter space.")
+
+    def param_probability(self, params):
+        """
+        Optional hook for generators with enumerate_params(). Should return the
+        probability that sample_params() draws params, so that a store of the
+        enumerated space (PrerenderedPuzzle) can be drawn from like generate().
+        """
+        raise NotImplementedError(f"{type(self).__name__} does not declare its sampling distribution.")
+
+    def render(self, params):
+        """
+        Renders one parameter set from sample_params() or enumerate_params().
+        Should return a tuple of (input_image, target_image, text_description).
+        """
+        raise NotImplementedError(f"{type(self).__name__} does not declare a finite parameter space.")
+
+    def describe(self, params):
+        """
+        Optional hook that returns the text description render(params) would
+        return, without drawing anything. Must not draw random numbers.
+        """
+        raise NotImplementedError(f"{type(self).__name__} cannot describe a sample without rendering it.")
+
     def _create_new_image(self):
         """Creates a new blank RGB image."""
-        return Image.new('RGB', (self.img_size, self.img_size), self.bg_color)
\ No newline at end of file
+        return Image.new('RGB', (self.img_size, self.img_size), self.bg_color)
+
+    def _new_batch_arrays(self, n, out=None):
+        """Allocates the input and target arrays for a batch of n puzzles, or checks the ones passed as `out`."""
+        shape = (n, self.img_size, self.img_size, 3)
+        if out is None:
+            return np.empty(shape, dtype=np.uint8), np.empty(shape, dtype=np.uint8)
+        inputs, targets = out
+        for arr in (inputs, targets):
+            if arr.shape != shape or arr.dtype != np.uint8:
+                raise ValueError(f"out arrays must be uint8 with shape {shape}, got {arr.dtype} {arr.shape}")
+        return inputs, targets
+
+    @staticmethod
+    def _batch_rng(rng):
+        """Returns rng, or a numpy Generator seeded from `random` so random.seed() still applies."""
+        return rng if rng is not None else np.random.default_rng(random.getrandbits(64))
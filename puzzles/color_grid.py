@@ -1,10 +1,26 @@
 # puzzles/color_grid.py
 
-import random
-from PIL import ImageDraw
+import numpy as np
+from PIL import Image, ImageColor, ImageDraw
 from .base_puzzle import BasePuzzle
+from utils.cache import LRUCache
+from utils.rng import random
 
 class ColorGridPuzzle(BasePuzzle):
+    """
+    Draws an empty rows x cols grid and asks for it to be colored from an array of color names.
+
+    generate_batch() never draws: each grid shape is drawn once into a map of
+    cell indices (with the grid lines as an extra index). The map has only a few
+    distinct pixel rows, so a sample's target is its cell colors looked up in
+    those rows, then gathered row by row into the canvas.
+    """
+    GRID_LINE = 255 # Index of the grid lines in a cell map
+
+    def __init__(self, img_size):
+        super().__init__(img_size)
+        self._cell_maps = LRUCache(64)
+
     def generate(self):
         rows = random.randint(2, 5)
         cols = random.randint(2, 5)
@@ -52,3 +68,58 @@ class ColorGridPuzzle(BasePuzzle):
         for c in range(cols + 1):
             x = c * (self.img_size / cols)
             draw.line((x, 0, x, self.img_size), fill=self.line_color, width=2)
+
+    def generate_batch(self, n, rng=None, out=None):
+        rng = self._batch_rng(rng)
+        inputs, targets = self._new_batch_arrays(n, out)
+        descriptions = []
+
+        # --- 1. Sample every grid shape and cell color up front ---
+        color_names = list(self.color_name_map.values())
+        color_hex_map = {v: k for k, v in self.color_name_map.items()}
+        lut = np.zeros((256, 3), dtype=np.uint8)
+        lut[self.GRID_LINE] = ImageColor.getrgb(self.line_color)
+        bg_rgb = ImageColor.getrgb(self.bg_color)
+        color_rgb = np.array([ImageColor.getrgb(color_hex_map[name]) for name in color_names], dtype=np.uint8)
+        shapes = rng.integers(2, 6, size=(n, 2))
+        cell_colors = rng.integers(len(color_names), size=(n, 25))
+
+        # --- 2. Look up each sample's cells in the cached cell map of its shape ---
+        for i, (rows, cols) in enumerate(shapes.tolist()):
+            unique_rows, row_ids, empty_grid = self._cell_maps.get_or_create((rows, cols), lambda: self._build_cell_map(rows, cols, lut, bg_rgb))
+            num_cells = rows * cols
+            colors = cell_colors[i, :num_cells]
+
+            inputs[i] = empty_grid
+            lut[:num_cells] = color_rgb[colors]
+            np.take(lut[unique_rows], row_ids, axis=0, out=targets[i])
+
+            names = [color_names[c] for c in colors.tolist()]
+            array_string = "[" + ", ".join(f"[{', '.join(names[r * cols:(r + 1) * cols])}]" for r in range(rows)) + "]"
+            descriptions.append(f"Color the grid according to the array: {array_string}")
+
+        return inputs, targets, descriptions
+
+    def _build_cell_map(self, rows, cols, lut, bg_rgb):
+        """
+        Draws a grid exactly like generate(), but filling cell r * cols + c with its own index.
+        Returns the distinct pixel rows of that map, the row id of every pixel row, and the empty grid image.
+        """
+        cell_map = Image.new('L', (self.img_size, self.img_size), 0)
+        draw = ImageDraw.Draw(cell_map)
+        cell_w, cell_h = self.img_size / cols, self.img_size / rows
+        for r in range(rows):
+            for c in range(cols):
+                draw.rectangle((c * cell_w, r * cell_h, (c + 1) * cell_w, (r + 1) * cell_h), fill=r * cols + c)
+        for r in range(rows + 1):
+            y = r * (self.img_size / rows)
+            draw.line((0, y, self.img_size, y), fill=self.GRID_LINE, width=2)
+        for c in range(cols + 1):
+            x = c * (self.img_size / cols)
+            draw.line((x, 0, x, self.img_size), fill=self.GRID_LINE, width=2)
+        unique_rows, row_ids = np.unique(np.asarray(cell_map), axis=0, return_inverse=True)
+        empty_lut = lut.copy()
+        empty_lut[:rows * cols] = bg_rgb
+        empty_grid = empty_lut[unique_rows][row_ids.ravel()]
+        empty_grid.flags.writeable = False
+        return unique_rows, row_ids.ravel(), empty_grid
@@ -1,10 +1,11 @@
 # puzzles/graph.py
 
-import random
 import math
 import numpy as np
 from PIL import ImageDraw, ImageFont
 from .base_puzzle import BasePuzzle
+from utils.rng import random
+from utils.profiling import stage
 
 class GraphPuzzle(BasePuzzle):
     """
@@ -27,7 +28,8 @@ class GraphPuzzle(BasePuzzle):
         origin, x_scale, y_scale = self._draw_grid(draw, padding, axis_range)
 
         # Generate the data for a random plot type
-        plot_type, plot_data, plot_str = self._generate_plot_data(axis_range)
+        with stage('sample'):
+            plot_type, plot_data, plot_str = self._generate_plot_data(axis_range)
         
         # Choose a color for the plot
         color_hex, color_name = random.choice(list(self.color_name_map.items()))
@@ -43,7 +45,8 @@ class GraphPuzzle(BasePuzzle):
         target_image = input_image.copy()
         draw_target = ImageDraw.Draw(target_image)
         
-        self._plot_item(draw_target, plot_type, plot_data, origin, x_scale, y_scale, axis_range, color_hex)
+        with stage('render'):
+            self._plot_item(draw_target, plot_type, plot_data, origin, x_scale, y_scale, axis_range, color_hex)
         
         description = f"Please plot the item in {color_name}."
         
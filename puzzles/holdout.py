@@ -0,0 +1,78 @@
+# puzzles/holdout.py
+import numpy as np
+from .base_puzzle import BasePuzzle
+from utils.holdout import params_key, content_key
+from utils.answers import record_answer, collect_answers, generate_with_answer
+
+def has_params(generator):
+    """Whether a generator separates sampling from rendering (implements sample_params())."""
+    return type(generator).sample_params is not BasePuzzle.sample_params
+
+class HoldoutPuzzle(BasePuzzle):
+    """
+    Wraps a generator so it never produces a sample in a HoldoutFilter.
+
+    Generators with sample_params() are checked before rendering, by their
+    canonical parameter key, so a rejected draw costs one filter lookup.
+    Others are checked after rendering by a digest of the sample, which keeps
+    their batched generate_batch(); generators with parameters are sampled
+    one at a time. Either way a held-out sample is simply drawn again.
+    """
+    def __init__(self, generator, puzzle_type, holdout, max_attempts=1000):
+        super().__init__(generator.img_size)
+        kind = holdout.types[puzzle_type]
+        if kind != ('params' if has_params(generator) else 'content'):
+            raise ValueError(f"The holdout has {kind} keys for {puzzle_type}, which its generator does not produce")
+        if kind == 'content' and holdout.img_size != generator.img_size:
+            raise ValueError(f"The holdout's {puzzle_type} samples are {holdout.img_size} pixels, not {generator.img_size}")
+        self.generator = generator
+        self.puzzle_type = puzzle_type
+        self.holdout = holdout
+        self.kind = kind
+        self.max_attempts = max_attempts
+
+    def _exhausted(self):
+        return RuntimeError(f"{self.max_attempts} {self.puzzle_type} samples in a row were held out; is its whole space in the holdout?")
+
+    def sample_params(self):
+        if self.kind != 'params':
+            return super().sample_params()
+        for _ in range(self.max_attempts):
+            params = self.generator.sample_params()
+            if params_key(self.puzzle_type, params) not in self.holdout:
+                return params
+        raise self._exhausted()
+
+    def render(self, params):
+        return self.generator.render(params)
+
+    def describe(self, params):
+        return self.generator.describe(params)
+
+    def generate(self):
+        if self.kind == 'params':
+            return self.render(self.sample_params())
+        for _ in range(self.max_attempts):
+            (input_image, target_image, description), answer = generate_with_answer(self.generator.generate)
+            key = content_key(self.puzzle_type, np.asarray(input_image.convert('RGB')), np.asarray(target_image.convert('RGB')), description)
+            if key not in self.holdout:
+                record_answer(answer) # Only the answer of the sample that is kept
+                return input_image, target_image, description
+        raise self._exhausted()
+
+    def generate_batch(self, n, rng=None, out=None):
+        if self.kind == 'params':
+            return super().generate_batch(n, rng, out)
+        # Keep the generator's batched path and redraw only the rows that are held out
+        with collect_answers() as answers:
+            inputs, targets, descriptions = self.generator.generate_batch(n, rng, out)
+        for i in range(n):
+            if content_key(self.puzzle_type, inputs[i], targets[i], descriptions[i]) in self.holdout:
+                (input_image, target_image, descriptions[i]), answer = generate_with_answer(self.generate)
+                inputs[i] = np.asarray(input_image.convert('RGB'))
+                targets[i] = np.asarray(target_image.convert('RGB'))
+                if answers:
+                    answers[i] = answer
+        for answer in answers:
+            record_answer(answer)
+        return inputs, targets, descriptions
@@ -1,9 +1,9 @@
 # puzzles/inscribed_circle.py
 
-import random
 import numpy as np
 from PIL import ImageDraw
 from .base_puzzle import BasePuzzle
+from utils.rng import random
 
 class InscribedCirclePuzzle(BasePuzzle):
     def generate(self):
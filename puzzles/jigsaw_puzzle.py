@@ -1,8 +1,8 @@
 # puzzles/jigsaw_puzzle.py
 
-import random
 from PIL import Image, ImageDraw
 from .base_puzzle import BasePuzzle
+from utils.rng import random
 
 class JigsawPuzzle(BasePuzzle):
     """
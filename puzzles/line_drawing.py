@@ -1,13 +1,22 @@
 # puzzles/line_drawing.py
-import random
 import numpy as np
-from PIL import ImageDraw
+from PIL import Image, ImageColor, ImageDraw
 from .base_puzzle import BasePuzzle
+from utils.rng import random
 
 class LineDrawingPuzzle(BasePuzzle):
+    """
+    Draws two dots and asks for the line through them, extended to the canvas edges.
+
+    generate_batch() samples all dot pairs and colors with NumPy, stamps the
+    dots from one pre-drawn mask and only draws the lines themselves.
+    """
+    PADDING = 50
+    RADIUS = 15
+
     def generate(self):
-        padding = 50
-        radius = 15
+        padding = self.PADDING
+        radius = self.RADIUS
         
         p1 = self._get_random_point(padding)
         p2 = self._get_random_point(padding)
@@ -35,6 +44,52 @@ class LineDrawingPuzzle(BasePuzzle):
         description = f"Please draw a {color_name} line through the dots, extending to the edge of the canvas"
         return input_image, target_image, description
 
+    def generate_batch(self, n, rng=None, out=None):
+        rng = self._batch_rng(rng)
+        inputs, targets = self._new_batch_arrays(n, out)
+        padding, radius = self.PADDING, self.RADIUS
+        if self.img_size - 2 * padding < radius * 4:
+            raise ValueError(f"img_size {self.img_size} is too small to place two separate dots")
+
+        # --- 1. Sample every dot pair, redrawing second dots that are too close ---
+        p1 = rng.integers(padding, self.img_size - padding + 1, size=(n, 2))
+        p2 = rng.integers(padding, self.img_size - padding + 1, size=(n, 2))
+        too_close = np.hypot(*(p1 - p2).T) < radius * 4
+        while too_close.any():
+            p2[too_close] = rng.integers(padding, self.img_size - padding + 1, size=(too_close.sum(), 2))
+            too_close = np.hypot(*(p1 - p2).T) < radius * 4
+        colors = list(self.color_name_map.items())
+        color_ids = rng.integers(len(colors), size=n)
+
+        # --- 2. Stamp the dots and draw the lines ---
+        blank = np.asarray(self._create_new_image())
+        line_rgb = ImageColor.getrgb(self.line_color)
+        dot_mask = self._dot_mask(radius)
+        line_mask = Image.new('1', (self.img_size, self.img_size), 0)
+        draw_line = ImageDraw.Draw(line_mask)
+        descriptions = []
+        for i in range(n):
+            inputs[i] = blank
+            for x, y in (p1[i].tolist(), p2[i].tolist()):
+                inputs[i, y - radius:y + radius + 1, x - radius:x + radius + 1][dot_mask] = line_rgb
+            targets[i] = inputs[i]
+
+            color_hex, color_name = colors[color_ids[i]]
+            line_points = self._get_extended_line_points(tuple(p1[i].tolist()), tuple(p2[i].tolist()))
+            if line_points:
+                draw_line.rectangle((0, 0, self.img_size, self.img_size), fill=0)
+                draw_line.line(line_points, fill=1, width=5)
+                targets[i].reshape(-1, 3)[np.flatnonzero(np.asarray(line_mask))] = ImageColor.getrgb(color_hex)
+            descriptions.append(f"Please draw a {color_name} line through the dots, extending to the edge of the canvas")
+
+        return inputs, targets, descriptions
+
+    def _dot_mask(self, radius):
+        """The pixels _draw_dot() fills for a dot centered on (radius, radius)."""
+        mask = Image.new('1', (2 * radius + 1, 2 * radius + 1), 0)
+        ImageDraw.Draw(mask).ellipse((0, 0, 2 * radius, 2 * radius), fill=1)
+        return np.asarray(mask)
+
     def _get_random_point(self, padding):
         return (
             random.randint(padding, self.img_size - padding),
@@ -55,6 +110,8 @@ class LineDrawingPuzzle(BasePuzzle):
 
         if x2 == x1: # Vertical line
             return [(x1, 0), (x1, s)]
+        if y2 == y1: # Horizontal line
+            return [(0, y1), (s, y1)]
 
         m = (y2 - y1) / (x2 - x1)
         c = y1 - m * x1
@@ -1,9 +1,10 @@
 # puzzles/matrix_multiplication.py
 
 import numpy as np
-import random
 from PIL import ImageDraw, ImageFont
 from .base_puzzle import BasePuzzle
+from utils.rng import random, np_random
+from utils.answers import record_answer
 
 class MatrixMultiplicationPuzzle(BasePuzzle):
     def generate(self):
@@ -11,8 +12,8 @@ class MatrixMultiplicationPuzzle(BasePuzzle):
         n, m = random.randint(1, 3), random.randint(1, 3)
         i, j = m, random.randint(1, 3) # m must equal i
         
-        mat_A = np.random.randint(-9, 10, size=(n, m))
-        mat_B = np.random.randint(-9, 10, size=(i, j))
+        mat_A = np_random.randint(-9, 10, size=(n, m))
+        mat_B = np_random.randint(-9, 10, size=(i, j))
         mat_C = np.dot(mat_A, mat_B)
 
         # --- 2. Draw Images ---
@@ -25,6 +26,7 @@ class MatrixMultiplicationPuzzle(BasePuzzle):
         self._draw_equation(draw_target, mat_A, mat_B, mat_C)
 
         description = "Perform the matrix multiplication and fill in the result."
+        record_answer([*mat_C.shape, *mat_C.flatten()])
         return input_image, target_image, description
 
     def _draw_equation(self, draw, mat_a, mat_b, mat_c):
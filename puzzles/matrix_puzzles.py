@@ -1,17 +1,34 @@
 # puzzles/matrix_puzzles.py
-import random
+import itertools
 import numpy as np
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image, ImageColor, ImageDraw, ImageFont
 from .base_puzzle import BasePuzzle
+from utils.cache import LRUCache
 from utils.drawing_utils import rotate_points
+from utils.rng import random, np_random
+
+# Rendered panels shared by every matrix puzzle in this process. A panel is fully
+# described by its size, shape, quadrant colors and rotation, so puzzles that reuse
+# a panel (within one grid or across puzzles) only pay for a lookup.
+_PANEL_TABLE = LRUCache(max_entries=1024)
 
 # --- Base Class for all 3x3 Matrix Puzzles ---
 class BaseMatrixPuzzle(BasePuzzle):
-    """A base class for 3x3 grid puzzles to handle common drawing logic."""
+    """
+    A base class for 3x3 grid puzzles to handle common drawing logic.
+
+    Panels are returned as uint8 arrays from a bounded lookup table and the grid
+    is assembled by array tiling, so most of the work per puzzle is memory copies.
+    """
     def __init__(self, img_size):
         super().__init__(img_size)
         self.grid_size = 3
         self.panel_size = self.img_size // self.grid_size
+        self._line_rgb = ImageColor.getrgb(self.line_color)
+        self._blank_canvas = None
+        self._grid_rows = None
+        self._grid_cols = None
+        self._question_template = None
 
     def generate(self):
         panels, description = self._generate_panels()
@@ -23,40 +40,61 @@ class BaseMatrixPuzzle(BasePuzzle):
         raise NotImplementedError
 
     def _build_images_from_panels(self, panels):
-        # Create the complete target image
-        target_image = self._create_new_image()
-        for i in range(len(panels)):
-            row, col = i // self.grid_size, i % self.grid_size
-            target_image.paste(panels[i], (col * self.panel_size, row * self.panel_size))
-        
-        draw_target = ImageDraw.Draw(target_image)
-        self._draw_gridlines(draw_target)
+        if self._question_template is None:
+            self._build_grid_templates()
+        g, ps = self.grid_size, self.panel_size
 
-        # Create the input image by blanking out the last panel
-        input_image = target_image.copy()
-        draw_input = ImageDraw.Draw(input_image)
-        
-        final_cell_origin = ((self.grid_size - 1) * self.panel_size, (self.grid_size - 1) * self.panel_size)
-        draw_input.rectangle([final_cell_origin, (self.img_size, self.img_size)], fill=self.bg_color)
-        
-        self._draw_gridlines(draw_input)
-        
-        # Draw question mark
+        # Create the complete target image by tiling the panels into a blank canvas
+        target = self._blank_canvas.copy()
+        for i, panel in enumerate(panels):
+            row, col = i // g, i % g
+            target[row * ps:(row + 1) * ps, col * ps:(col + 1) * ps] = panel
+        target[self._grid_rows, :] = self._line_rgb
+        target[:, self._grid_cols] = self._line_rgb
+
+        # Create the input image by swapping in the blanked-out final cell with its question mark
+        final_cell_origin = (g - 1) * ps
+        input_arr = target.copy()
+        input_arr[final_cell_origin:, final_cell_origin:] = self._question_template[final_cell_origin:, final_cell_origin:]
+
+        return Image.fromarray(input_arr), Image.fromarray(target)
+
+    def _build_grid_templates(self):
+        """Renders the blank canvas, gridline rows/columns and the '?' cell once per generator."""
+        self._blank_canvas = np.asarray(self._create_new_image())
+
+        mask = Image.new('L', (self.img_size, self.img_size), 0)
+        self._draw_gridlines(ImageDraw.Draw(mask), fill=255)
+        mask = np.asarray(mask) > 0
+        self._grid_rows = np.flatnonzero(mask.all(axis=1))
+        self._grid_cols = np.flatnonzero(mask.all(axis=0))
+
+        template = self._create_new_image()
+        draw = ImageDraw.Draw(template)
+        self._draw_gridlines(draw)
         try:
             q_font = ImageFont.load_default(size=self.panel_size // 4)
         except AttributeError:
             q_font = ImageFont.load_default()
+        final_cell_origin = ((self.grid_size - 1) * self.panel_size, (self.grid_size - 1) * self.panel_size)
         q_pos = (final_cell_origin[0] + self.panel_size/2, final_cell_origin[1] + self.panel_size/2)
-        draw_input.text(q_pos, "?", fill=self.line_color, font=q_font, anchor='mm')
-        
-        return input_image, target_image
+        draw.text(q_pos, "?", fill=self.line_color, font=q_font, anchor='mm')
+        self._question_template = np.asarray(template)
 
-    def _draw_gridlines(self, draw):
+    def _draw_gridlines(self, draw, fill=None):
+        fill = self.line_color if fill is None else fill
         for i in range(1, self.grid_size):
-            draw.line([(i * self.panel_size, 0), (i * self.panel_size, self.img_size)], fill=self.line_color, width=2)
-            draw.line([(0, i * self.panel_size), (self.img_size, i * self.panel_size)], fill=self.line_color, width=2)
+            draw.line([(i * self.panel_size, 0), (i * self.panel_size, self.img_size)], fill=fill, width=2)
+            draw.line([(0, i * self.panel_size), (self.img_size, i * self.panel_size)], fill=fill, width=2)
 
     def _draw_matrix_panel(self, quadrant_colors, shape, shape_rotation=0):
+        """Returns the panel as a read-only (panel_size, panel_size, 3) uint8 array."""
+        if shape in ('dots', 'circles'):
+            shape_rotation = 0 # Dot layouts are drawn unrotated
+        key = (self.panel_size, self.bg_color, shape, tuple(quadrant_colors), shape_rotation % 360)
+        return _PANEL_TABLE.get_or_create(key, lambda: self._render_matrix_panel(quadrant_colors, shape, shape_rotation % 360))
+
+    def _render_matrix_panel(self, quadrant_colors, shape, shape_rotation):
         img = Image.new('RGB', (self.panel_size, self.panel_size), self.bg_color)
         draw = ImageDraw.Draw(img)
         center = (self.panel_size / 2, self.panel_size / 2)
@@ -73,6 +111,14 @@ class BaseMatrixPuzzle(BasePuzzle):
             ]
             for color, pos in zip(quadrant_colors, positions):
                 if color: draw.ellipse(pos, fill=color)
+        elif shape == 'circles':
+            ps = self.panel_size
+            positions = [
+                (ps*.1, ps*.1, ps*.4, ps*.4), (ps*.6, ps*.1, ps*.9, ps*.4),
+                (ps*.1, ps*.6, ps*.4, ps*.9), (ps*.6, ps*.6, ps*.9, ps*.9)
+            ]
+            for color, pos in zip(quadrant_colors, positions):
+                if color: draw.ellipse(pos, fill=color)
         else:
             polys = []
             if shape == 'square':
@@ -93,7 +139,9 @@ class BaseMatrixPuzzle(BasePuzzle):
             rotated = [rotate_points(poly, center, shape_rotation) for poly in polys]
             for color, poly in zip(quadrant_colors, rotated):
                 if color: draw.polygon(poly, fill=color)
-        return img
+        arr = np.asarray(img)
+        arr.setflags(write=False)
+        return arr
 
 # --- Individual Matrix Puzzle Generators ---
 
@@ -165,7 +213,7 @@ class TricolorRotationMatrixPuzzle(BaseMatrixPuzzle):
         color_map = {colors[0]: colors[1], colors[1]: colors[2], colors[2]: colors[0]}
         
         for _ in range(self.grid_size):
-            quads_a = list(np.random.choice(colors + [None], 4))
+            quads_a = list(np_random.choice(colors + [None], 4))
             quads_b = [color_map.get(q) for q in quads_a]
             quads_c = [color_map.get(q) for q in quads_b]
             panels.extend([
@@ -177,45 +225,71 @@ class TricolorRotationMatrixPuzzle(BaseMatrixPuzzle):
         return panels, "Please fill in the missing cell based on the color rotation."
 
 class LatinSquareMatrixPuzzle(BaseMatrixPuzzle):
+    SHAPES = ['square', 'diamond', 'triangle', 'dots']
+    DESCRIPTION = "Please fill in the missing cell to complete the Latin Square."
+
     def _generate_panels(self):
-        shapes = random.sample(['square', 'diamond', 'triangle', 'dots'], 3)
+        grid_shapes, quad_colors = self.sample_params()
+        panels = [self._draw_matrix_panel(quad_colors, shape=s) for s in grid_shapes]
+        return panels, self.DESCRIPTION
+
+    def sample_params(self):
+        """Returns (grid_shapes, quad_colors), the same form as enumerate_params()."""
+        shapes = random.sample(self.SHAPES, 3)
         color = random.choice(self.master_palette)
-        quad_colors = [color if random.random() > 0.3 else None for _ in range(4)]
+        quad_colors = tuple(color if random.random() > 0.3 else None for _ in range(4))
         
-        row0 = np.random.permutation(shapes)
+        row0 = np_random.permutation(shapes)
         grid_shapes = np.array([np.roll(row0, i) for i in range(self.grid_size)])
         if random.random() > 0.5:
             grid_shapes = grid_shapes.T
-            
-        panels = [self._draw_matrix_panel(quad_colors, shape=s) for s in grid_shapes.flatten()]
-        return panels, "Please fill in the missing cell to complete the Latin Square."
+        return tuple(str(s) for s in grid_shapes.flatten()), quad_colors
+
+    def enumerate_params(self):
+        """Yields (grid_shapes, quad_colors); transposed grids that equal another row order are skipped."""
+        seen = set()
+        for row0 in itertools.permutations(self.SHAPES, self.grid_size):
+            grid_shapes = np.array([np.roll(row0, i) for i in range(self.grid_size)])
+            for grid in (grid_shapes, grid_shapes.T):
+                grid = tuple(str(s) for s in grid.flatten())
+                if grid in seen:
+                    continue
+                seen.add(grid)
+                for color in self.master_palette:
+                    for mask in range(1, 16):
+                        yield grid, tuple(color if mask >> i & 1 else None for i in range(4))
+                yield grid, (None, None, None, None) # Empty panels look the same in every color
+
+    def param_probability(self, params):
+        # Each grid is one of 24 ordered first rows, and its transpose is another row order, so grids
+        # are equally likely. Quadrants are colored with probability 0.7, and empty panels in any color
+        num_grids = len(list(itertools.permutations(self.SHAPES, self.grid_size)))
+        _, quad_colors = params
+        num_colored = sum(color is not None for color in quad_colors)
+        p = 0.7 ** num_colored * 0.3 ** (4 - num_colored) / num_grids
+        return p / len(self.master_palette) if num_colored else p
+
+    def render(self, params):
+        grid_shapes, quad_colors = params
+        panels = [self._draw_matrix_panel(quad_colors, shape=s) for s in grid_shapes]
+        input_image, target_image = self._build_images_from_panels(panels)
+        return input_image, target_image, self.DESCRIPTION
+
+    def describe(self, params):
+        return self.DESCRIPTION
 
 class ShapeSuperpositionMatrixPuzzle(BaseMatrixPuzzle):
     def _generate_panels(self):
         panels = []
-        ps = self.panel_size
-        pos = [
-            (ps*.1, ps*.1, ps*.4, ps*.4), (ps*.6, ps*.1, ps*.9, ps*.4),
-            (ps*.1, ps*.6, ps*.4, ps*.9), (ps*.6, ps*.6, ps*.9, ps*.9)
-        ]
-        
         for _ in range(self.grid_size):
             color = random.choice(self.master_palette)
-            ind_a = set(np.random.choice(4, random.randint(1, 3), replace=False))
-            ind_b = set(np.random.choice(4, random.randint(1, 3), replace=False))
+            ind_a = set(np_random.choice(4, random.randint(1, 3), replace=False))
+            ind_b = set(np_random.choice(4, random.randint(1, 3), replace=False))
             ind_c = ind_a.union(ind_b)
             
-            img_a = Image.new('RGB', (ps, ps), self.bg_color)
-            draw_a = ImageDraw.Draw(img_a)
-            img_b = Image.new('RGB', (ps, ps), self.bg_color)
-            draw_b = ImageDraw.Draw(img_b)
-            img_c = Image.new('RGB', (ps, ps), self.bg_color)
-            draw_c = ImageDraw.Draw(img_c)
-
-            for i in ind_a: draw_a.ellipse(pos[i], fill=color)
-            for i in ind_b: draw_b.ellipse(pos[i], fill=color)
-            for i in ind_c: draw_c.ellipse(pos[i], fill=color)
-            
-            panels.extend([img_a, img_b, img_c])
+            panels.extend([
+                self._draw_matrix_panel([color if i in ind else None for i in range(4)], 'circles')
+                for ind in (ind_a, ind_b, ind_c)
+            ])
             
         return panels, "Please fill in the missing cell by combining the shapes."
\ No newline at end of file
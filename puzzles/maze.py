@@ -1,10 +1,15 @@
 # puzzles/maze.py
 
-import random
 import numpy as np
 from collections import deque
 from PIL import Image, ImageDraw
 from .base_puzzle import BasePuzzle
+from utils.rng import random
+from utils.profiling import stage
+from utils.answers import record_answer
+
+# Answer codes of the steps along a solution path, by (row, column) offset
+_MOVES = {(-1, 0): 0, (0, 1): 1, (1, 0): 2, (0, -1): 3}
 
 class MazePuzzle(BasePuzzle):
     """
@@ -23,14 +28,18 @@ class MazePuzzle(BasePuzzle):
         description = f"Please fill the path between the dots in {path_color_name}."
 
         # --- 2. Generate and Solve the Maze ---
-        maze_grid = self._generate_maze_grid(w, h)
+        with stage('sample'):
+            maze_grid = self._generate_maze_grid(w, h)
         start_node, end_node = (1, 1), (h - 2, w - 2)
-        solution_path = self._solve_maze(maze_grid, start_node, end_node)
+        with stage('solve'):
+            solution_path = self._solve_maze(maze_grid, start_node, end_node)
 
         # --- 3. Draw Input and Target Images ---
-        input_image = self._draw_maze(maze_grid, start_node, end_node, start_color, end_color, path_color_hex, solution_path, draw_solution=False)
-        target_image = self._draw_maze(maze_grid, start_node, end_node, start_color, end_color, path_color_hex, solution_path, draw_solution=True)
+        with stage('render'):
+            input_image = self._draw_maze(maze_grid, start_node, end_node, start_color, end_color, path_color_hex, solution_path, draw_solution=False)
+            target_image = self._draw_maze(maze_grid, start_node, end_node, start_color, end_color, path_color_hex, solution_path, draw_solution=True)
 
+        record_answer([w] + [_MOVES[(r1 - r0, c1 - c0)] for (r0, c0), (r1, c1) in zip(solution_path, solution_path[1:])])
         return input_image, target_image, description
 
     def _generate_maze_grid(self, w, h):
@@ -1,11 +1,12 @@
 # puzzles/move_to_target.py
 
-import random
 import math
-import numpy as np
 from PIL import ImageDraw
 from .base_puzzle import BasePuzzle
-from utils.drawing_utils import draw_shape, rotate_points
+from utils.drawing_utils import rotate_points
+from utils.placement import PoissonDiskSampler
+from utils.sprite_atlas import paste_shape
+from utils.rng import random
 
 class MoveToTargetPuzzle(BasePuzzle):
     """
@@ -30,22 +31,21 @@ class MoveToTargetPuzzle(BasePuzzle):
         shape_size = self.img_size / 6
         padding = shape_size * 1.5
         
-        start_pos = (random.uniform(padding, self.img_size - padding), random.uniform(padding, self.img_size - padding))
-        target_pos = (random.uniform(padding, self.img_size - padding), random.uniform(padding, self.img_size - padding))
-        
-        while np.linalg.norm(np.array(start_pos) - np.array(target_pos)) < shape_size * 2:
-            target_pos = (random.uniform(padding, self.img_size - padding), random.uniform(padding, self.img_size - padding))
+        bounds = (padding, padding, self.img_size - padding, self.img_size - padding)
+        positions = []
+        while len(positions) < 2: # Only retried when the first point lands near the middle of the area
+            positions = PoissonDiskSampler(bounds, shape_size * 2).sample(2)
+        start_pos, target_pos = positions
 
         # Input image
         input_image = self._create_new_image()
         draw_input = ImageDraw.Draw(input_image)
-        draw_shape(draw_input, shape_type, start_pos, shape_size, color_hex)
+        paste_shape(input_image, shape_type, start_pos, shape_size, color_hex)
         self._draw_x_target(draw_input, target_pos, shape_size / 2)
         
         # Target image
         target_image = self._create_new_image()
-        draw_target = ImageDraw.Draw(target_image)
-        draw_shape(draw_target, shape_type, target_pos, shape_size, color_hex)
+        paste_shape(target_image, shape_type, target_pos, shape_size, color_hex)
 
         description = f"Move the {shape_type} to the target 'X'."
         return input_image, target_image, description
@@ -1,10 +1,13 @@
 # puzzles/object_counting.py
 
-import random
-import numpy as np
+import math
 from PIL import ImageDraw, ImageFont
 from .base_puzzle import BasePuzzle
 from utils.drawing_utils import draw_shape
+from utils.placement import PoissonDiskSampler
+from utils.sprite_atlas import paste_shape
+from utils.rng import random
+from utils.answers import record_answer
 
 class ObjectCountingPuzzle(BasePuzzle):
     """
@@ -14,11 +17,30 @@ class ObjectCountingPuzzle(BasePuzzle):
     1. Count a specific type of object.
     2. Identify the most common type of object.
     3. Count the number of distinct object types.
+
+    Objects never overlap. Dense scenes (large max_objects) shrink the objects
+    so that every requested object fits in the drawing area.
     """
+    def __init__(self, img_size, min_objects=8, max_objects=20):
+        super().__init__(img_size)
+        self.min_objects = min_objects
+        self.max_objects = max_objects
+
+        # Layout of the query box and the area the objects are scattered in
+        self.box_width = self.img_size * 0.18
+        self.padding = self.img_size * 0.05
+        self.draw_area = (self.box_width + self.padding, self.padding, self.img_size - self.padding, self.img_size - self.padding)
+
+        # Centers are kept 1.5 object sizes apart; leave headroom over the densest packing
+        area = (self.draw_area[2] - self.draw_area[0]) * (self.draw_area[3] - self.draw_area[1])
+        self.object_size = min(self.img_size / 15, math.sqrt(0.5 * area / max_objects) / 1.5)
+
     def generate(self):
         # --- 1. Setup Puzzle Parameters ---
-        num_types = random.choice([1, 2, 3])
-        total_objects = random.randint(8, 20)
+        sampler = PoissonDiskSampler(self.draw_area, self.object_size * 1.5)
+        positions = sampler.sample(random.randint(self.min_objects, self.max_objects))
+        total_objects = len(positions)
+        num_types = random.choice([n for n in [1, 2, 3] if n <= total_objects])
         
         all_shapes = ['circle', 'square', 'triangle', 'diamond', 'star', 'hexagon']
         chosen_shapes = random.sample(all_shapes, num_types)
@@ -55,27 +77,26 @@ class ObjectCountingPuzzle(BasePuzzle):
             # Find the full object prototype to use as the answer
             target_answer_data = next(p for p in object_prototypes if p['name'] == target_name)
             description = "Fill in the box with the most common object."
+            record_answer([2, all_shapes.index(target_answer_data['shape']), self.master_palette.index(target_answer_data['color'])])
         
         elif chosen_prompt == 'distinct_count':
             target_answer_data = num_types
             description = "Fill in the box with the number of distinct object types."
+            record_answer([1, num_types])
 
         else: # specific_count
             target_prototype = random.choice(object_prototypes)
             target_name = target_prototype['name']
             target_answer_data = counts[target_name]
             description = f"Fill in the box with the correct number of {target_name}."
+            record_answer([0, target_answer_data])
 
         # --- 4. Draw the Images ---
         input_image = self._create_new_image()
         draw_input = ImageDraw.Draw(input_image)
         
-        box_width = self.img_size * 0.18
-        padding = self.img_size * 0.05
-        draw_area_x_min = box_width + padding
-        
-        self._draw_scattered_objects(draw_input, objects_to_draw, draw_area_x_min, padding)
-        box_coords = self._draw_query_box(draw_input, box_width, padding, "?")
+        self._draw_scattered_objects(input_image, objects_to_draw, positions)
+        box_coords = self._draw_query_box(draw_input, self.box_width, self.padding, "?")
         
         target_image = input_image.copy()
         draw_target = ImageDraw.Draw(target_image)
@@ -89,18 +110,9 @@ class ObjectCountingPuzzle(BasePuzzle):
 
         return input_image, target_image, description
 
-    def _draw_scattered_objects(self, draw, objects, x_min, padding):
-        object_size = self.img_size / 15
-        placed_positions = []
-
-        for obj in objects:
-            pos = (0, 0)
-            for _ in range(10): # Max attempts to find a non-overlapping spot
-                pos = (random.uniform(x_min, self.img_size - padding), random.uniform(padding, self.img_size - padding))
-                if not any(np.linalg.norm(np.array(pos) - np.array(p)) < object_size * 1.5 for p in placed_positions):
-                    break
-            placed_positions.append(pos)
-            draw_shape(draw, obj['shape'], pos, object_size, obj['color'])
+    def _draw_scattered_objects(self, image, objects, positions):
+        for obj, pos in zip(objects, positions):
+            paste_shape(image, obj['shape'], pos, self.object_size, obj['color'])
 
     def _draw_query_box(self, draw, box_width, padding, text):
         box_height = box_width * 1.2
@@ -115,7 +127,8 @@ class ObjectCountingPuzzle(BasePuzzle):
     def _draw_text_in_box(self, draw, box_coords, text):
         center_x = (box_coords[0] + box_coords[2]) / 2
         center_y = (box_coords[1] + box_coords[3]) / 2
-        font_size = int((box_coords[3] - box_coords[1]) * 0.6)
+        # Shrink long answers (dense scenes) so they stay inside the box
+        font_size = int(min((box_coords[3] - box_coords[1]) * 0.6, (box_coords[2] - box_coords[0]) * 1.6 / max(len(text), 1)))
         try: font = ImageFont.load_default(size=font_size)
         except AttributeError: font = ImageFont.load_default()
         draw.text((center_x, center_y), text, fill=self.line_color, font=font, anchor="mm")
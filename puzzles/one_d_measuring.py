@@ -1,10 +1,11 @@
 # puzzles/one_d_measuring.py
 
-import random
 import numpy as np
 from PIL import ImageDraw, ImageFont
 from scipy.special import comb
 from .base_puzzle import BasePuzzle
+from utils.rng import random
+from utils.answers import record_answer
 
 class OneDMeasuringPuzzle(BasePuzzle):
     def generate(self):
@@ -49,6 +50,7 @@ class OneDMeasuringPuzzle(BasePuzzle):
         self._draw_measuring_scene(draw_target, draw_data, unit_pixel_length, box_size, color, str(answer))
         
         description = f"Given the unit distance, measure the length of the {self.color_name_map[color]} object."
+        record_answer([round(answer * 10)])
         return input_image, target_image, description
 
     def _draw_measuring_scene(self, draw, draw_data, unit_len, box_size, color, answer_text):
@@ -0,0 +1,143 @@
+# puzzles/prerendered.py
+
+import zlib
+import numpy as np
+from PIL import Image
+from .base_puzzle import BasePuzzle
+from utils.change_mask import encode_delta, apply_delta
+from utils.rng import random
+from utils.answers import record_answer, collect_answers
+
+class PrerenderedPuzzle(BasePuzzle):
+    """
+    Serves a finite-space generator from a store of pre-rendered samples.
+
+    Every distinct parameter set from generator.enumerate_params() is rendered
+    once up front. Each image is stored as its background color plus a
+    zlib-compressed crop of everything that differs from it, and identical
+    images are stored once (many puzzles share an input or a target). A target
+    that is its input plus a small edit is instead stored as a delta: the
+    crop of the changed region, pasted over the decoded input. generate()
+    draws each distinct sample with the summed param_probability() of the
+    parameter sets that render it, so the store keeps the generator's mix, and
+    only has to inflate the crops. Generators without param_probability() are
+    assumed to draw their parameter sets uniformly; if they do not, the
+    store's mix differs from theirs.
+    Parameter sets for which `exclude(params)` is true (e.g. held-out ones)
+    are left out of the store. Answers the generator records (utils.answers)
+    are kept with their samples and recorded again when they are served.
+    """
+    def __init__(self, generator, max_samples=100_000, exclude=None):
+        super().__init__(generator.img_size)
+        self.generator = generator
+
+        image_index = {} # Encoded image -> position in self._images
+        description_index = {}
+        self._images = []
+        samples = {} # (input, target, description) ids, deduplicated -> answer
+        weights = {} # The same keys -> probability of drawing them
+
+        for params in generator.enumerate_params():
+            if exclude is not None and exclude(params):
+                continue
+            with collect_answers() as answers:
+                input_image, target_image, description = generator.render(params)
+            input_arr = np.asarray(input_image.convert('RGB'))
+            input_id = self._store_image(input_arr, image_index)
+            key = (
+                input_id,
+                self._store_image(np.asarray(target_image.convert('RGB')), image_index, base=(input_id, input_arr)),
+                description_index.setdefault(description, len(description_index)),
+            )
+            samples.setdefault(key, answers[-1] if answers else None)
+            try:
+                weights[key] = weights.get(key, 0.0) + generator.param_probability(params)
+            except NotImplementedError:
+                weights[key] = weights.get(key, 0.0) + 1.0
+            # Checked after deduplication, so a space of exactly max_samples distinct samples fits
+            if len(samples) > max_samples:
+                raise ValueError(
+                    f"{type(generator).__name__} has more than {max_samples} distinct samples; "
+                    "narrow its parameter space or raise max_samples."
+                )
+
+        self._descriptions = list(description_index)
+        self._samples = np.array(list(samples), dtype=np.int32).reshape(-1, 3)
+        self._answers = list(samples.values())
+        # Normalized, as excluded parameter sets leave the rest to be drawn like a generator that redraws them
+        self._weights = np.array([weights[key] for key in samples], dtype=np.float64)
+        self._weights /= self._weights.sum()
+        self._cum_weights = np.cumsum(self._weights).tolist()
+        self._blanks = {} # Background color -> blank canvas array, for generate_batch()
+
+    def __len__(self):
+        """The exact number of distinct (input, target, description) samples."""
+        return len(self._samples)
+
+    @property
+    def stored_bytes(self):
+        return sum(len(image[2]) for image in self._images)
+
+    def generate(self):
+        sample = random.choices(range(len(self._samples)), cum_weights=self._cum_weights)[0]
+        input_id, target_id, description_id = self._samples[sample]
+        record_answer(self._answers[sample])
+        return self._load_image(input_id), self._load_image(target_id), self._descriptions[description_id]
+
+    def generate_batch(self, n, rng=None, out=None):
+        rng = self._batch_rng(rng)
+        inputs, targets = self._new_batch_arrays(n, out)
+        descriptions = []
+        chosen = rng.choice(len(self._samples), size=n, p=self._weights)
+        for i, (input_id, target_id, description_id) in enumerate(self._samples[chosen].tolist()):
+            self._load_array(input_id, inputs[i])
+            self._load_array(target_id, targets[i])
+            descriptions.append(self._descriptions[description_id])
+        for sample in chosen.tolist():
+            record_answer(self._answers[sample])
+        return inputs, targets, descriptions
+
+    def _store_image(self, arr, image_index, base=None):
+        """Stores an (H, W, 3) array; with base=(image_id, array), as a delta from that image if that is smaller."""
+        bg = tuple(int(v) for v in arr[0, 0])
+        rows = np.flatnonzero((arr != bg).any(axis=(1, 2)))
+        cols = np.flatnonzero((arr != bg).any(axis=(0, 2)))
+        if len(rows) == 0:
+            bbox = None
+            data = b''
+        else:
+            bbox = (int(cols[0]), int(rows[0]), int(cols[-1]) + 1, int(rows[-1]) + 1)
+            data = zlib.compress(np.ascontiguousarray(arr[bbox[1]:bbox[3], bbox[0]:bbox[2]]).tobytes(), 1)
+        encoded = (bg, bbox, data, None)
+        if base is not None:
+            delta_bbox, delta = encode_delta(base[1], arr)
+            if len(delta) < len(data):
+                encoded = (None, delta_bbox, delta, base[0])
+        if encoded not in image_index:
+            image_index[encoded] = len(self._images)
+            self._images.append(encoded)
+        return image_index[encoded]
+
+    def _load_image(self, image_id):
+        bg, bbox, data, base_id = self._images[image_id]
+        if base_id is not None:
+            return Image.fromarray(apply_delta(np.array(self._load_image(base_id)), bbox, data))
+        image = Image.new('RGB', (self.img_size, self.img_size), bg)
+        if bbox is not None:
+            size = (bbox[2] - bbox[0], bbox[3] - bbox[1])
+            image.paste(Image.frombytes('RGB', size, zlib.decompress(data)), bbox[:2])
+        return image
+
+    def _load_array(self, image_id, out):
+        """Decodes an image straight into an (img_size, img_size, 3) uint8 array."""
+        bg, bbox, data, base_id = self._images[image_id]
+        if base_id is not None:
+            self._load_array(base_id, out)
+            apply_delta(out, bbox, data)
+            return
+        if bg not in self._blanks:
+            self._blanks[bg] = np.asarray(Image.new('RGB', (self.img_size, self.img_size), bg))
+        out[...] = self._blanks[bg]
+        if bbox is not None:
+            x0, y0, x1, y1 = bbox
+            out[y0:y1, x0:x1] = np.frombuffer(zlib.decompress(data), dtype=np.uint8).reshape(y1 - y0, x1 - x0, 3)
@@ -1,36 +1,71 @@
 # puzzles/shape_augmentation.py
-import random
-from PIL import Image, ImageDraw
+from PIL import Image
 from .base_puzzle import BasePuzzle
-from utils.drawing_utils import draw_shape
+from utils.sprite_atlas import paste_shape
+from utils.rng import random
 
 class ShapeAugmentationPuzzle(BasePuzzle):
+    """
+    Draws a shape and asks for a single transformation of it.
+
+    `transformations` restricts the puzzle to a subset of TRANSFORMATIONS and
+    `colors` restricts the palette used for shapes, backgrounds and borders.
+    A single transformation with a few fixed colors gives a parameter space
+    small enough to enumerate and pre-render.
+    """
+    SHAPES = ['circle', 'triangle', 'hexagon', 'square', 'diamond', 'trapezoid', 'arrow', 'star']
+    TRANSFORMATIONS = ['rotate', 'flip', 'recolor', 'resize', 'stretch', 'background', 'corner', 'edge', 'replace', 'border']
+
+    def __init__(self, img_size, transformations=None, colors=None):
+        super().__init__(img_size)
+        self.transformations = list(transformations or self.TRANSFORMATIONS)
+        unknown = set(self.transformations) - set(self.TRANSFORMATIONS)
+        if unknown:
+            raise ValueError(f"Unknown transformations: {sorted(unknown)}")
+        self.colors = list(colors or self.master_palette)
+
     def generate(self):
-        shapes = ['circle', 'triangle', 'hexagon', 'square', 'diamond', 'trapezoid', 'arrow', 'star']
-        
-        # Initial parameters
-        shape = random.choice(shapes)
-        color_hex = random.choice(self.master_palette)
+        return self.render(self.sample_params())
+
+    def sample_params(self):
+        shape = random.choice(self.SHAPES)
+        color_hex = random.choice(self.colors)
+        transformation = random.choice(self.transformations)
+        option = random.choice(self._transformation_options(shape, transformation))
+        return (shape, color_hex, transformation, option)
+
+    def enumerate_params(self):
+        for shape in self.SHAPES:
+            for color_hex in self.colors:
+                for transformation in self.transformations:
+                    for option in self._transformation_options(shape, transformation):
+                        yield (shape, color_hex, transformation, option)
+
+    def param_probability(self, params):
+        shape, _, transformation, _ = params
+        options = self._transformation_options(shape, transformation)
+        return 1 / (len(self.SHAPES) * len(self.colors) * len(self.transformations) * len(options))
+
+    def render(self, params):
+        shape, color_hex, transformation, option = params
         bg_color_hex = '#FFFFFF' # Default background color
         center = (self.img_size / 2, self.img_size / 2)
         size = self.img_size / 3
-        
+
         # Draw input image (always on a white background)
         input_image = self._create_new_image()
-        draw_input = ImageDraw.Draw(input_image)
-        draw_shape(draw_input, shape, center, size, color_hex)
-        
-        # Choose and apply a transformation
-        target_params, description = self._get_random_transformation(shape, color_hex, bg_color_hex, center, size)
-        
+        paste_shape(input_image, shape, center, size, color_hex)
+
+        # Apply the transformation
+        target_params, description = self._apply_transformation(shape, color_hex, bg_color_hex, center, size, transformation, option)
+
         # --- FIX IS HERE ---
         # Instead of creating a default image and pasting a color,
         # create the image directly with the final background color.
         target_image = Image.new('RGB', (self.img_size, self.img_size), target_params['bg_color'])
-        
-        draw_target = ImageDraw.Draw(target_image)
-        draw_shape(
-            draw_target,
+
+        paste_shape(
+            target_image,
             target_params['shape'],
             target_params['center'],
             target_params['size'],
@@ -39,69 +74,84 @@ class ShapeAugmentationPuzzle(BasePuzzle):
             scale=target_params['scale'],
             border_color=target_params['border_color']
         )
-        
+
         return input_image, target_image, description
 
-    def _get_random_transformation(self, shape, color, bg_color, center, size):
+    def describe(self, params):
+        shape, color_hex, transformation, option = params
+        center = (self.img_size / 2, self.img_size / 2)
+        return self._apply_transformation(shape, color_hex, '#FFFFFF', center, self.img_size / 3, transformation, option)[1]
+
+    def _transformation_options(self, shape, transformation):
+        """Lists every argument a transformation can take for the given shape."""
+        if transformation == 'rotate':
+            return [(degrees, direction) for degrees in range(30, 181) for direction in ['clockwise', 'counterclockwise']]
+        if transformation == 'flip':
+            return ['horizontally', 'vertically']
+        if transformation in ('recolor', 'background', 'border'):
+            return self.colors
+        if transformation == 'resize':
+            return [0.5, 2]
+        if transformation == 'stretch':
+            return [(direction, factor) for direction in ['horizontally', 'vertically'] for factor in [0.5, 2]]
+        if transformation == 'corner':
+            return [(corner_y, corner_x) for corner_y in ['top', 'bottom'] for corner_x in ['left', 'right']]
+        if transformation == 'edge':
+            return ['top', 'bottom', 'left', 'right']
+        return [s for s in self.SHAPES if s != shape] # replace
+
+    def _apply_transformation(self, shape, color, bg_color, center, size, transformation, option):
         params = {
             'shape': shape, 'color': color, 'bg_color': bg_color,
             'center': center, 'size': size, 'rotation': 0,
             'scale': (1, 1), 'border_color': None
         }
-        
-        transformation = random.randint(1, 10)
+
         desc = ""
-        
-        if transformation == 1: # rotate
-            degrees = random.randint(30, 180)
-            direction = random.choice(['clockwise', 'counterclockwise'])
+
+        if transformation == 'rotate':
+            degrees, direction = option
             params['rotation'] = degrees if direction == 'clockwise' else -degrees
             desc = f"rotate the {shape} {degrees} degrees {direction}"
-        elif transformation == 2: # flip
-            direction = random.choice(['horizontally', 'vertically'])
+        elif transformation == 'flip':
+            direction = option
             params['scale'] = (-1, 1) if direction == 'horizontally' else (1, -1)
             desc = f"flip the {shape} {direction}"
-        elif transformation == 3: # change color
-            new_color_hex, new_color_name = random.choice(list(self.color_name_map.items()))
-            params['color'] = new_color_hex
-            desc = f"change to {new_color_name}"
-        elif transformation == 4: # shrink/blow up
-            factor = random.choice([0.5, 2])
+        elif transformation == 'recolor':
+            params['color'] = option
+            desc = f"change to {self.color_name_map[option]}"
+        elif transformation == 'resize':
+            factor = option
             params['size'] = size * factor
             desc = "shrink" if factor == 0.5 else "blow up"
-        elif transformation == 5: # stretch
-            direction = random.choice(['horizontally', 'vertically'])
-            factor = random.choice([0.5, 2])
+        elif transformation == 'stretch':
+            direction, factor = option
             params['scale'] = (factor, 1) if direction == 'horizontally' else (1, factor)
             desc = f"stretch {direction}"
-        elif transformation == 6: # change background
-            new_bg_hex, new_bg_name = random.choice(list(self.color_name_map.items()))
-            params['bg_color'] = new_bg_hex
-            desc = f"change background color to {new_bg_name}"
-        elif transformation == 7: # move to corner
-            corner_y = random.choice(['top', 'bottom'])
-            corner_x = random.choice(['left', 'right'])
+        elif transformation == 'background':
+            params['bg_color'] = option
+            desc = f"change background color to {self.color_name_map[option]}"
+        elif transformation == 'corner':
+            corner_y, corner_x = option
             padding = size / 1.5
             params['center'] = (
                 padding if corner_x == 'left' else self.img_size - padding,
                 padding if corner_y == 'top' else self.img_size - padding
             )
             desc = f"Move to the {corner_y}-{corner_x} corner"
-        elif transformation == 8: # move to edge
-            edge = random.choice(['top', 'bottom', 'left', 'right'])
+        elif transformation == 'edge':
+            edge = option
             padding = size / 1.5
             if edge == 'top': params['center'] = (self.img_size/2, padding)
             elif edge == 'bottom': params['center'] = (self.img_size/2, self.img_size-padding)
             elif edge == 'left': params['center'] = (padding, self.img_size/2)
             else: params['center'] = (self.img_size-padding, self.img_size/2)
             desc = f"Move to the {edge} of the screen"
-        elif transformation == 9: # replace
-            shapes = ['circle', 'triangle', 'hexagon', 'square', 'diamond', 'trapezoid', 'arrow', 'star']
-            params['shape'] = random.choice([s for s in shapes if s != shape])
+        elif transformation == 'replace':
+            params['shape'] = option
             desc = f"Replace with {params['shape']}"
-        else: # Add border
-            border_color_hex, border_color_name = random.choice(list(self.color_name_map.items()))
-            params['border_color'] = border_color_hex
-            desc = f"Add a {border_color_name} border to {shape}"
-            
+        else: # border
+            params['border_color'] = option
+            desc = f"Add a {self.color_name_map[option]} border to {shape}"
+
         return params, desc
@@ -1,7 +1,8 @@
 # puzzles/sudoku.py
-import random
 from PIL import ImageDraw, ImageFont
 from .base_puzzle import BasePuzzle
+from utils.rng import random
+from utils.answers import record_answer
 
 class SudokuPuzzle(BasePuzzle):
     def generate(self, puzzle_data):
@@ -25,6 +26,7 @@ class SudokuPuzzle(BasePuzzle):
         input_image = self._generate_sudoku_image("".join(puzzle_list))
         target_image = self._generate_sudoku_image(solution_str)
         description = "Solve this sudoku puzzle."
+        record_answer([int(digit) for digit in solution_str])
         
         return input_image, target_image, description
 
@@ -1,11 +1,11 @@
 # puzzles/tangent_line.py
 
-import random
 import math
 import numpy as np
 from PIL import ImageDraw
 from .base_puzzle import BasePuzzle
 from utils.drawing_utils import rotate_points
+from utils.rng import random
 
 class TangentLinePuzzle(BasePuzzle):
     """
@@ -1,98 +1,229 @@
 # puzzles/tictactoe.py
-import random
+import itertools
 from PIL import ImageDraw
 from .base_puzzle import BasePuzzle
+from utils.rng import random
+from utils.profiling import stage
+from utils.answers import record_answer
+
+def _popcount(bits):
+    return bin(bits).count('1')
+
+def _cells(bits):
+    """Lists the cell indices set in a bitboard."""
+    return [i for i in range(bits.bit_length()) if bits >> i & 1]
+
+def _win_masks(board_size, win_length):
+    """Bitmasks of every win_length-in-a-row line on the board; cell (r, c) is bit r * board_size + c."""
+    masks = []
+    for r in range(board_size):
+        for c in range(board_size):
+            for dr, dc in [(0, 1), (1, 0), (1, 1), (1, -1)]:
+                end_r, end_c = r + dr * (win_length - 1), c + dc * (win_length - 1)
+                if 0 <= end_r < board_size and 0 <= end_c < board_size:
+                    masks.append(sum(1 << ((r + dr * i) * board_size + c + dc * i) for i in range(win_length)))
+    return masks
+
+def _has_line(bits, win_masks):
+    return any(bits & mask == mask for mask in win_masks)
+
+def _winning_cells(player_bits, opponent_bits, win_masks):
+    """Lists the empty cells that would complete a line for player."""
+    occupied = player_bits | opponent_bits
+    cells = set()
+    for mask in win_masks:
+        missing = mask & ~player_bits
+        if not missing & occupied and _popcount(missing) == 1:
+            cells.add(missing.bit_length() - 1)
+    return sorted(cells)
+
+def _enumerate_positions(board_size, win_length):
+    """
+    Lists every (x_bits, o_bits, winner, winning_move) where the player to move
+    has win_length - 1 marks on one line, the other player has the matching
+    number of marks for the turn order, and nobody has already won.
+    """
+    win_masks = _win_masks(board_size, win_length)
+    num_cells = board_size * board_size
+    positions = []
+    for winner in ['X', 'O']:
+        # X moves first, so it is X's turn when both players have the same number of marks
+        num_loser_marks = win_length - 1 if winner == 'X' else win_length
+        for line in win_masks:
+            for winning_move in _cells(line):
+                winner_bits = line & ~(1 << winning_move)
+                free = [i for i in range(num_cells) if not line >> i & 1]
+                for loser_cells in itertools.combinations(free, num_loser_marks):
+                    loser_bits = sum(1 << i for i in loser_cells)
+                    if _has_line(loser_bits, win_masks):
+                        continue
+                    # On boards wider than the line, the same marks may also threaten a neighbouring line
+                    if _winning_cells(winner_bits, loser_bits, win_masks) != [winning_move]:
+                        continue
+                    x_bits, o_bits = (winner_bits, loser_bits) if winner == 'X' else (loser_bits, winner_bits)
+                    positions.append((x_bits, o_bits, winner, winning_move))
+    return positions
 
 class TicTacToePuzzle(BasePuzzle):
-    WIN_CONDITIONS = [[0, 1, 2], [3, 4, 5], [6, 7, 8], [0, 3, 6], [1, 4, 7], [2, 5, 8], [0, 4, 8], [2, 4, 6]]
+    """
+    Generates a "place the winning move" puzzle on an n x n board with k in a row.
+
+    Boards are bitboards (one int per player, bit r * n + c for cell (r, c)), so
+    win detection is a handful of mask comparisons. The classic 3x3 game samples
+    from a table of every valid position built once at import. Larger boards
+    (4x4, 5x5, gomoku-lite) are too big to enumerate and are built mark by mark
+    from cells that keep the position valid, so no board is ever rejected.
+    """
+    POSITION_TABLES = {} # (board_size, win_length) -> list of positions, filled below
+
+    def __init__(self, img_size, board_size=3, win_length=3):
+        super().__init__(img_size)
+        if not 3 <= win_length <= board_size:
+            raise ValueError("win_length must be between 3 and board_size")
+        self.board_size = board_size
+        self.win_length = win_length
+        self.win_masks = _win_masks(board_size, win_length)
+        self.cell_masks = [[m for m in self.win_masks if m >> cell & 1] for cell in range(board_size * board_size)]
+        self.positions = self.POSITION_TABLES.get((board_size, win_length))
 
     def generate(self):
-        # Loop until a valid, non-ambiguous board is generated
-        while True:
-            board = self._generate_board_state()
-            if board:
-                start_board, winner, winning_move = board
-                break
-        
+        return self.render(self.sample_params())
+
+    def sample_params(self):
+        if self.positions is not None:
+            return random.choice(self.positions)
+        with stage('solve'):
+            return self._build_position()
+
+    def enumerate_params(self):
+        if self.positions is None:
+            return super().enumerate_params()
+        return iter(self.positions)
+
+    def param_probability(self, params):
+        if self.positions is None:
+            return super().param_probability(params)
+        return 1 / len(self.positions)
+
+    def render(self, params):
+        x_bits, o_bits, winner, winning_move = params
+
         # Create input image from the starting board
         input_image = self._create_new_image()
         draw_input = ImageDraw.Draw(input_image)
         self._draw_grid(draw_input)
-        self._draw_board(draw_input, start_board)
+        self._draw_board(draw_input, x_bits, o_bits)
 
         # Create target image by adding the winning move
         target_image = input_image.copy()
         draw_target = ImageDraw.Draw(target_image)
-        
-        row, col = winning_move // 3, winning_move % 3
+
+        row, col = winning_move // self.board_size, winning_move % self.board_size
         if winner == 'X':
             self._draw_x(draw_target, row, col, self.line_color)
         else:
             self._draw_o(draw_target, row, col, self.line_color)
 
-        description = f"Please place the winning {winner} for the tic-tac-toe game"
-        return input_image, target_image, description
-
-    def _generate_board_state(self):
-        board = [''] * 9
-        
-        win_line = random.choice(self.WIN_CONDITIONS)
+        record_answer([row, col, 0 if winner == 'X' else 1])
+        return input_image, target_image, self.describe(params)
+
+    def describe(self, params):
+        winner = params[2]
+        if (self.board_size, self.win_length) == (3, 3):
+            return f"Please place the winning {winner} for the tic-tac-toe game"
+        return f"Please place the winning {winner} for the {self.board_size}x{self.board_size} {self.win_length}-in-a-row game"
+
+    def _build_position(self):
+        """Builds a random valid position by only ever placing marks that keep it valid."""
+        k = self.win_length
+        num_cells = self.board_size * self.board_size
+        win_line = random.choice(self.win_masks)
+        winning_move = random.choice(_cells(win_line))
         winner = random.choice(['X', 'O'])
-        loser = 'O' if winner == 'X' else 'X'
-
-        win_spots = random.sample(win_line, 2)
-        winning_move = list(set(win_line) - set(win_spots))[0]
-        for spot in win_spots:
-            board[spot] = winner
-
-        num_loser_marks = 2 if winner == 'X' else 3
-        
-        available_spots = [i for i, mark in enumerate(board) if mark == '' and i != winning_move]
-
-        if len(available_spots) < num_loser_marks:
-            return None # Not enough empty space, invalid game
-
-        loser_spots = random.sample(available_spots, num_loser_marks)
-        for spot in loser_spots:
-            board[spot] = loser
-        
-        # Check for invalid states
-        if self._check_win(board, loser) or self._check_win(board, winner):
-            return None # Invalid or ambiguous puzzle
-
-        # Create a version of the board *before* the winning move
-        start_board = list(board)
-        start_board[winning_move] = ''
-
-        return start_board, winner, winning_move
+        marks = {'winner': win_line & ~(1 << winning_move), 'loser': 0}
+
+        free = [i for i in range(num_cells) if not win_line >> i & 1]
+        random.shuffle(free)
+
+        def place(player):
+            for i, cell in enumerate(free):
+                safe = self._is_safe_loser_cell(cell, marks) if player == 'loser' else self._is_safe_winner_cell(cell, marks, winning_move)
+                if safe:
+                    marks[player] |= 1 << cell
+                    free.pop(i)
+                    return cell
+            return None
+
+        # X moves first, so it is X's turn when both players have the same number of marks
+        num_loser_marks = k - 1 if winner == 'X' else k
+
+        # The loser must first block any other line the winner's marks already threaten
+        for cell in _winning_cells(marks['winner'], 0, self.win_masks):
+            if cell != winning_move:
+                marks['loser'] |= 1 << cell
+                free.remove(cell)
+                num_loser_marks -= 1
+
+        for _ in range(num_loser_marks):
+            if place('loser') is None:
+                raise RuntimeError(f"Could not build a {self.board_size}x{self.board_size} {k}-in-a-row position")
+
+        # Fill the board further with pairs of moves to make the position less obvious
+        for _ in range(random.randint(0, max(0, (num_cells - 2 * k) // 4))):
+            winner_cell = place('winner')
+            if winner_cell is None:
+                break
+            if place('loser') is None:
+                marks['winner'] &= ~(1 << winner_cell)
+                break
 
-    def _check_win(self, current_board, player):
-        for line in self.WIN_CONDITIONS:
-            if all(current_board[i] == player for i in line):
-                return True
-        return False
+        x_bits, o_bits = (marks['winner'], marks['loser']) if winner == 'X' else (marks['loser'], marks['winner'])
+        return x_bits, o_bits, winner, winning_move
+
+    def _is_safe_loser_cell(self, cell, marks):
+        """The loser may not complete a line of their own."""
+        bits = marks['loser'] | 1 << cell
+        return not any(bits & mask == mask for mask in self.cell_masks[cell])
+
+    def _is_safe_winner_cell(self, cell, marks, winning_move):
+        """The winner may not win already, nor gain a second winning move elsewhere."""
+        bits = marks['winner'] | 1 << cell
+        for mask in self.cell_masks[cell]:
+            if mask & marks['loser']:
+                continue
+            count = _popcount(bits & mask)
+            if count == self.win_length:
+                return False
+            if count == self.win_length - 1 and not mask >> winning_move & 1:
+                return False
+        return True
 
     def _draw_grid(self, draw):
-        cell_size = self.img_size / 3
-        for i in range(1, 3):
-            draw.line([(i * cell_size, 10), (i * cell_size, self.img_size - 10)], fill=self.line_color, width=5)
-            draw.line([(10, i * cell_size), (self.img_size - 10, i * cell_size)], fill=self.line_color, width=5)
-
-    def _draw_board(self, draw, board_state):
-        for i, mark in enumerate(board_state):
-            row, col = i // 3, i % 3
-            if mark == 'X':
-                self._draw_x(draw, row, col, self.line_color)
-            elif mark == 'O':
-                self._draw_o(draw, row, col, self.line_color)
+        n = self.board_size
+        cell_size = self.img_size / n
+        width = max(2, round(15 / n))
+        for i in range(1, n):
+            draw.line([(i * cell_size, 10), (i * cell_size, self.img_size - 10)], fill=self.line_color, width=width)
+            draw.line([(10, i * cell_size), (self.img_size - 10, i * cell_size)], fill=self.line_color, width=width)
+
+    def _draw_board(self, draw, x_bits, o_bits):
+        for i in _cells(x_bits):
+            self._draw_x(draw, i // self.board_size, i % self.board_size, self.line_color)
+        for i in _cells(o_bits):
+            self._draw_o(draw, i // self.board_size, i % self.board_size, self.line_color)
 
     def _draw_x(self, draw, r, c, color):
-        cell_size = self.img_size / 3
+        cell_size = self.img_size / self.board_size
         margin = cell_size * 0.2
-        draw.line([(c * cell_size + margin, r * cell_size + margin), ((c + 1) * cell_size - margin, (r + 1) * cell_size - margin)], fill=color, width=8)
-        draw.line([(c * cell_size + margin, (r + 1) * cell_size - margin), ((c + 1) * cell_size - margin, r * cell_size + margin)], fill=color, width=8)
+        width = max(2, round(24 / self.board_size))
+        draw.line([(c * cell_size + margin, r * cell_size + margin), ((c + 1) * cell_size - margin, (r + 1) * cell_size - margin)], fill=color, width=width)
+        draw.line([(c * cell_size + margin, (r + 1) * cell_size - margin), ((c + 1) * cell_size - margin, r * cell_size + margin)], fill=color, width=width)
 
     def _draw_o(self, draw, r, c, color):
-        cell_size = self.img_size / 3
+        cell_size = self.img_size / self.board_size
         margin = cell_size * 0.2
-        draw.ellipse([(c * cell_size + margin, r * cell_size + margin), ((c + 1) * cell_size - margin, (r + 1) * cell_size - margin)], outline=color, width=8)
\ No newline at end of file
+        width = max(2, round(24 / self.board_size))
+        draw.ellipse([(c * cell_size + margin, r * cell_size + margin), ((c + 1) * cell_size - margin, (r + 1) * cell_size - margin)], outline=color, width=width)
+
+# The classic game is small enough to list every valid position once
+TicTacToePuzzle.POSITION_TABLES[(3, 3)] = _enumerate_positions(3, 3)
@@ -1,12 +1,13 @@
 # puzzles/two_d_measuring.py
 
-import random
 import numpy as np
 import math
 from PIL import Image, ImageDraw, ImageFont
 from scipy.spatial import ConvexHull
 from .base_puzzle import BasePuzzle
-from utils.drawing_utils import draw_shape
+from utils.sprite_atlas import paste_shape
+from utils.rng import random, np_random
+from utils.answers import record_answer
 
 class TwoDMeasuringPuzzle(BasePuzzle):
     def generate(self):
@@ -25,7 +26,7 @@ class TwoDMeasuringPuzzle(BasePuzzle):
         
         # Generate a random convex polygon
         num_points = random.randint(3, 6)
-        points = np.random.rand(num_points, 2) * self.img_size * 0.6 + self.img_size * 0.2
+        points = np_random.rand(num_points, 2) * self.img_size * 0.6 + self.img_size * 0.2
         hull = ConvexHull(points)
         shape_vertices = [tuple(p) for p in points[hull.vertices]]
         
@@ -42,6 +43,7 @@ class TwoDMeasuringPuzzle(BasePuzzle):
         self._draw_area_scene(draw_target, shape_vertices, unit_area_pixels, color, str(answer))
         
         description = "Given the unit area, calculate the area of the shape."
+        record_answer([round(answer * 10)])
         return input_image, target_image, description
 
     def _generate_pouring_task(self):
@@ -97,15 +99,13 @@ class TwoDMeasuringPuzzle(BasePuzzle):
         target_shape = min(shapes, key=lambda s: s['area']) if mode == 'least' else max(shapes, key=lambda s: s['area'])
         
         input_image = self._create_new_image()
-        draw_input = ImageDraw.Draw(input_image)
         for s in shapes:
-            draw_shape(draw_input, s['type'], s['pos'], s['size'], s['color'])
+            paste_shape(input_image, s['type'], s['pos'], s['size'], s['color'])
             
         target_image = self._create_new_image()
-        draw_target = ImageDraw.Draw(target_image)
         for s in shapes:
             color = target_color_hex if s == target_shape else s['color']
-            draw_shape(draw_target, s['type'], s['pos'], s['size'], color)
+            paste_shape(target_image, s['type'], s['pos'], s['size'], color)
             
         description = f"Change the color of the shape with the {mode} area to {target_color_name}."
         return input_image, target_image, description
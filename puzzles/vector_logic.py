@@ -1,10 +1,10 @@
 # puzzles/vector_logic.py
 
-import random
 import math
 import numpy as np
 from PIL import Image, ImageDraw
 from .base_puzzle import BasePuzzle
+from utils.rng import random, np_random
 
 class VectorLogicPuzzle(BasePuzzle):
     def generate(self):
@@ -130,7 +130,7 @@ class VectorLogicPuzzle(BasePuzzle):
         vectors = []
         colors = random.sample(self.master_palette, num_vectors)
         for i in range(num_vectors):
-            vec = np.random.uniform(-4.5, 4.5, 2)
+            vec = np_random.uniform(-4.5, 4.5, 2)
             vectors.append({
                 'vec': vec,
                 'color': colors[i],
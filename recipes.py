@@ -0,0 +1,145 @@
+# recipes.py
+import json
+import struct
+import numpy as np
+from torch.utils.data import Dataset
+from dataset import InterleavedPuzzleDataset, batch_to_tensor
+from puzzles.holdout import has_params
+from utils.holdout import HoldoutFilter, params_key, content_key
+from utils.rng import seeded
+
+# Binary recipe files: MAGIC, a little-endian uint32 header length, a JSON
+# header, then fixed-size records that are memory-mapped on load.
+MAGIC = b'PZRECIPE'
+RECORD = np.dtype([('type', '<u2'), ('seed', '<u8')])
+FORMAT_VERSION = 1
+
+def write_recipes(path, puzzle_counts, seed=0, img_size=384, with_params=False):
+    """
+    Writes the recipes of a shuffled mixture of puzzle_counts to path.
+
+    Every sample gets its own 64-bit seed from (seed, position). Paths ending
+    in .jsonl are written as JSON lines, anything else in the compact binary
+    format (10 bytes per sample). With with_params (JSON lines only), samples
+    of generators that implement sample_params() store their parameters
+    instead of a seed, so they can be read and edited.
+    """
+    if puzzle_counts.get('sudoku'):
+        raise ValueError("Sudoku puzzles come from an external dataset and cannot be stored as recipes")
+    types = sorted(t for t, count in puzzle_counts.items() if count > 0)
+    type_ids = np.repeat(np.arange(len(types), dtype=np.uint16), [puzzle_counts[t] for t in types])
+    type_ids = np.random.default_rng(seed).permutation(type_ids)
+    seeds = np.random.SeedSequence(seed).generate_state(len(type_ids), dtype=np.uint64)
+    header = {'version': FORMAT_VERSION, 'img_size': img_size, 'types': types}
+
+    if not path.endswith('.jsonl'):
+        if with_params:
+            raise ValueError("Parameter recipes can only be written as JSON lines (.jsonl)")
+        records = np.empty(len(type_ids), dtype=RECORD)
+        records['type'] = type_ids
+        records['seed'] = seeds
+        header_bytes = json.dumps(header).encode()
+        with open(path, 'wb') as f:
+            f.write(MAGIC + struct.pack('<I', len(header_bytes)) + header_bytes)
+            records.tofile(f)
+        return len(records)
+
+    generators = InterleavedPuzzleDataset({}, img_size=img_size).puzzle_generators if with_params else {}
+    with open(path, 'w') as f:
+        f.write(json.dumps(header) + '\n')
+        for type_id, sample_seed in zip(type_ids.tolist(), seeds.tolist()):
+            record = {'type': types[type_id], 'seed': sample_seed}
+            generator = generators.get(types[type_id])
+            if generator is not None:
+                try:
+                    with seeded(sample_seed):
+                        record = {'type': types[type_id], 'params': generator.sample_params()}
+                except NotImplementedError:
+                    pass
+            f.write(json.dumps(record) + '\n')
+    return len(type_ids)
+
+def read_recipes(path):
+    """Returns (header, records): a memory-mapped RECORD array for binary files, a list of dicts for JSON lines."""
+    with open(path, 'rb') as f:
+        magic = f.read(len(MAGIC))
+    if magic != MAGIC:
+        with open(path) as f:
+            header = json.loads(f.readline())
+            return header, [json.loads(line) for line in f]
+    with open(path, 'rb') as f:
+        f.seek(len(MAGIC))
+        (header_size,) = struct.unpack('<I', f.read(4))
+        header = json.loads(f.read(header_size))
+    if header['version'] != FORMAT_VERSION:
+        raise ValueError(f"Unsupported recipe format version {header['version']}")
+    records = np.memmap(path, dtype=RECORD, mode='r', offset=len(MAGIC) + 4 + header_size)
+    return header, records
+
+class RecipeDataset(Dataset):
+    """
+    Renders puzzles on demand from a recipe file written by write_recipes().
+
+    A seed recipe calls the generator's generate() with `random` and
+    `np.random` (utils.rng) seeded for the call and then restored, like
+    PuzzleStream does for each unit; a parameter recipe calls render(params). Either
+    way a recipe renders the same images every time, on any machine running
+    the same generator code and Pillow version. Samples are returned like
+    InterleavedPuzzleDataset's: (input, target, description).
+    """
+    def __init__(self, path, img_size=None):
+        self.header, self.records = read_recipes(path)
+        self.img_size = img_size or self.header['img_size']
+        self.types = self.header['types']
+        self.puzzle_generators = InterleavedPuzzleDataset({t: 1 for t in self.types}, img_size=self.img_size).puzzle_generators
+
+    def __len__(self):
+        return len(self.records)
+
+    def recipe(self, idx):
+        """Returns (puzzle_type, seed, params) of a sample; seed or params is None."""
+        record = self.records[idx]
+        if isinstance(record, dict):
+            return record['type'], record.get('seed'), record.get('params')
+        return self.types[int(record['type'])], int(record['seed']), None
+
+    def render(self, idx):
+        """Renders the sample at idx as PIL images: (input_image, target_image, description)."""
+        puzzle_type, seed, params = self.recipe(idx)
+        generator = self.puzzle_generators[puzzle_type]
+        if params is not None:
+            return generator.render(params)
+        with seeded(seed):
+            return generator.generate()
+
+    def __getitem__(self, idx):
+        input_image, target_image, description = self.render(idx)
+        images = np.stack([np.asarray(input_image.convert('RGB')), np.asarray(target_image.convert('RGB'))])
+        inputs, targets = batch_to_tensor(images)
+        return inputs, targets, description
+
+def build_holdout(recipe_path, holdout_path=None, fp_rate=1e-6):
+    """
+    Builds a HoldoutFilter of every sample in a recipe file, saving it to holdout_path if given.
+
+    Samples of generators with sample_params() are keyed by their parameters,
+    which a seed recipe reproduces without rendering; the others are rendered
+    and keyed by their content, at the recipe file's image size.
+    """
+    recipes = RecipeDataset(recipe_path)
+    holdout = HoldoutFilter.for_capacity(len(recipes), fp_rate, img_size=recipes.img_size)
+    for idx in range(len(recipes)):
+        puzzle_type, seed, params = recipes.recipe(idx)
+        generator = recipes.puzzle_generators[puzzle_type]
+        if has_params(generator):
+            if params is None:
+                with seeded(seed):
+                    params = generator.sample_params()
+            holdout.add(params_key(puzzle_type, params), puzzle_type, 'params')
+        else:
+            input_image, target_image, description = recipes.render(idx)
+            key = content_key(puzzle_type, np.asarray(input_image.convert('RGB')), np.asarray(target_image.convert('RGB')), description)
+            holdout.add(key, puzzle_type, 'content')
+    if holdout_path:
+        holdout.save(holdout_path)
+    return holdout
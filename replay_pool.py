@@ -0,0 +1,192 @@
+# replay_pool.py
+import threading
+import numpy as np
+from torch.utils.data import IterableDataset, get_worker_info
+from utils.rng import random as thread_random, np_random, seed_thread
+
+class ReplayPool:
+    """
+    A fixed number of rendered samples: uint8 inputs and targets, with their descriptions, puzzle types and answers.
+
+    New samples fill the empty slots first and then overwrite random ones.
+    put() and take() may be called from different threads.
+    """
+    def __init__(self, size, img_size):
+        shape = (size, img_size, img_size, 3)
+        self.inputs = np.empty(shape, dtype=np.uint8)
+        self.targets = np.empty(shape, dtype=np.uint8)
+        self.descriptions = [None] * size
+        self.puzzle_types = [None] * size
+        self.answers = [None] * size
+        self.size = size
+        self.filled = 0
+        self.lock = threading.Lock()
+
+    def put(self, inputs, targets, descriptions, puzzle_types, answers, rng):
+        """Stores rows of (N, H, W, 3) inputs and targets, with one description, puzzle type and answer per row."""
+        with self.lock:
+            for row, (description, puzzle_type, answer) in enumerate(zip(descriptions, puzzle_types, answers)):
+                if self.filled < self.size:
+                    slot = self.filled
+                    self.filled += 1
+                else:
+                    slot = int(rng.integers(self.size))
+                self.inputs[slot] = inputs[row]
+                self.targets[slot] = targets[row]
+                self.descriptions[slot] = description
+                self.puzzle_types[slot] = puzzle_type
+                self.answers[slot] = answer
+
+    def take(self, inputs, targets, rng):
+        """Copies len(inputs) random samples into inputs and targets and returns their (descriptions, puzzle_types, answers)."""
+        with self.lock:
+            slots = rng.integers(self.filled, size=len(inputs))
+            np.take(self.inputs, slots, axis=0, out=inputs)
+            np.take(self.targets, slots, axis=0, out=targets)
+            slots = slots.tolist()
+            return ([self.descriptions[slot] for slot in slots], [self.puzzle_types[slot] for slot in slots],
+                    [self.answers[slot] for slot in slots])
+
+def _render_into_pool(dataset, pool, indices, inputs, targets, rng):
+    """
+    Renders the samples at indices into inputs and targets and puts them in the pool.
+    Returns render_batch()'s (descriptions, order), the puzzle types and the answers (all None unless the
+    dataset returns them), in the order of indices.
+    """
+    answers = [] if dataset.answer_length is not None else None
+    descriptions, order = dataset.render_batch(indices, inputs, targets, answers)
+    if answers is None:
+        answers = [None] * len(indices)
+    puzzle_types = [dataset.puzzle_manifest[idx][0] for idx in indices]
+    row_descriptions, row_types, row_answers = [None] * len(indices), [None] * len(indices), [None] * len(indices)
+    for description, puzzle_type, answer, row in zip(descriptions, puzzle_types, answers, order.tolist()):
+        row_descriptions[row], row_types[row], row_answers[row] = description, puzzle_type, answer
+    pool.put(inputs, targets, row_descriptions, row_types, row_answers, rng)
+    return descriptions, order, puzzle_types, answers
+
+class ReplayPoolDataset(IterableDataset):
+    """
+    Streams batches that mix replayed and freshly rendered samples of an InterleavedPuzzleDataset.
+
+    Every process that iterates it (each DataLoader worker) keeps a ReplayPool
+    of pool_size samples. Each sample of a batch comes from the pool with
+    probability pool_prob (scaled down while the pool is still filling) and
+    is otherwise rendered on the spot, in the dataset's mixture; fresh samples
+    also go into the pool. After every batch a background thread re-renders
+    refresh_fraction * pool_size more pool entries, so the pool keeps turning
+    over even when pool_prob is close to 1.
+
+    Per batch of B samples, the process renders about (1 - pool_prob) * B +
+    refresh_fraction * pool_size samples, which sets how much faster than raw
+    generation it can run and how often a sample is seen again. Batches are
+    PuzzleBatches built like the dataset's __getitems__ ones, with the same
+    optional outputs; use DataLoader(pool_dataset, batch_size=None,
+    collate_fn=collate_puzzle_batch). Iteration runs for num_batches batches
+    per process, or forever if it is None. With a fixed seed the fresh
+    samples repeat, but what the refresher has replaced by a given batch
+    depends on timing, so replayed ones may not.
+    """
+    def __init__(self, dataset, batch_size, pool_size=4096, pool_prob=0.75, refresh_fraction=0.01,
+                 num_batches=None, seed=0):
+        if not 0 <= pool_prob <= 1:
+            raise ValueError(f"pool_prob must be in [0, 1], got {pool_prob}")
+        if not 0 <= refresh_fraction <= 1:
+            raise ValueError(f"refresh_fraction must be in [0, 1], got {refresh_fraction}")
+        self.dataset = dataset
+        self.batch_size = batch_size
+        self.pool_size = pool_size
+        self.pool_prob = pool_prob
+        self.refresh_fraction = refresh_fraction
+        self.num_batches = num_batches
+        self.seed = seed
+
+    def __len__(self):
+        if self.num_batches is None:
+            raise TypeError("A ReplayPoolDataset without num_batches has no length")
+        return self.num_batches
+
+    def __iter__(self):
+        worker = get_worker_info()
+        seeds = np.random.SeedSequence([self.seed, worker.id if worker is not None else 0]).generate_state(3, dtype=np.uint64)
+        rng = np.random.default_rng(int(seeds[0]))
+        thread_random.seed(int(seeds[1]))
+        np_random.seed(int(seeds[1]) % 2**32)
+        pool = ReplayPool(self.pool_size, self.dataset.img_size)
+        refresher = _Refresher(self.dataset, pool, self.batch_size, int(seeds[2]))
+        refresher.start()
+        try:
+            refresh_credit = 0.0
+            batch = 0
+            while self.num_batches is None or batch < self.num_batches:
+                yield self._next_batch(pool, rng)
+                batch += 1
+                refresh_credit += self.refresh_fraction * self.pool_size
+                refresher.request(int(refresh_credit))
+                refresh_credit -= int(refresh_credit)
+        finally:
+            refresher.stop()
+
+    def _next_batch(self, pool, rng):
+        # --- 1. Split the batch between the pool and fresh rendering ---
+        prob = self.pool_prob * pool.filled / self.pool_size
+        replayed = int(rng.binomial(self.batch_size, prob)) if pool.filled else 0
+        fresh = self.batch_size - replayed
+        shape = (self.batch_size, self.dataset.img_size, self.dataset.img_size, 3)
+        inputs, targets = np.empty(shape, dtype=np.uint8), np.empty(shape, dtype=np.uint8)
+
+        # --- 2. Render the fresh samples into the first rows and keep them ---
+        descriptions, order, puzzle_types, answers = [], np.empty(0, dtype=np.int64), [], []
+        if fresh:
+            indices = rng.integers(len(self.dataset), size=fresh).tolist()
+            descriptions, order, puzzle_types, answers = _render_into_pool(self.dataset, pool, indices, inputs[:fresh], targets[:fresh], rng)
+
+        # --- 3. Fill the remaining rows from the pool and shuffle the two together ---
+        if replayed:
+            replayed_descriptions, replayed_types, replayed_answers = pool.take(inputs[fresh:], targets[fresh:], rng)
+            descriptions, puzzle_types = descriptions + replayed_descriptions, puzzle_types + replayed_types
+            answers = answers + replayed_answers
+            order = np.concatenate([order, np.arange(fresh, self.batch_size)])
+        perm = rng.permutation(self.batch_size).tolist()
+        return self.dataset._finish_batch(inputs, targets, [descriptions[pos] for pos in perm], order[perm],
+                                          [puzzle_types[pos] for pos in perm], [answers[pos] for pos in perm])
+
+class _Refresher(threading.Thread):
+    """Re-renders pool entries in the background, as many as have been requested."""
+    def __init__(self, dataset, pool, chunk_size, seed):
+        super().__init__(name='replay-pool-refresher', daemon=True)
+        self.dataset = dataset
+        self.pool = pool
+        self.chunk_size = chunk_size
+        self.seed = seed
+        self.pending = 0
+        self.stopping = False
+        self.condition = threading.Condition()
+
+    def request(self, count):
+        if count:
+            with self.condition:
+                # A refresher that falls behind never owes more than one full pool
+                self.pending = min(self.pending + count, self.pool.size)
+                self.condition.notify()
+
+    def stop(self):
+        with self.condition:
+            self.stopping = True
+            self.condition.notify()
+        self.join()
+
+    def run(self):
+        seed_thread(self.seed)
+        rng = np.random.default_rng(self.seed)
+        shape = (self.chunk_size, self.dataset.img_size, self.dataset.img_size, 3)
+        inputs, targets = np.empty(shape, dtype=np.uint8), np.empty(shape, dtype=np.uint8)
+        while True:
+            with self.condition:
+                while not self.pending and not self.stopping:
+                    self.condition.wait()
+                if self.stopping:
+                    return
+                count = min(self.pending, self.chunk_size)
+                self.pending -= count
+            indices = rng.integers(len(self.dataset), size=count).tolist()
+            _render_into_pool(self.dataset, self.pool, indices, inputs[:count], targets[:count], rng)
@@ -21,9 +21,13 @@ setup(
     long_description_content_type="text/markdown",
     url="https://github.com/your_username/your_repo_name",  # <--- Change this to your repo URL
     
-    # find_packages() automatically discovers the 'puzzles' and 'utils' directories
-    # because they contain an __init__.py file.
+    # find_packages() discovers the 'puzzles' and 'utils' packages by their __init__.py files
+    # (tests/ has none and is not installed)
     packages=find_packages(),
+    py_modules=['dataset', 'autotune', 'bench', 'benchmark_loaders', 'puzzle_dataset', 'puzzle_service', 'metrics', 'recipes', 'replay_pool', 'shared_loader', 'thread_loader'],
+
+    # `puzzle_dataset bench` runs the benchmark suite, `puzzle_dataset autotune` the loader autotuner
+    entry_points={'console_scripts': ['puzzle_dataset = puzzle_dataset:main']},
     
     # This list of dependencies will be installed when someone runs 'pip install'
     install_requires=requirements,
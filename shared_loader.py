@@ -0,0 +1,213 @@
+# shared_loader.py
+import multiprocessing
+import queue
+import random
+import traceback
+import numpy as np
+import torch
+from multiprocessing import shared_memory
+from torch.utils.data import BatchSampler, RandomSampler, SequentialSampler
+
+def _slot_arrays(shm, num_slots, batch_size, img_size):
+    """Views the shared buffer as (inputs, targets), each (num_slots, batch_size, H, W, 3) uint8."""
+    shape = (2, num_slots, batch_size, img_size, img_size, 3)
+    arrays = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf)
+    return arrays[0], arrays[1]
+
+def _producer_worker(dataset, shm, num_slots, batch_size, tasks, free_slots, ready):
+    """Renders each task's batch straight into a free slot and reports (slot, (descriptions, puzzle_types, answers)) in row order."""
+    inputs, targets = _slot_arrays(shm, num_slots, batch_size, dataset.img_size)
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        indices, seed = task
+        slot = free_slots.get() # Blocks while the consumer holds every slot
+        try:
+            # Seeding per batch makes a batch's content independent of which worker renders it
+            random.seed(seed)
+            np.random.seed(seed % 2**32)
+            n = len(indices)
+            answers = [] if dataset.answer_length is not None else None
+            descriptions, order = dataset.render_batch(indices, inputs[slot, :n], targets[slot, :n], answers)
+            rows = ([None] * n, [None] * n, [None] * n) # Descriptions, puzzle types and answers
+            for pos, row in enumerate(order.tolist()):
+                rows[0][row] = descriptions[pos]
+                rows[1][row] = dataset.puzzle_manifest[indices[pos]][0]
+                rows[2][row] = answers[pos] if answers is not None else None
+            ready.put((slot, rows))
+        except Exception:
+            ready.put((slot, traceback.format_exc()))
+
+class SharedMemoryLoader:
+    """
+    Feeds batches from a pool of producer processes through a shared-memory ring buffer.
+
+    The buffer holds num_slots batches of uint8 input/target pairs. Workers
+    render a whole batch (via dataset.render_batch) directly into a free slot,
+    and only the slot index, the descriptions, puzzle types and answers go
+    back through a queue, so no image is ever pickled. When every slot is full
+    the workers wait for the consumer (backpressure). The sampler is read
+    lazily: at most num_slots + num_workers batches are queued or rendering at
+    any time, and a new one is queued as each is taken, so breaking out of an
+    epoch early leaves almost nothing to drain.
+
+    Batches arrive in the order they finish, with rows grouped by puzzle type.
+    By default each batch goes through the dataset's own conversion, so it is
+    yielded with the same fields as collate_puzzle_batch() gives for
+    __getitems__ (tokenized descriptions, masks, augmentation, palettes and
+    answers included). With to_float=False the uint8 (N, H, W, 3) tensors are
+    views into the buffer itself: no copy is made, they are only valid until
+    the next batch is requested, and the dataset may not set any of those
+    options.
+
+    Use as a context manager, or call close(), to stop the workers and free the
+    shared memory.
+    """
+    def __init__(self, dataset, batch_size, num_workers=2, num_slots=None, shuffle=True,
+                 drop_last=False, batch_sampler=None, to_float=True):
+        self._shm = None
+        self._workers = []
+        if num_workers < 1:
+            raise ValueError("num_workers must be at least 1")
+        self.dataset = dataset
+        self.num_workers = num_workers
+        self.num_slots = num_slots or 2 * num_workers
+        if self.num_slots < 1:
+            raise ValueError("num_slots must be at least 1")
+        self.to_float = to_float
+        if not to_float and dataset.batch_options():
+            raise ValueError(f"to_float=False yields the raw buffer and cannot apply the dataset's {', '.join(dataset.batch_options())}")
+        if batch_sampler is None:
+            sampler = RandomSampler(dataset) if shuffle else SequentialSampler(dataset)
+            batch_sampler = BatchSampler(sampler, batch_size, drop_last)
+        self.batch_sampler = batch_sampler
+        self.batch_size = batch_size
+
+    def __len__(self):
+        return len(self.batch_sampler)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __del__(self):
+        self.close()
+
+    def _start(self):
+        if self._workers:
+            return
+        ctx = multiprocessing.get_context()
+        nbytes = 2 * self.num_slots * self.batch_size * self.dataset.img_size ** 2 * 3
+        self._shm = shared_memory.SharedMemory(create=True, size=nbytes)
+        self._inputs, self._targets = _slot_arrays(self._shm, self.num_slots, self.batch_size, self.dataset.img_size)
+        self._tasks = ctx.Queue()
+        self._free_slots = ctx.Queue()
+        self._ready = ctx.Queue()
+        for slot in range(self.num_slots):
+            self._free_slots.put(slot)
+        for _ in range(self.num_workers):
+            worker = ctx.Process(
+                target=_producer_worker,
+                args=(self.dataset, self._shm, self.num_slots, self.batch_size, self._tasks, self._free_slots, self._ready),
+                daemon=True,
+            )
+            worker.start()
+            self._workers.append(worker)
+
+    def __iter__(self):
+        self._start()
+        batches = iter(self.batch_sampler)
+        epoch_seed = random.getrandbits(64) # Drawn up front, so batch seeds do not depend on the consumer's own use of random
+        max_in_flight = self.num_slots + self.num_workers
+        num_submitted = 0
+        in_flight = 0
+        exhausted = False
+        held_slot = None
+        try:
+            while True:
+                # --- 1. Keep at most a slot per batch plus one waiting task per worker queued ---
+                while not exhausted and in_flight < max_in_flight:
+                    indices = next(batches, None)
+                    if indices is None:
+                        exhausted = True
+                        break
+                    if len(indices) > self.batch_size:
+                        raise ValueError(f"batch_sampler produced a batch of {len(indices)}, more than batch_size {self.batch_size}")
+                    seed = int(np.random.SeedSequence([epoch_seed, num_submitted]).generate_state(1, np.uint64)[0])
+                    self._tasks.put((list(indices), seed))
+                    num_submitted += 1
+                    in_flight += 1
+                if not in_flight:
+                    break
+
+                # --- 2. Take the next finished batch and hand its slot back once it is converted or consumed ---
+                slot, rows = self._next_ready()
+                in_flight -= 1
+                if isinstance(rows, str):
+                    self._free_slots.put(slot)
+                    raise RuntimeError(f"A producer worker failed:\n{rows}")
+                descriptions, puzzle_types, answers = rows
+                n = len(descriptions)
+                if self.to_float:
+                    try:
+                        batch = self.dataset._finish_batch(self._inputs[slot, :n], self._targets[slot, :n], descriptions,
+                                                           np.arange(n), puzzle_types, answers).fields()
+                    finally:
+                        self._free_slots.put(slot)
+                    yield batch
+                else:
+                    held_slot = slot
+                    yield [torch.from_numpy(self._inputs[slot, :n]), torch.from_numpy(self._targets[slot, :n]), descriptions]
+                    self._free_slots.put(held_slot)
+                    held_slot = None
+        finally:
+            if held_slot is not None:
+                self._free_slots.put(held_slot)
+            if in_flight:
+                self._abort_epoch(in_flight)
+
+    def _next_ready(self):
+        while True:
+            try:
+                return self._ready.get(timeout=1.0)
+            except queue.Empty:
+                if not all(worker.is_alive() for worker in self._workers):
+                    raise RuntimeError("A producer worker exited unexpectedly")
+
+    def _abort_epoch(self, remaining):
+        """Drops the batches nobody will consume so the next epoch starts clean."""
+        while remaining:
+            try:
+                self._tasks.get(timeout=0.1)
+            except queue.Empty:
+                break
+            remaining -= 1
+        # Workers finish the tasks they already took; give their slots back
+        for _ in range(remaining):
+            try:
+                slot, _ = self._next_ready()
+            except RuntimeError:
+                break
+            self._free_slots.put(slot)
+
+    def close(self):
+        """Stops the workers and releases the shared memory. Safe to call more than once."""
+        workers, self._workers = self._workers, []
+        for _ in workers:
+            self._tasks.put(None)
+        for worker in workers:
+            worker.join(timeout=5)
+            if worker.is_alive():
+                worker.terminate()
+                worker.join()
+        if self._shm is not None:
+            self._inputs = self._targets = None
+            try:
+                self._shm.close()
+            except BufferError:
+                pass # uint8 batches still referenced by the caller keep the mapping alive
+            self._shm.unlink()
+            self._shm = None
@@ -0,0 +1,53 @@
+# tests/test_answers.py
+import numpy as np
+import pytest
+import torch
+from dataset import InterleavedPuzzleDataset
+from utils.answers import ANSWER_MAX_LENGTHS, collect_answers, pad_answers, record_answer, required_answer_length
+
+def test_pad_answers_pads_with_zeros():
+    answers, lengths = pad_answers([np.array([1, 2, 3]), None, np.array([4])], 4)
+    assert answers.dtype == lengths.dtype == torch.int64
+    assert answers.tolist() == [[1, 2, 3, 0], [0, 0, 0, 0], [4, 0, 0, 0]]
+    assert lengths.tolist() == [3, 0, 1]
+
+def test_pad_answers_rejects_overflow():
+    pad_answers([np.arange(4)], 4)
+    with pytest.raises(ValueError):
+        pad_answers([np.arange(5)], 4)
+
+def test_answers_are_collected_per_block():
+    with collect_answers() as outer:
+        record_answer([1])
+        with collect_answers() as inner:
+            record_answer([2, 3])
+        record_answer(None)
+    record_answer([4]) # Nobody is collecting
+    assert [None if a is None else a.tolist() for a in outer] == [[1], None]
+    assert [a.tolist() for a in inner] == [[2, 3]]
+
+def test_answer_length_must_fit_the_mixture():
+    assert required_answer_length({'maze': 1, 'sudoku': 1}) == ANSWER_MAX_LENGTHS['maze'] == 1 + 41 * 41
+    assert required_answer_length(['arithmetic']) == 0
+    with pytest.raises(ValueError):
+        InterleavedPuzzleDataset({'tictactoe': 2, 'matrix_multiplication': 2}, img_size=64, answer_length=10)
+    with pytest.raises(ValueError):
+        InterleavedPuzzleDataset({'tictactoe': 2}, img_size=64, answer_length=3, lazy=True)
+    # Types with no samples do not count
+    InterleavedPuzzleDataset({'tictactoe': 2, 'maze': 0}, img_size=64, answer_length=3)
+
+def test_batch_answers_follow_their_samples():
+    counts = {'tictactoe': 6, 'matrix_multiplication': 6, 'arithmetic': 4}
+    dataset = InterleavedPuzzleDataset(counts, img_size=64, seed=0, answer_length=required_answer_length(counts))
+    indices = list(range(len(dataset)))
+    _, _, descriptions, answers, lengths = dataset.__getitems__(indices).fields()
+
+    for idx, description, answer, length in zip(indices, descriptions, answers.tolist(), lengths.tolist()):
+        puzzle_type = dataset.puzzle_manifest[idx][0]
+        if puzzle_type == 'tictactoe':
+            assert length == 3 and description.startswith(f"Please place the winning {'XO'[answer[2]]}")
+        elif puzzle_type == 'matrix_multiplication':
+            rows, cols = answer[:2]
+            assert length == 2 + rows * cols
+        else:
+            assert length == 0 and not any(answer)
@@ -0,0 +1,46 @@
+# tests/test_cost_balanced_sampler.py
+from collections import Counter
+from dataset import InterleavedPuzzleDataset, CostBalancedBatchSampler, _proportional_quotas
+
+COUNTS = {'arithmetic': 60, 'tictactoe': 30, 'algebra': 13}
+COSTS = {'arithmetic': 1.0, 'tictactoe': 4.0, 'algebra': 2.0}
+
+def _sampler(**kwargs):
+    dataset = InterleavedPuzzleDataset(COUNTS, img_size=64, seed=0)
+    return dataset, CostBalancedBatchSampler(dataset, batch_size=10, window=2, costs=COSTS, **kwargs)
+
+def test_proportional_quotas_sum_to_size():
+    quotas = _proportional_quotas(COUNTS, 20)
+    assert sum(quotas.values()) == 20
+    assert quotas == {'arithmetic': 12, 'tictactoe': 6, 'algebra': 2}
+
+def test_epoch_covers_the_dataset_once():
+    dataset, sampler = _sampler()
+    batches = list(sampler)
+    assert len(batches) == len(sampler)
+    assert [len(batch) for batch in batches] == [10] * 10 + [3]
+    assert sorted(idx for batch in batches for idx in batch) == list(range(len(dataset)))
+
+def test_every_window_takes_each_types_share():
+    dataset, sampler = _sampler()
+    batches = list(sampler)
+    remaining = Counter(puzzle_type for puzzle_type, _ in dataset.puzzle_manifest)
+    for start in range(0, len(batches), sampler.window):
+        window = [idx for batch in batches[start:start + sampler.window] for idx in batch]
+        taken = Counter(dataset.puzzle_manifest[idx][0] for idx in window)
+        assert taken == Counter({t: q for t, q in _proportional_quotas(dict(remaining), len(window)).items() if q})
+        remaining -= taken
+
+def test_batches_of_a_window_have_balanced_costs():
+    dataset, sampler = _sampler()
+    batches = list(sampler)
+    for start in range(0, len(batches) - 1, sampler.window): # The last window holds one short batch
+        costs = [sum(COSTS[dataset.puzzle_manifest[idx][0]] for idx in batch) for batch in batches[start:start + sampler.window]]
+        # Dealing the most expensive samples first leaves the batches at most one sample's cost apart
+        assert max(costs) - min(costs) <= max(COSTS.values())
+
+def test_drop_last_drops_only_the_short_batch():
+    _, sampler = _sampler(drop_last=True)
+    batches = list(sampler)
+    assert len(batches) == len(sampler) == 10
+    assert all(len(batch) == 10 for batch in batches)
@@ -0,0 +1,61 @@
+# tests/test_holdout.py
+import numpy as np
+from puzzles.algebra import AlgebraPuzzle
+from puzzles.color_grid import ColorGridPuzzle
+from puzzles.holdout import HoldoutPuzzle
+from recipes import write_recipes, build_holdout, RecipeDataset
+from utils.holdout import HoldoutFilter, content_key, params_key
+from utils.rng import seeded
+
+def _content_key(puzzle_type, input_image, target_image, description):
+    return content_key(puzzle_type, np.asarray(input_image.convert('RGB')), np.asarray(target_image.convert('RGB')), description)
+
+def test_save_and_load_keep_every_key(tmp_path):
+    holdout = HoldoutFilter.for_capacity(100, img_size=64)
+    keys = [params_key('algebra', ['x', a, 0, 1]) for a in range(1, 7)]
+    for key in keys:
+        holdout.add(key, 'algebra', 'params')
+    holdout.save(tmp_path / 'eval.holdout')
+
+    loaded = HoldoutFilter.load(tmp_path / 'eval.holdout')
+    assert (loaded.num_bits, loaded.num_hashes, loaded.img_size, loaded.count) == (holdout.num_bits, holdout.num_hashes, 64, 6)
+    assert loaded.types == {'algebra': 'params'}
+    assert np.array_equal(np.asarray(loaded.bits), holdout.bits)
+    assert all(key in loaded for key in keys)
+    assert params_key('algebra', ['y', 1, 0, 1]) not in loaded
+
+def test_params_holdout_is_never_drawn(tmp_path):
+    # A third of the algebra space, so an unfiltered generator would hit it constantly
+    recipe_path, holdout_path = str(tmp_path / 'eval.bin'), str(tmp_path / 'eval.holdout')
+    write_recipes(recipe_path, {'algebra': 1500}, seed=1, img_size=64)
+    build_holdout(recipe_path, holdout_path)
+    recipes = RecipeDataset(recipe_path)
+    generator = recipes.puzzle_generators['algebra']
+    held_out = set()
+    for idx in range(len(recipes)):
+        with seeded(recipes.recipe(idx)[1]):
+            held_out.add(generator.sample_params())
+
+    holdout = HoldoutFilter.load(holdout_path)
+    puzzle = HoldoutPuzzle(AlgebraPuzzle(64), 'algebra', holdout)
+    with seeded(0):
+        assert not {puzzle.sample_params() for _ in range(2000)} & held_out
+
+    # Across the whole space the filter finds exactly the held-out parameter sets (what a pre-rendered store excludes)
+    assert {params for params in generator.enumerate_params() if holdout.contains_params('algebra', params)} == held_out
+
+def test_content_holdout_redraws_held_out_samples():
+    generator = ColorGridPuzzle(64)
+    holdout = HoldoutFilter.for_capacity(10, img_size=64)
+    for seed in range(10):
+        with seeded(seed):
+            holdout.add(_content_key('color_grid', *generator.generate()), 'color_grid', 'content')
+
+    # Seeded the same way, the first draw is always held out and has to be drawn again
+    puzzle = HoldoutPuzzle(generator, 'color_grid', holdout)
+    for seed in range(10):
+        with seeded(seed):
+            assert _content_key('color_grid', *puzzle.generate()) not in holdout
+        with seeded(seed):
+            inputs, targets, descriptions = puzzle.generate_batch(3)
+        assert all(content_key('color_grid', inputs[i], targets[i], descriptions[i]) not in holdout for i in range(3))
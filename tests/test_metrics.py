@@ -0,0 +1,49 @@
+# tests/test_metrics.py
+import math
+import torch
+from dataset import InterleavedPuzzleDataset
+from metrics import MATRIX_TYPES, PuzzleMetrics, score_batch
+from utils.rng import seeded
+
+COUNTS = {'color_grid': 4, 'latin_square_matrix': 4, 'maze': 2, 'arithmetic': 2}
+
+def _batch():
+    dataset = InterleavedPuzzleDataset(COUNTS, img_size=128, seed=0)
+    with seeded(0):
+        inputs, targets, _ = dataset.__getitems__(list(range(len(dataset)))).fields()
+    return inputs, targets, [puzzle_type for puzzle_type, _ in dataset.puzzle_manifest]
+
+def _to_uint8(images):
+    return ((images + 1) * 127.5).round().to(torch.uint8)
+
+def test_perfect_predictions_score_one():
+    inputs, targets, names = _batch()
+    for preds, targets_, inputs_ in [(targets, targets, inputs), (_to_uint8(targets), _to_uint8(targets), _to_uint8(inputs))]:
+        scores = score_batch(preds, targets_, inputs_, names)
+        assert torch.all(scores['pixel_acc'] == 1)
+        assert torch.all(scores['changed_acc'][~torch.isnan(scores['changed_acc'])] == 1)
+        assert torch.all(scores['change_iou'] == 1)
+        for i, name in enumerate(names):
+            assert (scores['cell_acc'][i] == 1) if name == 'color_grid' else math.isnan(scores['cell_acc'][i])
+            assert (scores['panel_acc'][i] == 1) if name in MATRIX_TYPES else math.isnan(scores['panel_acc'][i])
+
+def test_copying_the_input_scores_no_change():
+    inputs, targets, names = _batch()
+    scores = score_batch(inputs, targets, inputs, names)
+    # Faint changes (anti-aliasing) are within the tolerance of the input, but the prediction changes nothing
+    changed = ~torch.isnan(scores['changed_acc'])
+    assert torch.all(scores['changed_acc'][changed] < 1)
+    assert torch.all(scores['change_iou'][changed] == 0)
+
+def test_type_ids_and_summary():
+    inputs, targets, names = _batch()
+    type_names = sorted(set(names))
+    type_ids = torch.tensor([type_names.index(name) for name in names])
+    metrics = PuzzleMetrics()
+    metrics.update(targets, targets, inputs, type_ids, type_names)
+    summary = metrics.summary()
+
+    assert sorted(summary) == type_names
+    assert {name: summary[name]['count'] for name in type_names} == COUNTS
+    assert summary['color_grid']['cell_acc'] == 1 and 'cell_acc' not in summary['maze']
+    assert summary['latin_square_matrix']['panel_acc'] == 1 and 'panel_acc' not in summary['arithmetic']
@@ -0,0 +1,71 @@
+# tests/test_palette.py
+import random
+import numpy as np
+import torch
+from PIL import ImageColor
+from dataset import InterleavedPuzzleDataset
+from utils.color_palette import COLOR_NAME_MAP, MASTER_PALETTE
+from utils.palette import BASE_COLORS, PALETTE_SIZE, decode_indexed, encode_indexed, indexed_to_tensor, is_recolorable, recolor
+
+RED, BLUE = MASTER_PALETTE[0], MASTER_PALETTE[2]
+
+def _pair(edge_color=None):
+    """A white input with a red square, and a target that adds a blue one (with an optional edge color around it)."""
+    input_arr = np.full((32, 32, 3), 255, dtype=np.uint8)
+    input_arr[4:12, 4:12] = ImageColor.getrgb(RED)
+    target_arr = input_arr.copy()
+    target_arr[18:28, 18:28] = ImageColor.getrgb(BLUE)
+    if edge_color is not None:
+        target_arr[17, 18:28] = edge_color
+    return np.stack([input_arr, target_arr])
+
+def test_encode_decode_round_trips():
+    images = _pair()
+    indices, palette, slot_ids = encode_indexed(images)
+    assert indices.shape == images.shape[:-1] and palette.shape == (PALETTE_SIZE, 3)
+    assert np.array_equal(decode_indexed(indices, palette), images)
+    used = sorted(BASE_COLORS[slot] for slot in slot_ids[slot_ids >= 0])
+    assert used == sorted(['#FFFFFF', RED, BLUE])
+
+def test_too_many_colors_round_only_the_other_colors():
+    rng = np.random.default_rng(0)
+    images = rng.integers(0, 256, size=(2, 32, 32, 3), dtype=np.uint8)
+    images[:, :4] = ImageColor.getrgb(RED)
+    indices, palette, slot_ids = encode_indexed(images)
+    decoded = decode_indexed(indices, palette)
+    assert (slot_ids > -2).sum() <= PALETTE_SIZE
+    assert np.array_equal(decoded[:, :4], images[:, :4]) # Base colors survive exactly
+    assert np.abs(decoded.astype(int) - images.astype(int)).max() < 64
+
+def test_recolor_changes_the_palette_and_description_together():
+    indices, palette, slot_ids = encode_indexed(_pair())
+    description = f"Add a {COLOR_NAME_MAP[BLUE]} square next to the {COLOR_NAME_MAP[RED]} one"
+    new_palette, new_description = recolor(palette, slot_ids, description, random.Random(0))
+
+    new_rgb = decode_indexed(indices, new_palette)
+    old_red, old_blue = new_rgb[1, 4, 4], new_rgb[1, 20, 20]
+    name_of = {ImageColor.getrgb(color): name for color, name in COLOR_NAME_MAP.items()}
+    assert new_description == f"Add a {name_of[tuple(old_blue)]} square next to the {name_of[tuple(old_red)]} one"
+    assert tuple(new_rgb[1, 0, 0]) == (255, 255, 255) # Background and line colors are never permuted
+
+def test_blended_edges_are_not_recolorable():
+    blend = (np.array(ImageColor.getrgb(BLUE)) + 255) // 2 # Blue anti-aliased against white
+    assert is_recolorable(*encode_indexed(_pair())[1:])
+    assert not is_recolorable(*encode_indexed(_pair(edge_color=blend))[1:])
+
+def test_indexed_batches_decode_to_the_rgb_batch():
+    counts = {'shape_augmentation': 4, 'tictactoe': 4}
+    plain = InterleavedPuzzleDataset(counts, img_size=64, seed=0)
+    indexed = InterleavedPuzzleDataset(counts, img_size=64, seed=0, palette_indexed=True)
+    indices = list(range(len(plain)))
+
+    random.seed(0)
+    np.random.seed(0)
+    inputs, targets, descriptions = plain.__getitems__(indices).fields()
+    random.seed(0)
+    np.random.seed(0)
+    index_inputs, index_targets, index_descriptions, palettes = indexed.__getitems__(indices).fields()
+
+    assert index_descriptions == descriptions
+    assert torch.equal(indexed_to_tensor(index_inputs, palettes), inputs)
+    assert torch.equal(indexed_to_tensor(index_targets, palettes), targets)
@@ -0,0 +1,39 @@
+# tests/test_prerendered.py
+import random
+import numpy as np
+import pytest
+from puzzles.prerendered import PrerenderedPuzzle
+from puzzles.shape_augmentation import ShapeAugmentationPuzzle
+
+def _generator():
+    return ShapeAugmentationPuzzle(64, transformations=['flip', 'resize'], colors=['#FF0000', '#0000FF'])
+
+def _key(input_image, target_image, description):
+    return np.asarray(input_image.convert('RGB')).tobytes(), np.asarray(target_image.convert('RGB')).tobytes(), description
+
+def test_store_round_trips_every_sample():
+    generator = _generator()
+    expected = {_key(*generator.render(params)) for params in generator.enumerate_params()}
+    store = PrerenderedPuzzle(generator)
+    assert len(store) == len(expected)
+
+    random.seed(0)
+    for _ in range(50):
+        assert _key(*store.generate()) in expected
+    inputs, targets, descriptions = store.generate_batch(50, rng=np.random.default_rng(0))
+    for input_arr, target_arr, description in zip(inputs, targets, descriptions):
+        assert (input_arr.tobytes(), target_arr.tobytes(), description) in expected
+
+def test_max_samples_is_checked_after_deduplication():
+    size = len(PrerenderedPuzzle(_generator()))
+    assert len(PrerenderedPuzzle(_generator(), max_samples=size)) == size
+    with pytest.raises(ValueError):
+        PrerenderedPuzzle(_generator(), max_samples=size - 1)
+
+def test_draws_keep_the_generators_mix():
+    # generate() picks flip or replace half the time each, though replace has 7 options to flip's 2
+    store = PrerenderedPuzzle(ShapeAugmentationPuzzle(64, transformations=['flip', 'replace'], colors=['#FF0000']))
+    flips = np.array([store._descriptions[d].startswith('flip') for d in store._samples[:, 2]])
+    assert flips.mean() == pytest.approx(2 / 9)
+    chosen = np.random.default_rng(0).choice(len(store), size=4000, p=store._weights)
+    assert flips[chosen].mean() == pytest.approx(0.5, abs=0.03)
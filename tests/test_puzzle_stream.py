@@ -0,0 +1,33 @@
+# tests/test_puzzle_stream.py
+import random
+import numpy as np
+import torch
+from torch.utils.data import DataLoader
+from dataset import InterleavedPuzzleDataset, PuzzleStream
+
+def _stream():
+    dataset = InterleavedPuzzleDataset({'arithmetic': 6, 'tictactoe': 6}, img_size=64, seed=0)
+    return PuzzleStream(dataset, seed=1)
+
+def test_resume_with_workers_yields_units_in_order():
+    expected = list(_stream()) # In-process, every unit in order
+
+    # Resume at a position that is not a multiple of the number of workers
+    stream = _stream()
+    stream.load_state_dict({**stream.state_dict(), 'position': 5})
+    resumed = list(DataLoader(stream, batch_size=None, num_workers=2))
+
+    assert len(resumed) == len(expected) - 5
+    for (input_a, target_a, description_a), (input_b, target_b, description_b) in zip(resumed, expected[5:]):
+        assert description_a == description_b
+        assert torch.equal(input_a, input_b) and torch.equal(target_a, target_b)
+
+def test_iterating_in_process_leaves_the_global_random_state():
+    random.seed(3)
+    np.random.seed(3)
+    expected = random.random(), np.random.rand()
+
+    random.seed(3)
+    np.random.seed(3)
+    list(_stream())
+    assert (random.random(), np.random.rand()) == expected
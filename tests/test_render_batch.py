@@ -0,0 +1,56 @@
+# tests/test_render_batch.py
+import os
+import numpy as np
+import pandas as pd
+import torch
+from dataset import InterleavedPuzzleDataset
+
+SUDOKU_CSV = os.path.join(os.path.dirname(__file__), '..', 'sudoku_10000.csv')
+
+def _dataset():
+    sudoku_df = pd.read_csv(SUDOKU_CSV, nrows=50, dtype=str)
+    return InterleavedPuzzleDataset({'sudoku': 4, 'arithmetic': 4, 'tictactoe': 4}, sudoku_df=sudoku_df, img_size=64, seed=0, answer_length=81)
+
+def _indices(dataset):
+    # Interleave the types, so grouping them moves every sudoku to another row
+    types = [puzzle_type for puzzle_type, _ in dataset.puzzle_manifest]
+    by_type = [[i for i, t in enumerate(types) if t == puzzle_type] for puzzle_type in ('arithmetic', 'sudoku', 'tictactoe')]
+    return [idx for group in zip(*by_type) for idx in group]
+
+def test_order_maps_each_requested_position_to_its_row():
+    dataset = _dataset()
+    indices = _indices(dataset)
+    shape = (len(indices), 64, 64, 3)
+    inputs, targets = np.empty(shape, dtype=np.uint8), np.empty(shape, dtype=np.uint8)
+    answers = []
+    descriptions, order = dataset.render_batch(indices, inputs, targets, answers)
+
+    assert sorted(order.tolist()) == list(range(len(indices)))
+    for pos, idx in enumerate(indices):
+        puzzle_type, data = dataset.puzzle_manifest[idx]
+        if puzzle_type != 'sudoku':
+            continue
+        # A sudoku's target is its manifest row's solution, so its row and answer can be checked exactly
+        _, target_image, description = dataset.puzzle_generators['sudoku'].generate(data)
+        assert np.array_equal(targets[order[pos]], np.asarray(target_image.convert('RGB')))
+        assert descriptions[pos] == description
+        assert answers[pos].tolist() == [int(digit) for digit in data[1]]
+
+def test_getitems_returns_samples_in_the_requested_order():
+    dataset = _dataset()
+    indices = _indices(dataset)
+    batch = dataset.__getitems__(indices)
+
+    assert len(batch) == len(indices)
+    for pos, idx in enumerate(indices):
+        puzzle_type, data = dataset.puzzle_manifest[idx]
+        _, target_tensor, description, answer, answer_length = batch[pos]
+        if puzzle_type == 'sudoku':
+            _, target_image, expected = dataset.puzzle_generators['sudoku'].generate(data)
+            assert torch.equal(target_tensor, InterleavedPuzzleDataset._to_tensor(target_image))
+            assert description == expected
+            assert answer.tolist() == [int(digit) for digit in data[1]]
+        elif puzzle_type == 'tictactoe':
+            assert 'winning' in description and answer_length == 3
+        else:
+            assert 'question mark' in description and answer_length == 0
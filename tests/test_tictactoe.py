@@ -0,0 +1,34 @@
+# tests/test_tictactoe.py
+import random
+import pytest
+from puzzles.tictactoe import TicTacToePuzzle, _has_line, _popcount, _winning_cells
+
+BOARDS = [(3, 3), (4, 4), (5, 4), (9, 5)]
+
+def _check_position(puzzle, position):
+    x_bits, o_bits, winner, winning_move = position
+    winner_bits, loser_bits = (x_bits, o_bits) if winner == 'X' else (o_bits, x_bits)
+    assert not x_bits & o_bits
+    assert not (x_bits | o_bits) >> winning_move & 1
+
+    # The winning move is the winner's only winning cell, and nobody has won yet
+    assert _winning_cells(winner_bits, loser_bits, puzzle.win_masks) == [winning_move]
+    assert not _has_line(x_bits, puzzle.win_masks)
+    assert not _has_line(o_bits, puzzle.win_masks)
+
+    # X moves first, so it is X's turn exactly when both players have the same number of marks
+    expected_o = _popcount(x_bits) if winner == 'X' else _popcount(x_bits) - 1
+    assert _popcount(o_bits) == expected_o
+
+def test_every_3x3_table_position_is_valid():
+    puzzle = TicTacToePuzzle(64)
+    assert puzzle.positions
+    for position in puzzle.positions:
+        _check_position(puzzle, position)
+
+@pytest.mark.parametrize('board_size, win_length', BOARDS)
+def test_sampled_positions_are_valid(board_size, win_length):
+    puzzle = TicTacToePuzzle(64, board_size=board_size, win_length=win_length)
+    random.seed(0)
+    for _ in range(50):
+        _check_position(puzzle, puzzle.sample_params())
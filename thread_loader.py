@@ -0,0 +1,56 @@
+# thread_loader.py
+import random
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from torch.utils.data import BatchSampler, RandomSampler, SequentialSampler
+from dataset import collate_puzzle_batch
+from utils.rng import seed_thread
+
+def _render_batch(dataset, indices, seed):
+    # Seeding per batch makes a batch's content independent of which thread renders it
+    seed_thread(seed)
+    return collate_puzzle_batch(dataset.__getitems__(indices))
+
+class ThreadPoolLoader:
+    """
+    Renders batches on a pool of threads inside the current process.
+
+    Nothing is forked or pickled: every thread uses the dataset's generators
+    directly (see "Thread safety" in the README). Each batch is rendered with
+    dataset.__getitems__ after seeding the rendering thread's own `random` and
+    `np.random` generators (utils.rng) from a seed drawn in the calling thread,
+    so results do not depend on scheduling. Batches are yielded in sampler
+    order as [inputs, targets, descriptions], like DataLoader with
+    collate_fn=collate_puzzle_batch.
+
+    With the GIL, threads only overlap where PIL, NumPy and torch release it;
+    on a free-threaded build (python3.13t) all rendering runs in parallel.
+    """
+    def __init__(self, dataset, batch_size, num_workers=4, shuffle=True, drop_last=False,
+                 batch_sampler=None, prefetch=None):
+        if num_workers < 1:
+            raise ValueError("num_workers must be at least 1")
+        self.dataset = dataset
+        self.num_workers = num_workers
+        self.prefetch = prefetch or 2 * num_workers
+        if batch_sampler is None:
+            sampler = RandomSampler(dataset) if shuffle else SequentialSampler(dataset)
+            batch_sampler = BatchSampler(sampler, batch_size, drop_last)
+        self.batch_sampler = batch_sampler
+
+    def __len__(self):
+        return len(self.batch_sampler)
+
+    def __iter__(self):
+        with ThreadPoolExecutor(self.num_workers, thread_name_prefix='puzzle-render') as pool:
+            pending = deque()
+            try:
+                for indices in self.batch_sampler:
+                    pending.append(pool.submit(_render_batch, self.dataset, list(indices), random.getrandbits(64)))
+                    if len(pending) >= self.prefetch:
+                        yield pending.popleft().result()
+                while pending:
+                    yield pending.popleft().result()
+            finally:
+                for future in pending:
+                    future.cancel()
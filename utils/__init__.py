@@ -0,0 +1 @@
+# utils/__init__.py
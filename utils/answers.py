@@ -0,0 +1,87 @@
+# utils/answers.py
+import threading
+from contextlib import contextmanager
+import numpy as np
+import torch
+
+# What each generator records as its answer, as a flat list of ints. Types not
+# listed (and vectorized or pre-rendered samples of types that record nothing) have none.
+ANSWER_FORMATS = {
+    'sudoku': "the 81 digits of the solution, row by row",
+    'maze': "[size, *moves]: the grid size, then the solution path from the top-left dot as moves (0 up, 1 right, 2 down, 3 left)",
+    'object_counting': "[0, count] for a specific count, [1, types] for the number of distinct types, "
+                       "[2, shape, color] for the most common object (indices into the generator's shapes and MASTER_PALETTE)",
+    'matrix_multiplication': "[rows, cols, *entries]: the shape of the product, then its entries row by row",
+    'one_d_measuring': "[tenths]: the measured length in tenths of a unit",
+    'two_d_measuring': "[tenths]: the area in tenths of a unit, for area tasks only",
+    'tictactoe': "[row, col, player]: the winning move and who makes it (0 X, 1 O), also for the larger boards",
+}
+
+# The longest answer each puzzle type can record, for sizing answer_length up front
+ANSWER_MAX_LENGTHS = {
+    'sudoku': 81,
+    'maze': 1 + 41 * 41, # The largest maze is 41x41, and its path visits no cell twice
+    'object_counting': 3,
+    'matrix_multiplication': 2 + 3 * 3,
+    'one_d_measuring': 1,
+    'two_d_measuring': 1,
+    'tictactoe': 3,
+    'tictactoe_4x4': 3,
+    'tictactoe_5x5': 3,
+    'gomoku_lite': 3,
+}
+
+def required_answer_length(puzzle_types):
+    """The answer_length that fits every answer of these puzzle types (0 if none of them records one)."""
+    return max((ANSWER_MAX_LENGTHS.get(puzzle_type, 0) for puzzle_type in puzzle_types), default=0)
+
+_local = threading.local() # The list that record_answer() appends to on this thread
+
+def record_answer(values):
+    """
+    Records the exact answer of the sample being generated on this thread (a sequence of ints, or None).
+    Does nothing unless someone is collecting answers with collect_answers().
+    """
+    answers = getattr(_local, 'answers', None)
+    if answers is not None:
+        answers.append(None if values is None else np.asarray(values, dtype=np.int64).reshape(-1))
+
+@contextmanager
+def collect_answers():
+    """Collects the answers recorded on this thread inside the block, in order, into the list it yields."""
+    previous = getattr(_local, 'answers', None)
+    _local.answers = answers = []
+    try:
+        yield answers
+    finally:
+        _local.answers = previous
+
+def collecting():
+    return getattr(_local, 'answers', None) is not None
+
+def generate_with_answer(generate, *args):
+    """
+    Calls generate(*args) for one sample and returns (result, answer), where answer is the last
+    one it recorded or None. Generating several samples per call needs this to keep them aligned.
+    """
+    if not collecting():
+        return generate(*args), None
+    with collect_answers() as answers:
+        result = generate(*args)
+    return result, answers[-1] if answers else None
+
+def pad_answers(answers, length):
+    """
+    Stacks answers (int64 arrays or None) into an (N, length) int64 tensor padded with 0,
+    and their (N,) lengths, 0 where a sample has no answer.
+    """
+    padded = np.zeros((len(answers), length), dtype=np.int64)
+    lengths = np.zeros(len(answers), dtype=np.int64)
+    for i, answer in enumerate(answers):
+        if answer is None:
+            continue
+        if len(answer) > length:
+            raise ValueError(f"An answer of {len(answer)} values does not fit in answer_length={length}")
+        padded[i, :len(answer)] = answer
+        lengths[i] = len(answer)
+    return torch.from_numpy(padded), torch.from_numpy(lengths)
@@ -0,0 +1,162 @@
+# utils/augment.py
+import math
+import torch
+import torch.nn.functional as F
+from utils.rng import random as thread_random
+
+# The JPEG luminance quantization table (ITU-T T.81, Annex K)
+_JPEG_TABLE = torch.tensor([
+    [16, 11, 10, 16, 24, 40, 51, 61],
+    [12, 12, 14, 19, 26, 58, 60, 55],
+    [14, 13, 16, 24, 40, 57, 69, 56],
+    [14, 17, 22, 29, 51, 87, 80, 62],
+    [18, 22, 37, 56, 68, 109, 103, 77],
+    [24, 35, 55, 64, 81, 104, 113, 92],
+    [49, 64, 78, 87, 103, 121, 120, 101],
+    [72, 92, 95, 98, 112, 100, 103, 99],
+], dtype=torch.float32)
+
+def _dct_matrix(n=8):
+    k = torch.arange(n, dtype=torch.float32)
+    matrix = torch.cos(math.pi * (2 * k[None] + 1) * k[:, None] / (2 * n)) * math.sqrt(2 / n)
+    matrix[0] /= math.sqrt(2)
+    return matrix
+
+# The 2-D DCT of a flattened 8x8 block, so a whole image is transformed with one matrix product
+_DCT_2D = torch.kron(_dct_matrix(), _dct_matrix())
+
+# Parameters that move or reshape strokes, and so change what a measuring puzzle's answer should be
+GEOMETRY_PARAMS = ('rotate', 'scale', 'translate', 'stroke_prob')
+
+class BatchAugment:
+    """
+    Robustness augmentations for a batch of rendered puzzles, vectorized across the batch.
+
+    Every sample draws its own parameters, up to these limits:
+      rotate       degrees of rotation either way
+      scale        relative zoom either way
+      translate    shift as a fraction of the image size
+      stroke_prob  chance that strokes are thickened or thinned by a pixel
+      blur_sigma   Gaussian blur sigma in pixels
+      noise_std    Gaussian sensor noise, in 0-255 units
+      jpeg_prob    chance of JPEG-like 8x8 DCT quantization, at a quality
+                   drawn from jpeg_quality (low, high)
+
+    geometric() applies the first four to inputs and targets alike, so a
+    pair stays consistent; photometric() applies the rest to inputs only.
+    `overrides` maps a puzzle type to the limits it uses instead, and the
+    types in no_geometry get no geometric jitter at all, since their answer
+    is a length or a position. Random draws come from utils.rng, so they
+    follow the seeding of the loader that renders the batch.
+    """
+    def __init__(self, rotate=3.0, scale=0.05, translate=0.02, stroke_prob=0.3, blur_sigma=1.0, noise_std=6.0,
+                 jpeg_prob=0.3, jpeg_quality=(30, 90), no_geometry=('one_d_measuring', 'two_d_measuring'), overrides=None):
+        self.limits = {
+            'rotate': rotate, 'scale': scale, 'translate': translate, 'stroke_prob': stroke_prob,
+            'blur_sigma': blur_sigma, 'noise_std': noise_std, 'jpeg_prob': jpeg_prob, 'jpeg_quality': jpeg_quality,
+        }
+        self.overrides = {puzzle_type: {name: 0.0 for name in GEOMETRY_PARAMS} for puzzle_type in no_geometry}
+        for puzzle_type, limits in (overrides or {}).items():
+            unknown = set(limits) - set(self.limits)
+            if unknown:
+                raise ValueError(f"Unknown augmentation parameters for {puzzle_type}: {sorted(unknown)}")
+            self.overrides.setdefault(puzzle_type, {}).update(limits)
+
+    def __call__(self, inputs, targets, puzzle_types=None):
+        """Applies both stages to (N, 3, H, W) uint8 tensors; returns the new (inputs, targets)."""
+        inputs, targets = self.geometric(inputs, targets, puzzle_types)
+        return self.photometric(inputs, puzzle_types), targets
+
+    def _limit(self, name, puzzle_types, n):
+        """Each row's limit for parameter `name`, as a float tensor of shape (N,) or (N, 2) for ranges."""
+        if puzzle_types is None:
+            puzzle_types = [None] * n
+        default = self.limits[name]
+        return torch.tensor([self.overrides.get(t, {}).get(name, default) for t in puzzle_types], dtype=torch.float32)
+
+    @staticmethod
+    def _generator():
+        return torch.Generator().manual_seed(thread_random.getrandbits(63))
+
+    def geometric(self, inputs, targets, puzzle_types=None):
+        """Applies the same affine jitter and stroke-width change to each input and its target."""
+        n = len(inputs)
+        gen = self._generator()
+        uniform = lambda limit: (torch.rand(n, generator=gen) * 2 - 1) * limit
+        inputs, targets = inputs.clone(), targets.clone()
+
+        # --- 1. Affine jitter, for the rows that get any ---
+        angle = uniform(self._limit('rotate', puzzle_types, n)) * math.pi / 180
+        zoom = 1 + uniform(self._limit('scale', puzzle_types, n))
+        translate = self._limit('translate', puzzle_types, n)
+        shift = torch.stack([uniform(translate), uniform(translate)], dim=1) * 2 # Normalized coordinates span 2
+        rows = torch.nonzero((angle != 0) | (zoom != 1) | (shift != 0).any(dim=1)).flatten()
+        if len(rows):
+            cos, sin = torch.cos(angle[rows]) / zoom[rows], torch.sin(angle[rows]) / zoom[rows]
+            theta = torch.stack([torch.stack([cos, -sin, shift[rows, 0]], 1), torch.stack([sin, cos, shift[rows, 1]], 1)], 1)
+            pairs = torch.cat([inputs[rows], targets[rows]], dim=1).float()
+            grid = F.affine_grid(theta, list(pairs.shape), align_corners=False)
+            warped = F.grid_sample(pairs, grid, mode='bilinear', padding_mode='border', align_corners=False)
+            warped = warped.round_().clamp_(0, 255).to(torch.uint8)
+            inputs[rows], targets[rows] = warped[:, :3], warped[:, 3:]
+
+        # --- 2. Thicker (3x3 min) or thinner (3x3 max) dark strokes ---
+        chosen = torch.rand(n, generator=gen) < self._limit('stroke_prob', puzzle_types, n)
+        thicken = torch.rand(n, generator=gen) < 0.5
+        for rows, op, fill in ((chosen & thicken, torch.minimum, 255), (chosen & ~thicken, torch.maximum, 0)):
+            rows = torch.nonzero(rows).flatten()
+            if len(rows):
+                pairs = _filter3x3(torch.cat([inputs[rows], targets[rows]], dim=1), op, fill)
+                inputs[rows], targets[rows] = pairs[:, :3], pairs[:, 3:]
+        return inputs, targets
+
+    def photometric(self, images, puzzle_types=None):
+        """Applies blur, sensor noise and JPEG-like artifacts to (N, 3, H, W) uint8 images."""
+        n = len(images)
+        gen = self._generator()
+        x = images.float()
+
+        # --- 1. Gaussian blur with a separable per-sample kernel, as one grouped convolution ---
+        sigma = torch.rand(n, generator=gen) * self._limit('blur_sigma', puzzle_types, n)
+        radius = math.ceil(2 * float(sigma.max()))
+        if radius > 0:
+            offsets = torch.arange(-radius, radius + 1, dtype=torch.float32)
+            kernel = torch.exp(-offsets[None] ** 2 / (2 * sigma.clamp(min=1e-3)[:, None] ** 2))
+            kernel = (kernel / kernel.sum(dim=1, keepdim=True)).repeat_interleave(3, dim=0) # (N*3, K)
+            flat = F.pad(x.reshape(1, n * 3, *x.shape[2:]), (radius, radius, radius, radius), mode='replicate')
+            flat = F.conv2d(flat, kernel[:, None, None, :], groups=n * 3)
+            x = F.conv2d(flat, kernel[:, None, :, None], groups=n * 3).reshape(x.shape)
+
+        # --- 2. Sensor noise ---
+        std = torch.rand(n, generator=gen) * self._limit('noise_std', puzzle_types, n)
+        x = x + torch.randn(x.shape, generator=gen) * std[:, None, None, None]
+
+        # --- 3. JPEG-like quantization of 8x8 DCT blocks, for the rows that get it ---
+        chosen = torch.rand(n, generator=gen) < self._limit('jpeg_prob', puzzle_types, n)
+        rows = torch.nonzero(chosen).flatten()
+        if len(rows):
+            quality_range = self._limit('jpeg_quality', puzzle_types, n)[rows]
+            quality = quality_range[:, 0] + torch.rand(len(rows), generator=gen) * (quality_range[:, 1] - quality_range[:, 0])
+            x[rows] = _jpeg_quantize(x[rows].clamp(0, 255), quality)
+        return x.round_().clamp_(0, 255).to(torch.uint8)
+
+def _filter3x3(x, op, fill):
+    """Combines every pixel of (N, C, H, W) x with its 3x3 neighborhood using op (torch.minimum or maximum), separably."""
+    padded = F.pad(x, (1, 1, 1, 1), value=fill)
+    rows = op(op(padded[..., :-2], padded[..., 1:-1]), padded[..., 2:])
+    return op(op(rows[..., :-2, :], rows[..., 1:-1, :]), rows[..., 2:, :])
+
+def _jpeg_quantize(x, quality):
+    """Rounds the 8x8 block DCT coefficients of (N, C, H, W) floats in [0, 255] like a JPEG encoder at `quality` (N,)."""
+    n, c, h, w = x.shape
+    pad_h, pad_w = -h % 8, -w % 8
+    x = F.pad(x, (0, pad_w, 0, pad_h), mode='replicate') - 128
+    blocks_h, blocks_w = (h + pad_h) // 8, (w + pad_w) // 8
+    blocks = x.reshape(n, c, blocks_h, 8, blocks_w, 8).transpose(3, 4).reshape(n, c, blocks_h, blocks_w, 64)
+    # The standard IJG scaling of the table by quality
+    scale = torch.where(quality < 50, 5000 / quality, 200 - 2 * quality)
+    table = ((_JPEG_TABLE.flatten()[None] * scale[:, None] + 50) / 100).floor().clamp(min=1)[:, None, None, None]
+    coefficients = blocks @ _DCT_2D.T
+    blocks = ((coefficients / table).round() * table) @ _DCT_2D
+    x = blocks.reshape(n, c, blocks_h, blocks_w, 8, 8).transpose(3, 4).reshape(n, c, h + pad_h, w + pad_w) + 128
+    return x[:, :, :h, :w]
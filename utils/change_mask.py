@@ -0,0 +1,47 @@
+# utils/change_mask.py
+import zlib
+import numpy as np
+
+def change_mask(inputs, targets):
+    """
+    The pixels where target differs from input, as a bool array of shape (..., H, W).
+    Works on one (H, W, 3) pair or a batch of (N, H, W, 3) uint8 arrays.
+    """
+    return (inputs != targets).any(axis=-1)
+
+def mask_bboxes(masks):
+    """
+    The tight (x0, y0, x1, y1) box of each (H, W) mask in an (N, H, W) batch, with x1 and y1
+    exclusive, as an (N, 4) int64 array. Empty masks get (0, 0, 0, 0).
+    """
+    masks = np.asarray(masks)
+    rows = masks.any(axis=2)
+    cols = masks.any(axis=1)
+    bboxes = np.zeros((len(masks), 4), dtype=np.int64)
+    nonempty = rows.any(axis=1)
+    height, width = masks.shape[1], masks.shape[2]
+    bboxes[:, 0] = cols.argmax(axis=1)
+    bboxes[:, 1] = rows.argmax(axis=1)
+    bboxes[:, 2] = width - cols[:, ::-1].argmax(axis=1)
+    bboxes[:, 3] = height - rows[:, ::-1].argmax(axis=1)
+    bboxes[~nonempty] = 0
+    return bboxes
+
+def encode_delta(base, image):
+    """
+    Encodes image (H, W, 3 uint8) as its difference from base: (bbox, data), where data is
+    the zlib-compressed crop of image inside the tight bbox of the changed pixels.
+    bbox is None (and data empty) when the two are identical.
+    """
+    mask = change_mask(base, image)
+    if not mask.any():
+        return None, b''
+    x0, y0, x1, y1 = (int(v) for v in mask_bboxes(mask[None])[0])
+    return (x0, y0, x1, y1), zlib.compress(np.ascontiguousarray(image[y0:y1, x0:x1]).tobytes(), 1)
+
+def apply_delta(out, bbox, data):
+    """Writes a delta from encode_delta() over out, which must already hold the base image."""
+    if bbox is not None:
+        x0, y0, x1, y1 = bbox
+        out[y0:y1, x0:x1] = np.frombuffer(zlib.decompress(data), dtype=np.uint8).reshape(y1 - y0, x1 - x0, 3)
+    return out
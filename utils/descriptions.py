@@ -0,0 +1,76 @@
+# utils/descriptions.py
+import re
+import numpy as np
+from utils.cache import LRUCache
+from utils.color_palette import COLOR_NAME_MAP
+
+# Every word of the generators' description templates, apart from color names (taken from COLOR_NAME_MAP)
+TEMPLATE_WORDS = (
+    'Add', 'Change', 'Color', 'Draw', 'Fill', 'Given', 'INTERSECTION', 'Join', 'Latin', 'Mirror',
+    'Move', 'Normalize', 'O', 'Perform', 'Please', 'Pour', 'Rearrange', 'Replace', 'Solve', 'Square',
+    'UNION', 'X', 'XOR', 'a', 'according', 'across', 'all', 'and', 'area', 'array', 'arrow', 'arrows', 'at',
+    'background', 'based', 'between', 'blow', 'border', 'bottom', 'box', 'by', 'calculate', 'canvas', 'cell',
+    'change', 'circle', 'circles', 'clockwise', 'color', 'combining', 'common', 'complete', 'corner',
+    'correct', 'counterclockwise', 'created', 'cup', 'curve', 'degrees', 'diamond', 'diamonds',
+    'distance', 'distinct', 'dots', 'draw', 'edge', 'end', 'extending', 'fill', 'flip', 'for', 'from',
+    'game', 'greatest', 'grid', 'hexagon', 'hexagons', 'horizontally', 'in', 'inscribed', 'into', 'it',
+    'item', 'least', 'left', 'length', 'line', 'liquid', 'logic', 'longest', 'mark', 'marked', 'matrix',
+    'measure', 'missing', 'most', 'multiplication', 'normal', 'number', 'object', 'of', 'on', 'order',
+    'origin', 'parallelogram', 'path', 'pattern', 'place', 'plot', 'point', 'progression', 'puzzle',
+    'question', 'replace', 'represents', 'result', 'right', 'rotate', 'rotation', 'row', 'screen',
+    'shape', 'shapes', 'shortest', 'shrink', 'solve', 'square', 'squares', 'star', 'stars', 'starting',
+    'stretch', 'sudoku', 'sum', 'tac', 'tangent', 'target', 'that', 'the', 'this', 'through', 'tic',
+    'tiles', 'to', 'toe', 'top', 'transparency', 'trapezoid', 'trapezoids', 'triangle', 'triangles',
+    'two', 'types', 'unit', 'up', 'variable', 'vector', 'vectors', 'vertically', 'winning', 'with', 'x',
+)
+PUNCTUATION = tuple("!%'()*+,-./:;=?[]")
+
+PAD, UNK = 0, 1
+
+# A piece is one word, digit or punctuation mark, with the space before it if there is one
+_PIECE = re.compile(r"\s?\d|\s?[A-Za-z]+|\s?[^A-Za-z\d\s]")
+
+class DescriptionVocab:
+    """
+    The built-in vocabulary that turns descriptions into fixed-length token ids.
+
+    Tokens are the template words, color-name words, single digits and
+    punctuation, each with and without a leading space, so decode(encode(text))
+    gives back every description the generators write. Anything else becomes
+    UNK. Descriptions come from a small set of templates, so encodings are
+    cached and encoding a repeated description is a lookup.
+    """
+    def __init__(self, words=None, cache_size=4096):
+        if words is None:
+            words = set(TEMPLATE_WORDS) | {word for name in COLOR_NAME_MAP.values() for word in name.split()}
+        pieces = sorted(words) + list('0123456789') + list(PUNCTUATION)
+        self.tokens = ['<pad>', '<unk>'] + [token for piece in pieces for token in (piece, ' ' + piece)]
+        self._ids = {token: i for i, token in enumerate(self.tokens)}
+        self._cache = LRUCache(cache_size)
+
+    def __len__(self):
+        return len(self.tokens)
+
+    def encode(self, text, length):
+        """Returns text as a read-only int64 array of `length` token ids padded with PAD; raises ValueError if it does not fit."""
+        key = (text, length)
+        ids = self._cache.get(key)
+        if ids is None:
+            pieces = _PIECE.findall(text)
+            if len(pieces) > length:
+                raise ValueError(f"Description needs {len(pieces)} tokens, more than {length}: {text!r}")
+            ids = np.full(length, PAD, dtype=np.int64)
+            ids[:len(pieces)] = [self._ids.get(piece, UNK) for piece in pieces]
+            ids.flags.writeable = False
+            self._cache.put(key, ids)
+        return ids
+
+    def encode_batch(self, texts, length):
+        """Returns an (N, length) int64 array."""
+        return np.stack([self.encode(text, length) for text in texts])
+
+    def decode(self, ids):
+        """The text of a sequence (or 1-D tensor) of token ids, ignoring padding."""
+        return ''.join(self.tokens[i] for i in np.asarray(ids).tolist() if i != PAD)
+
+DESCRIPTION_VOCAB = DescriptionVocab()
@@ -0,0 +1,106 @@
+# utils/holdout.py
+import hashlib
+import json
+import math
+import struct
+import numpy as np
+
+# Holdout files: MAGIC, a little-endian uint32 header length, a JSON header, then the filter's bits
+MAGIC = b'PZHOLDOUT'
+FORMAT_VERSION = 2 # Version 1 filters probed other bits, so they cannot be read
+
+def params_key(puzzle_type, params):
+    """The canonical key of a parameter set from a generator's sample_params(): its type and compact JSON."""
+    return f"{puzzle_type}\0{json.dumps(params, separators=(',', ':'))}".encode()
+
+def content_key(puzzle_type, input_arr, target_arr, description):
+    """The key of a sample from a generator without sample_params(): a digest of its images and description."""
+    digest = hashlib.blake2b(digest_size=32)
+    for part in (puzzle_type.encode(), b'\0', description.encode(), b'\0', input_arr.tobytes(), target_arr.tobytes()):
+        digest.update(part)
+    return b'content\0' + digest.digest()
+
+class HoldoutFilter:
+    """
+    A Bloom filter of held-out sample keys, for checking generated samples against an eval set.
+
+    A key that was added is always found; a key that was not is found with
+    probability about fp_rate, so a training sample is occasionally resampled
+    for nothing but an eval sample is never let through. `types` records, per
+    puzzle type, whether its keys are 'params' or 'content' keys, and
+    img_size is the size content keys were taken at. Loaded filters are
+    memory-mapped, and a lookup touches num_hashes bits.
+    """
+    def __init__(self, num_bits, num_hashes, img_size=None, types=None, count=0, bits=None):
+        self.num_bits = num_bits
+        self.num_hashes = num_hashes
+        self.img_size = img_size
+        self.types = dict(types or {})
+        self.count = count
+        self.bits = np.zeros((num_bits + 7) // 8, dtype=np.uint8) if bits is None else bits
+
+    @classmethod
+    def for_capacity(cls, count, fp_rate=1e-6, img_size=None):
+        """An empty filter sized for `count` keys at a false-positive rate of fp_rate."""
+        num_bits = max(64, math.ceil(-count * math.log(fp_rate) / math.log(2) ** 2))
+        num_hashes = max(1, round(num_bits / max(count, 1) * math.log(2)))
+        return cls(num_bits, num_hashes, img_size)
+
+    def _positions(self, key):
+        # Enhanced double hashing (the step grows by i each time), so no key probes one bit num_hashes
+        # times, as plain h1 + i * h2 does whenever h2 is a multiple of num_bits
+        digest = hashlib.blake2b(key, digest_size=16).digest()
+        position = int.from_bytes(digest[:8], 'little') % self.num_bits
+        step = int.from_bytes(digest[8:], 'little') % self.num_bits
+        positions = []
+        for i in range(self.num_hashes):
+            positions.append(position)
+            position = (position + step) % self.num_bits
+            step = (step + i + 1) % self.num_bits
+        return positions
+
+    def add(self, key, puzzle_type=None, kind=None):
+        """Adds a key; with puzzle_type, also records its kind ('params' or 'content')."""
+        if puzzle_type is not None:
+            if self.types.setdefault(puzzle_type, kind) != kind:
+                raise ValueError(f"{puzzle_type} already has {self.types[puzzle_type]} keys, not {kind} keys")
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        bits = memoryview(self.bits) # Indexing a memoryview is much cheaper than indexing a memmap
+        for position in self._positions(key):
+            if not bits[position >> 3] >> (position & 7) & 1:
+                return False
+        return True
+
+    def contains_params(self, puzzle_type, params):
+        return params_key(puzzle_type, params) in self
+
+    @property
+    def false_positive_rate(self):
+        """The expected false-positive rate at the current count."""
+        return (1 - math.exp(-self.num_hashes * self.count / self.num_bits)) ** self.num_hashes
+
+    def save(self, path):
+        header = {
+            'version': FORMAT_VERSION, 'num_bits': self.num_bits, 'num_hashes': self.num_hashes,
+            'img_size': self.img_size, 'types': self.types, 'count': self.count,
+        }
+        header_bytes = json.dumps(header).encode()
+        with open(path, 'wb') as f:
+            f.write(MAGIC + struct.pack('<I', len(header_bytes)) + header_bytes)
+            np.asarray(self.bits).tofile(f)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not a holdout filter")
+            (header_size,) = struct.unpack('<I', f.read(4))
+            header = json.loads(f.read(header_size))
+        if header['version'] != FORMAT_VERSION:
+            raise ValueError(f"Unsupported holdout format version {header['version']}")
+        bits = np.memmap(path, dtype=np.uint8, mode='r', offset=len(MAGIC) + 4 + header_size)
+        return cls(header['num_bits'], header['num_hashes'], header['img_size'], header['types'], header['count'], bits)
@@ -0,0 +1,128 @@
+# utils/palette.py
+import re
+import numpy as np
+from PIL import ImageColor
+from utils.color_palette import MASTER_PALETTE, COLOR_NAME_MAP
+
+# Slot 0 is the usual background, slot 1 the line color; MASTER_PALETTE follows
+BASE_COLORS = ['#FFFFFF', '#000000'] + MASTER_PALETTE
+BASE_RGB = np.array([ImageColor.getrgb(color) for color in BASE_COLORS], dtype=np.uint8)
+RECOLORABLE = np.arange(2, len(BASE_COLORS)) # The MASTER_PALETTE slots
+PALETTE_SIZE = 256
+
+def _pack(rgb):
+    """Packs (..., 3) uint8 colors into uint32s (R in the low byte)."""
+    return rgb[..., 0].astype(np.uint32) | rgb[..., 1].astype(np.uint32) << 8 | rgb[..., 2].astype(np.uint32) << 16
+
+def _unpack(packed):
+    return (packed[:, None] >> np.array([0, 8, 16], dtype=np.uint32) & 255).astype(np.uint8)
+
+_BASE_PACKED = _pack(BASE_RGB)
+_HASH_BITS = 16
+
+# Longest names first, so "blue violet" is matched before "blue"
+_NAME_PATTERN = re.compile(r"\b(" + "|".join(sorted(map(re.escape, COLOR_NAME_MAP.values()), key=len, reverse=True)) + r")\b")
+
+def _unique_colors(packed):
+    """
+    Returns (colors, indices) for packed colors like np.unique(return_inverse=True), without sorting:
+    colors are bucketed by a multiplicative hash, and only the pixels of colors that lose their
+    bucket to another color go through np.unique.
+    """
+    keys = ((packed * np.uint32(2654435761)) >> np.uint32(32 - _HASH_BITS)).astype(np.intp)
+    table = np.zeros(1 << _HASH_BITS, dtype=np.uint32)
+    table[keys] = packed
+    used = np.zeros(1 << _HASH_BITS, dtype=bool)
+    used[keys] = True
+    slots = (np.cumsum(used) - 1).astype(np.int32) # Wide enough for every distinct color of an image
+    colors = table[used]
+    indices = slots[keys]
+    collided = table[keys] != packed
+    if collided.any():
+        extra, inverse = np.unique(packed[collided], return_inverse=True)
+        indices[collided] = len(colors) + inverse
+        colors = np.concatenate([colors, extra])
+    return colors, indices
+
+def encode_indexed(images):
+    """
+    Encodes (..., H, W, 3) uint8 images that share one palette as uint8 palette indices.
+
+    Returns (indices, palette, slot_ids): indices has the images' shape
+    without the channel axis, palette is a (PALETTE_SIZE, 3) uint8 array of
+    the colors used, and slot_ids gives each palette slot's position in
+    BASE_COLORS (-1 for other colors, such as anti-aliased edges, and -2 for
+    unused slots). Lossless up to PALETTE_SIZE colors; beyond that the
+    colors outside BASE_COLORS are rounded to fewer bits until they fit.
+    """
+    colors, indices = _unique_colors(_pack(images))
+    bits = 0
+    while len(colors) > PALETTE_SIZE:
+        bits += 1
+        channel_mask = np.uint32((0xFF >> bits << bits) * 0x010101)
+        rounded = np.where(np.isin(colors, _BASE_PACKED), colors, colors & channel_mask)
+        colors, remap = np.unique(rounded, return_inverse=True)
+        indices = remap[indices]
+
+    palette = np.zeros((PALETTE_SIZE, 3), dtype=np.uint8)
+    palette[:len(colors)] = _unpack(colors)
+    slot_ids = np.full(PALETTE_SIZE, -2, dtype=np.int16)
+    matches = colors[:, None] == _BASE_PACKED[None, :]
+    slot_ids[:len(colors)] = np.where(matches.any(axis=1), matches.argmax(axis=1), -1)
+    return indices.astype(np.uint8), palette, slot_ids
+
+def decode_indexed(indices, palette):
+    """The RGB images of palette indices, as uint8 (..., H, W, 3)."""
+    return palette[indices]
+
+def indexed_to_tensor(indices, palettes):
+    """
+    Looks up a batch of (N, H, W) palette indices in their (N, PALETTE_SIZE, 3) palettes, on
+    whatever device the tensors are on, and returns (N, 3, H, W) floats in [-1, 1] like the dataset.
+    """
+    import torch
+    lut = palettes.float().div_(127.5).sub_(1) # (N, P, 3)
+    flat = indices.long().flatten(1) # (N, H*W)
+    rgb = torch.gather(lut, 1, flat.unsqueeze(-1).expand(-1, -1, 3)) # (N, H*W, 3)
+    return rgb.transpose(1, 2).reshape(indices.shape[0], 3, *indices.shape[1:])
+
+def is_recolorable(palette, slot_ids, tolerance=2.0):
+    """
+    Whether permuting the MASTER_PALETTE slots recolors the images exactly.
+
+    False when a color outside BASE_COLORS is a blend of a MASTER_PALETTE
+    color with another color in the images (an anti-aliased colored edge or
+    a translucent fill), since such pixels would keep the old hue.
+    """
+    used = slot_ids > -2
+    others = palette[slot_ids == -1].astype(np.float32) # (E, 3)
+    recolorable = palette[slot_ids >= 2].astype(np.float32) # (C, 3)
+    if len(others) == 0 or len(recolorable) == 0:
+        return True
+    ends = palette[used].astype(np.float32) # (U, 3)
+    for color in recolorable:
+        # Project every other color onto the segment from each color in the images to this one
+        direction = color - ends # (U, 3)
+        length2 = (direction ** 2).sum(axis=1)
+        valid = length2 > 0
+        direction, start = direction[valid], ends[valid]
+        alpha = ((others[:, None] - start[None]) * direction[None]).sum(axis=2) / length2[valid][None] # (E, U)
+        residual = others[:, None] - (start[None] + alpha[..., None] * direction[None])
+        blended = (alpha > 0) & (alpha < 1) & (np.abs(residual).max(axis=2) <= tolerance)
+        if blended.any():
+            return False
+    return True
+
+def recolor(palette, slot_ids, description, rng):
+    """
+    Swaps the MASTER_PALETTE colors for a random permutation of them, in O(palette).
+    Returns the new palette and the description with every color name changed to match.
+    `rng` is a `random`-like generator (e.g. utils.rng.random).
+    """
+    order = rng.sample(list(RECOLORABLE), len(RECOLORABLE))
+    new_slot = dict(zip(RECOLORABLE.tolist(), order))
+    palette = palette.copy()
+    for slot in np.flatnonzero(slot_ids >= 2):
+        palette[slot] = BASE_RGB[new_slot[int(slot_ids[slot])]]
+    renamed = {COLOR_NAME_MAP[BASE_COLORS[old]]: COLOR_NAME_MAP[BASE_COLORS[new]] for old, new in new_slot.items()}
+    return palette, _NAME_PATTERN.sub(lambda match: renamed[match.group(1)], description)
@@ -0,0 +1,93 @@
+# utils/placement.py
+import math
+from utils.rng import random
+
+class PoissonDiskSampler:
+    """
+    Scatters points inside a rectangle so that no two are closer than min_dist.
+
+    Points are indexed in a background grid whose cells are small enough to hold
+    at most one point, so each candidate is checked only against the handful of
+    points in neighbouring cells. Sampling first throws uniform darts, which keeps
+    sparse scenes evenly spread, then grows outwards from the placed points
+    (Bridson's algorithm) to pack the remaining gaps. Both phases run in roughly
+    linear time in the number of points.
+    """
+    def __init__(self, bounds, min_dist, rng=random):
+        self.x_min, self.y_min, self.x_max, self.y_max = bounds
+        self.min_dist = min_dist
+        self.rng = rng
+
+        self.cell_size = min_dist / math.sqrt(2)
+        self.cols = max(1, math.ceil((self.x_max - self.x_min) / self.cell_size))
+        self.rows = max(1, math.ceil((self.y_max - self.y_min) / self.cell_size))
+        self.grid = [-1] * (self.cols * self.rows) # Index into self.points, -1 if empty
+        self.points = []
+
+    def _cell(self, point):
+        col = min(int((point[0] - self.x_min) / self.cell_size), self.cols - 1)
+        row = min(int((point[1] - self.y_min) / self.cell_size), self.rows - 1)
+        return col, row
+
+    def _in_bounds(self, point):
+        return self.x_min <= point[0] <= self.x_max and self.y_min <= point[1] <= self.y_max
+
+    def fits(self, point):
+        """Returns True if point is in bounds and at least min_dist from every placed point."""
+        if not self._in_bounds(point):
+            return False
+        col, row = self._cell(point)
+        min_dist_sq = self.min_dist * self.min_dist
+        for r in range(max(row - 2, 0), min(row + 3, self.rows)):
+            for c in range(max(col - 2, 0), min(col + 3, self.cols)):
+                idx = self.grid[r * self.cols + c]
+                if idx >= 0:
+                    px, py = self.points[idx]
+                    if (px - point[0]) ** 2 + (py - point[1]) ** 2 < min_dist_sq:
+                        return False
+        return True
+
+    def add(self, point):
+        """Places a point without checking it; call fits() first."""
+        col, row = self._cell(point)
+        self.grid[row * self.cols + col] = len(self.points)
+        self.points.append(point)
+
+    def sample(self, n, attempts=30):
+        """
+        Places up to n more points and returns the new ones.
+
+        Fewer than n points are returned when the rectangle cannot hold them all,
+        so callers should size their scene from the result rather than from n.
+        """
+        start = len(self.points)
+        target = start + n
+
+        # --- 1. Uniform dart throwing ---
+        for _ in range(attempts * n):
+            if len(self.points) >= target:
+                break
+            point = (self.rng.uniform(self.x_min, self.x_max), self.rng.uniform(self.y_min, self.y_max))
+            if self.fits(point):
+                self.add(point)
+
+        # --- 2. Grow from the placed points to fill the gaps ---
+        if len(self.points) < target and not self.points:
+            self.add((self.rng.uniform(self.x_min, self.x_max), self.rng.uniform(self.y_min, self.y_max)))
+        active = list(range(len(self.points)))
+        while active and len(self.points) < target:
+            i = self.rng.randrange(len(active))
+            px, py = self.points[active[i]]
+            for _ in range(attempts):
+                angle = self.rng.uniform(0, 2 * math.pi)
+                radius = self.rng.uniform(self.min_dist, 2 * self.min_dist)
+                point = (px + radius * math.cos(angle), py + radius * math.sin(angle))
+                if self.fits(point):
+                    active.append(len(self.points))
+                    self.add(point)
+                    break
+            else:
+                active[i] = active[-1]
+                active.pop()
+
+        return self.points[start:target]
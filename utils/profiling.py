@@ -0,0 +1,214 @@
+# utils/profiling.py
+import json
+import multiprocessing
+import os
+import threading
+import time
+from contextlib import nullcontext
+import numpy as np
+
+# The stages that can be timed. 'generate' and 'generate_batch' span a whole
+# call and include any stages timed inside it; 'error' counts failed calls.
+STAGES = ('sample', 'solve', 'render', 'generate', 'generate_batch', 'to_tensor', 'wait', 'error')
+
+# Pseudo puzzle type for work that is not tied to one type (batch conversion, waiting on the loader)
+LOADER = '(loader)'
+
+_NULL = nullcontext()
+_local = threading.local() # The (stats, puzzle_type) that stage() records into on this thread
+
+class StageStats:
+    """
+    Timers and counters per (puzzle type, stage), added up across processes.
+
+    The totals live in one shared-memory table with a row per process. A
+    process claims its own row the first time it records, so DataLoader (or
+    SharedMemoryLoader) workers forked after construction never contend or
+    lose updates, and summary() adds the rows up in whichever process asks.
+    Threads of one process share a row under a lock. If more than
+    max_processes - 1 processes record, the rest share the last row under a
+    process-shared lock.
+
+    Recording costs about a microsecond; nothing is recorded unless the
+    dataset was built with collect_stats=True.
+    """
+    def __init__(self, puzzle_types, max_processes=64):
+        if max_processes < 2:
+            raise ValueError("max_processes must be at least 2")
+        self.puzzle_types = list(puzzle_types) + [LOADER]
+        self.max_processes = max_processes
+        self._type_index = {puzzle_type: i for i, puzzle_type in enumerate(self.puzzle_types)}
+        self._stage_index = {stage: i for i, stage in enumerate(STAGES)}
+        self._shape = (max_processes, len(self.puzzle_types), len(STAGES), 2) # [..., 0] seconds, [..., 1] count
+        self._buffer = multiprocessing.RawArray('d', int(np.prod(self._shape)))
+        self._rows_claimed = multiprocessing.Value('i', 0)
+        self._shared_row_lock = multiprocessing.Lock()
+        self._attach()
+
+    def _attach(self):
+        self._table = np.frombuffer(self._buffer, dtype=np.float64).reshape(self._shape)
+        self._pid = None
+        self._row = None
+        self._lock = None
+
+    def __getstate__(self):
+        # The shared objects can only be pickled while starting a process (e.g. spawned DataLoader workers)
+        state = self.__dict__.copy()
+        for key in ('_table', '_pid', '_row', '_lock'):
+            del state[key]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._attach()
+
+    def _claim_row(self):
+        with self._rows_claimed.get_lock():
+            if self._pid == os.getpid(): # Another thread got here first
+                return
+            claimed = self._rows_claimed.value
+            self._rows_claimed.value += 1
+            self._row = min(claimed, self.max_processes - 1)
+            self._lock = self._shared_row_lock if self._row == self.max_processes - 1 else threading.Lock()
+            self._pid = os.getpid()
+
+    def record(self, puzzle_type, stage, seconds, count=1):
+        if self._pid != os.getpid():
+            self._claim_row()
+        cell = self._table[self._row, self._type_index[puzzle_type], self._stage_index[stage]]
+        with self._lock:
+            cell[0] += seconds
+            cell[1] += count
+
+    def timer(self, puzzle_type, stage, count=1):
+        """
+        A context manager that times its block as `stage` of `puzzle_type`.
+        Stages that generators time with stage() inside the block are recorded for the same type.
+        """
+        return _Timer(self, puzzle_type, stage, count)
+
+    def timed_iter(self, iterable):
+        """Yields from iterable, timing each wait for the next item (e.g. a training loop blocked on its DataLoader) as LOADER's 'wait'."""
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            self.record(LOADER, 'wait', time.perf_counter() - start)
+            yield item
+
+    def summary(self):
+        """The totals of all processes: {puzzle_type: {stage: {'count', 'total_s', 'mean_ms'}}}, leaving out stages never recorded."""
+        totals = self._table.sum(axis=0)
+        summary = {}
+        for t, puzzle_type in enumerate(self.puzzle_types):
+            for s, stage in enumerate(STAGES):
+                seconds, count = totals[t, s]
+                if count:
+                    summary.setdefault(puzzle_type, {})[stage] = {
+                        'count': int(count),
+                        'total_s': float(seconds),
+                        'mean_ms': float(seconds / count * 1000),
+                    }
+        return summary
+
+    def reset(self):
+        """Zeroes every process's totals. Updates made by other processes at the same moment may survive."""
+        self._table.fill(0)
+
+class _Timer:
+    __slots__ = ('stats', 'puzzle_type', 'stage', 'count', 'start', 'previous')
+
+    def __init__(self, stats, puzzle_type, stage, count):
+        self.stats = stats
+        self.puzzle_type = puzzle_type
+        self.stage = stage
+        self.count = count
+
+    def __enter__(self):
+        self.previous = getattr(_local, 'context', None)
+        _local.context = (self.stats, self.puzzle_type)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.start
+        _local.context = self.previous
+        self.stats.record(self.puzzle_type, self.stage, elapsed, self.count)
+        if exc_type is not None and self.stage in ('generate', 'generate_batch'):
+            self.stats.record(self.puzzle_type, 'error', 0.0)
+        return False
+
+def stage(name):
+    """
+    Times a stage of the puzzle being generated on this thread, e.g. `with stage('solve'):`.
+    Does nothing unless a dataset that collects stats is generating the puzzle.
+    """
+    context = getattr(_local, 'context', None)
+    if context is None:
+        return _NULL
+    stats, puzzle_type = context
+    return _Timer(stats, puzzle_type, name, 1)
+
+def format_prometheus(summary, prefix='puzzle_stage'):
+    """Formats a StageStats summary in the Prometheus text exposition format (e.g. for node_exporter's textfile collector)."""
+    lines = []
+    for metric, key in [('seconds_total', 'total_s'), ('calls_total', 'count')]:
+        lines.append(f"# TYPE {prefix}_{metric} counter")
+        for puzzle_type, stages in summary.items():
+            for stage_name, values in stages.items():
+                lines.append(f'{prefix}_{metric}{{puzzle_type="{puzzle_type}",stage="{stage_name}"}} {values[key]}')
+    return "\n".join(lines) + "\n"
+
+class StatsExporter:
+    """
+    Writes a StageStats summary to `path` every `interval` seconds from a daemon thread.
+
+    Files ending in .json get the summary as JSON, anything else the
+    Prometheus text format. Each write replaces the file atomically, so a
+    scraper never reads a partial file.
+    """
+    def __init__(self, stats, path, interval=10.0):
+        self.stats = stats
+        self.path = path
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def export(self):
+        summary = self.stats.summary()
+        if self.path.endswith('.json'):
+            text = json.dumps({'time': time.time(), 'stages': summary}, indent=2)
+        else:
+            text = format_prometheus(summary)
+        tmp_path = f"{self.path}.tmp{os.getpid()}"
+        with open(tmp_path, 'w') as f:
+            f.write(text)
+        os.replace(tmp_path, self.path)
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='puzzle-stats-exporter', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        """Stops the thread after one last export."""
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+            self.export()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.export()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,58 @@
+# utils/rng.py
+import random as _random
+import threading
+from contextlib import contextmanager
+import numpy as np
+
+class _ThreadLocalRandom:
+    """
+    Stands in for a random module, giving every thread its own generator.
+
+    The main thread uses the real module, so random.seed() and the seeding
+    done by DataLoader workers behave exactly as before. Any other thread gets
+    a private generator, seeded with seed_thread() or from OS entropy, so
+    generators can run concurrently without sharing (or racing on) one state.
+    """
+    def __init__(self, module, new_instance):
+        self._module = module
+        self._new_instance = new_instance
+        self._local = threading.local()
+
+    def _instance(self):
+        instance = getattr(self._local, 'instance', None)
+        if instance is None:
+            instance = self._module if threading.current_thread() is threading.main_thread() else self._new_instance(None)
+            self._local.instance = instance
+        return instance
+
+    def _seed_thread(self, seed):
+        self._local.instance = self._new_instance(seed)
+
+    def __getattr__(self, name):
+        return getattr(self._instance(), name)
+
+# Drop-in replacements for `random` and `np.random` in generator code
+random = _ThreadLocalRandom(_random, _random.Random)
+np_random = _ThreadLocalRandom(np.random, lambda seed: np.random.RandomState(None if seed is None else seed % 2**32))
+
+def seed_thread(seed):
+    """Gives the calling thread its own generators for `random` and `np_random`, seeded with seed."""
+    random._seed_thread(seed)
+    np_random._seed_thread(seed)
+
+@contextmanager
+def seeded(seed):
+    """
+    Seeds the calling thread's `random` and `np_random` with seed inside the block and restores
+    their previous state after it. On the main thread those are the global modules, which
+    are left as the caller had them.
+    """
+    py_rng, np_rng = random._instance(), np_random._instance()
+    py_state, np_state = py_rng.getstate(), np_rng.get_state()
+    py_rng.seed(seed)
+    np_rng.seed(seed % 2**32)
+    try:
+        yield
+    finally:
+        py_rng.setstate(py_state)
+        np_rng.set_state(np_state)
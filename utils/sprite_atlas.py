@@ -0,0 +1,125 @@
+# utils/sprite_atlas.py
+import math
+import numpy as np
+from PIL import Image, ImageColor, ImageDraw, ImageFont
+from utils.cache import LRUCache
+from utils.drawing_utils import draw_shape
+
+class SpriteAtlas:
+    """
+    A bounded cache of pre-rasterized shape sprites.
+
+    Each (shape, color, size, rotation, scale, border) combination is drawn once
+    onto a transparent RGBA tile and then stamped onto scenes with an alpha-masked
+    paste. Size and rotation are quantized so that near-identical requests share
+    a sprite, and pasted sprites snap to whole-pixel positions. The least recently
+    used sprites are evicted once the atlas is full.
+    """
+    def __init__(self, max_entries=2048, size_step=1.0, angle_step=1.0):
+        self.size_step = size_step
+        self.angle_step = angle_step
+        self._sprites = LRUCache(max_entries)
+
+    def __len__(self):
+        return len(self._sprites)
+
+    def get_sprite(self, shape_type, size, color, rotation=0, border_color=None, border_width=5, scale=(1, 1)):
+        """
+        Returns (sprite, offset) where sprite is an RGBA image and offset is the
+        position of the shape center relative to the sprite's top-left corner.
+        """
+        q_size = round(size / self.size_step) * self.size_step
+        q_rotation = (round(rotation / self.angle_step) * self.angle_step) % 360
+        if shape_type == 'circle':
+            q_rotation = 0 # Circles are drawn the same at any rotation
+        key = (shape_type, q_size, color, q_rotation, border_color, border_width if border_color else 0, tuple(scale))
+        return self._sprites.get_or_create(
+            key, lambda: self._rasterize(shape_type, q_size, color, q_rotation, border_color, border_width, scale)
+        )
+
+    def paste(self, image, shape_type, center, size, color, rotation=0, border_color=None, border_width=5, scale=(1, 1)):
+        """Stamps a shape onto image; takes the same arguments as draw_shape."""
+        sprite, (ox, oy) = self.get_sprite(shape_type, size, color, rotation, border_color, border_width, scale)
+        if sprite is None:
+            return
+        image.paste(sprite, (round(center[0]) - ox, round(center[1]) - oy), sprite)
+
+    def _rasterize(self, shape_type, size, color, rotation, border_color, border_width, scale):
+        w, h = abs(size * scale[0]), abs(size * scale[1])
+        margin = math.ceil(math.hypot(w, h) / 2) + (border_width if border_color else 0) + 2
+        tile = Image.new('RGBA', (2 * margin + 1, 2 * margin + 1), (0, 0, 0, 0))
+        draw_shape(ImageDraw.Draw(tile), shape_type, (margin, margin), size, color,
+                   rotation=rotation, border_color=border_color, border_width=border_width, scale=scale)
+
+        # Crop to the drawn pixels so each paste touches as little of the scene as possible
+        bbox = tile.getchannel('A').getbbox()
+        if bbox is None:
+            return None, (0, 0)
+        return tile.crop(bbox), (margin - bbox[0], margin - bbox[1])
+
+class TextAtlas:
+    """
+    A bounded cache of anti-aliased text masks.
+
+    Text is rasterized once per (text, font size, subpixel offset) into an 'L' mask and
+    then blended onto images or arrays in any color, matching ImageDraw.text
+    with anchor='mm' and align='center'.
+    """
+    def __init__(self, max_entries=2048):
+        self._masks = LRUCache(max_entries)
+
+    def get_mask(self, text, font_size, center):
+        """Returns (mask, origin): the mask goes at origin, or None if the text draws nothing."""
+        x, y = center
+        fx, fy = x - math.floor(x), y - math.floor(y) # Glyphs are positioned with subpixel precision
+        mask, (ox, oy) = self._masks.get_or_create((text, font_size, fx, fy), lambda: self._rasterize(text, font_size, fx, fy))
+        return mask, (math.floor(x) - ox, math.floor(y) - oy)
+
+    def paste(self, image, center, text, font_size, color):
+        """Blends text onto a PIL image, centered on center."""
+        mask, origin = self.get_mask(text, font_size, center)
+        if mask is not None:
+            image.paste(color, origin, mask)
+
+    def stamp(self, arr, center, text, font_size, color):
+        """Blends text onto an (H, W, 3) uint8 array in place, centered on center."""
+        mask, (x0, y0) = self.get_mask(text, font_size, center)
+        if mask is None:
+            return
+        alpha = np.asarray(mask, dtype=np.uint16)[..., None]
+        # Clip the mask to the array
+        mx, my = max(0, -x0), max(0, -y0)
+        x0, y0 = max(0, x0), max(0, y0)
+        alpha = alpha[my:my + arr.shape[0] - y0, mx:mx + arr.shape[1] - x0]
+        region = arr[y0:y0 + alpha.shape[0], x0:x0 + alpha.shape[1]]
+        ink = np.array(ImageColor.getrgb(color)[:3], dtype=np.uint16)
+        region[...] = (region * (255 - alpha) + ink * alpha + 127) // 255
+
+    def _rasterize(self, text, font_size, fx, fy):
+        try:
+            font = ImageFont.load_default(size=font_size)
+        except AttributeError:
+            font = ImageFont.load_default()
+        scratch = ImageDraw.Draw(Image.new('L', (1, 1)))
+        left, top, right, bottom = scratch.textbbox((fx, fy), text, font=font, anchor='mm', align='center')
+        # Draw the anchor at (pad + fx, pad + fy) on a canvas with room for the whole bbox, then trim
+        pad_x, pad_y = math.ceil(-left) + 1, math.ceil(-top) + 1
+        canvas = Image.new('L', (pad_x + math.ceil(right) + 2, pad_y + math.ceil(bottom) + 2), 0)
+        ImageDraw.Draw(canvas).text((pad_x + fx, pad_y + fy), text, fill=255, font=font, anchor='mm', align='center')
+        bbox = canvas.getbbox()
+        if bbox is None:
+            return None, (0, 0)
+        return canvas.crop(bbox), (pad_x - bbox[0], pad_y - bbox[1])
+
+# Per-process atlases shared by all generators
+SHAPE_ATLAS = SpriteAtlas()
+TEXT_ATLAS = TextAtlas()
+
+def paste_shape(image, shape_type, center, size, color, rotation=0, border_color=None, border_width=5, scale=(1, 1)):
+    """Drop-in replacement for draw_shape that stamps a cached sprite onto image."""
+    SHAPE_ATLAS.paste(image, shape_type, center, size, color, rotation=rotation,
+                      border_color=border_color, border_width=border_width, scale=scale)
+
+def paste_text(image, center, text, font_size, color):
+    """Cached equivalent of draw.text(center, text, fill=color, anchor='mm', align='center') at font_size."""
+    TEXT_ATLAS.paste(image, center, text, font_size, color)